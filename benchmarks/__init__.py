@@ -0,0 +1,11 @@
+"""
+Benchmarks of the client against a local stand-in for a CanDIG server.
+
+Run them from the top of the source tree with::
+
+    python -m benchmarks --records 100000 --latency 0.01
+
+which measures the throughput, time to first record and peak memory of
+each search path of the client and each CLI runner. See
+``python -m benchmarks --help`` for the options.
+"""
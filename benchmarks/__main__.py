@@ -0,0 +1,12 @@
+"""
+Runs the benchmarks from the source tree; see :mod:`benchmarks`.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import dev_glue  # NOQA
+import benchmarks.suite as suite
+
+if __name__ == "__main__":
+    suite.main()
@@ -0,0 +1,208 @@
+"""
+A local HTTP server standing in for a CanDIG server, serving the results
+of a synthetic backend.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+import gzip
+import io
+import socket
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+import candig.schemas.protocol as protocol
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers search and reference bases requests from the backend of the
+    server.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Send the body as soon as it is written, rather than waiting for
+        # the client to acknowledge the headers
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.fake_server._add_connection(self.connection)
+
+    def finish(self):
+        try:
+            BaseHTTPRequestHandler.finish(self)
+        finally:
+            self.server.fake_server._remove_connection(self.connection)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _get_message(self, path, request_json):
+        backend = self.server.fake_server.backend
+        if path == "listreferencebases":
+            return backend.list_reference_bases(request_json)
+        object_name, _, method = path.rpartition("/")
+        if method == "search" and object_name in backend.get_object_names():
+            return backend.search(object_name, request_json)
+        return None
+
+    def _get_body(self, path, request_json, encoded):
+        """
+        Returns the body of the response to the specified request, or None
+        if there is no such endpoint. Bodies are rendered once and then
+        reused, so that the benchmarks measure the client rather than the
+        server.
+        """
+        fake_server = self.server.fake_server
+        key = (path, request_json, encoded)
+        body = fake_server._get_cached_body(key)
+        if body is None:
+            message = self._get_message(path, request_json)
+            if message is None:
+                return None
+            body = protocol.toJson(message).encode("utf-8")
+            if encoded:
+                buffer_ = io.BytesIO()
+                with gzip.GzipFile(fileobj=buffer_, mode="wb") as gzip_file:
+                    gzip_file.write(body)
+                body = buffer_.getvalue()
+            fake_server._cache_body(key, body)
+        return body
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request_json = self.rfile.read(length).decode("utf-8")
+        fake_server = self.server.fake_server
+        encoded = (
+            fake_server.compress and
+            "gzip" in self.headers.get("Accept-Encoding", ""))
+        try:
+            body = self._get_body(
+                self.path.split("?")[0].strip("/"), request_json, encoded)
+        except Exception:
+            self.send_error(500)
+            raise
+        if body is None:
+            self.send_error(404)
+            return
+        if fake_server.latency > 0:
+            time.sleep(fake_server.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if encoded:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeServer(object):
+    """
+    An HTTP server on the loopback interface that answers the search and
+    reference bases requests of a client from the specified backend, in
+    a thread of its own. Each response is delayed by latency seconds, and
+    is compressed with gzip if compress is set and the client accepts it.
+    The bodies of the max_cached_bodies most recent responses are kept
+    for reuse by later identical requests. The server is started on a
+    free port when the context is entered.
+
+    :param backend: The backend of the server.
+    :type backend: :class:`benchmarks.synthetic.SyntheticBackend`
+    :param float latency: The delay in seconds before each response.
+    :param bool compress: Whether responses are compressed.
+    :param int max_cached_bodies: The number of response bodies kept.
+    """
+    def __init__(
+            self, backend, latency=0, compress=False,
+            max_cached_bodies=256):
+        self.backend = backend
+        self.latency = latency
+        self.compress = compress
+        self.max_cached_bodies = max_cached_bodies
+        self.response_bodies = collections.OrderedDict()
+        self._response_bodies_lock = threading.Lock()
+        self._http_server = None
+        self._thread = None
+        self._connections_lock = threading.Lock()
+        self._connections = set()
+
+    def _get_cached_body(self, key):
+        with self._response_bodies_lock:
+            body = self.response_bodies.pop(key, None)
+            if body is not None:
+                self.response_bodies[key] = body
+            return body
+
+    def _cache_body(self, key, body):
+        """
+        Keeps the specified response body, dropping the least recently
+        used bodies beyond max_cached_bodies.
+        """
+        with self._response_bodies_lock:
+            self.response_bodies.pop(key, None)
+            self.response_bodies[key] = body
+            while len(self.response_bodies) > self.max_cached_bodies:
+                self.response_bodies.popitem(last=False)
+
+    def _add_connection(self, connection):
+        with self._connections_lock:
+            self._connections.add(connection)
+
+    def _remove_connection(self, connection):
+        with self._connections_lock:
+            self._connections.discard(connection)
+
+    def start(self):
+        """
+        Starts serving requests.
+        """
+        self._http_server = _ThreadingHTTPServer(
+            ("127.0.0.1", 0), _RequestHandler)
+        self._http_server.fake_server = self
+        self._thread = threading.Thread(
+            target=self._http_server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops serving requests, and closes the connections kept alive by
+        clients so that their threads finish.
+        """
+        self._http_server.shutdown()
+        with self._connections_lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self._http_server.server_close()
+        self._thread.join()
+
+    def get_url(self):
+        """
+        Returns the base URL of the server.
+        """
+        host, port = self._http_server.server_address[:2]
+        return "http://{}:{}/".format(host, port)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,376 @@
+"""
+Benchmarks of the search paths of the client and of the CLI runners,
+run against a :class:`benchmarks.server.FakeServer`.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import collections
+import json
+import multiprocessing
+import sys
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import candig.client.cli as cli
+import candig.client.client as client
+
+import benchmarks.server as server
+import benchmarks.synthetic as synthetic
+
+
+def _get_region_end(options):
+    """
+    Returns the end of a region that holds all of the records served, so
+    that searches over it are split into the requested number of shards.
+    """
+    return options.records * synthetic.SyntheticBackend.spacing
+
+
+def _search_variants(http_client, options):
+    return http_client.search_variants(
+        ["variantSet"], start=0, end=_get_region_end(options),
+        call_set_ids=None)
+
+
+def _search_genotypes(http_client, options):
+    for _, variants, _ in http_client.iter_genotype_blocks("variantSet"):
+        for variant in variants:
+            yield variant
+
+
+def _search_reads(http_client, options):
+    return http_client.search_reads(
+        ["readGroup"], reference_id="1", start=0,
+        end=_get_region_end(options))
+
+
+def _search_features(http_client, options):
+    return http_client.search_features(
+        feature_set_id="featureSet", start=0, end=_get_region_end(options))
+
+
+def _iter_reference_bases(http_client, options):
+    return http_client.iter_reference_bases("1")
+
+
+# The client benchmarks, each of which gives a function returning an
+# iterator over the results of a search and a function returning the
+# number of records in each result, or None if each result is a record
+CLIENT_BENCHMARKS = collections.OrderedDict([
+    ("client-variants", (_search_variants, None)),
+    ("client-genotypes", (_search_genotypes, None)),
+    ("client-reads", (_search_reads, None)),
+    ("client-features", (_search_features, None)),
+    # Each base is counted as a record
+    ("client-reference-bases", (_iter_reference_bases, len)),
+])
+
+# The CLI benchmarks, each of which gives the arguments of a command and
+# whether it takes the search options, including a region
+CLI_BENCHMARKS = collections.OrderedDict([
+    ("cli-variants-search", (
+        ["variants-search", "--variantSetId", "variantSet",
+         "--callSetIds", "*"], True)),
+    ("cli-genotypes-search", (
+        ["genotypes-search", "--variantSetId", "variantSet",
+         "--callSetIds", "*"], False)),
+    ("cli-reads-search", (
+        ["reads-search", "--readGroupIds", "readGroup",
+         "--referenceId", "1"], True)),
+    ("cli-features-search", (
+        ["features-search", "--featureSetId", "featureSet"], True)),
+    ("cli-references-list-bases", (
+        ["references-list-bases", "--outputFormat", "fasta"], False)),
+])
+
+
+def get_benchmark_names():
+    return list(CLIENT_BENCHMARKS.keys()) + list(CLI_BENCHMARKS.keys())
+
+
+def _get_max_rss_kb():
+    """
+    Returns the peak resident set size of the process in kilobytes, or
+    None if it cannot be measured on this platform.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        max_rss //= 1024
+    return max_rss
+
+
+class _OutputCounter(object):
+    """
+    A stand-in for sys.stdout that counts the output of a CLI runner and
+    notes when it was first written.
+    """
+    def __init__(self):
+        self.first_write_time = None
+        self.lines = 0
+        self.characters = 0
+
+    def write(self, text):
+        if self.first_write_time is None:
+            self.first_write_time = time.time()
+        self.lines += text.count("\n")
+        self.characters += len(text)
+
+    def flush(self):
+        pass
+
+
+def _run_client_benchmark(name, url, options):
+    http_client = client.HttpClient(url)
+    http_client.set_page_size(options.page_size)
+    http_client.set_prefetch_pages(options.prefetch_pages)
+    http_client.set_region_shards(options.region_shards)
+    start_time = time.time()
+    first_record_time = None
+    records = 0
+    search, count_records = CLIENT_BENCHMARKS[name]
+    for result in search(http_client, options):
+        if first_record_time is None:
+            first_record_time = time.time()
+        records += 1 if count_records is None else count_records(result)
+    end_time = time.time()
+    return (
+        start_time, first_record_time, end_time, records,
+        http_client.get_compressed_bytes_received())
+
+
+def _run_cli_benchmark(name, url, options):
+    arguments, takes_search_options = CLI_BENCHMARKS[name]
+    arguments = ["--max-retries", "0", arguments[0], url] + arguments[1:]
+    if name == "cli-references-list-bases":
+        arguments.append("1")
+    if takes_search_options:
+        arguments.extend([
+            "--prefetchPages", str(options.prefetch_pages),
+            "--regionShards", str(options.region_shards),
+            "--start", "0", "--end", str(_get_region_end(options))])
+        if options.page_size is not None:
+            arguments.extend(["--pageSize", str(options.page_size)])
+    output = _OutputCounter()
+    stdout = sys.stdout
+    sys.stdout = output
+    start_time = time.time()
+    try:
+        cli.client_main(arguments)
+    finally:
+        sys.stdout = stdout
+    end_time = time.time()
+    return (
+        start_time, output.first_write_time, end_time, output.lines,
+        output.characters)
+
+
+def run_benchmark(name, url, options):
+    """
+    Runs the specified benchmark against the server at the specified URL
+    and returns its results as a dictionary.
+    """
+    max_rss_before = _get_max_rss_kb()
+    if name in CLIENT_BENCHMARKS:
+        start_time, first_time, end_time, records, num_bytes = \
+            _run_client_benchmark(name, url, options)
+        bytes_key = "bytes_received"
+    else:
+        start_time, first_time, end_time, records, num_bytes = \
+            _run_cli_benchmark(name, url, options)
+        bytes_key = "bytes_written"
+    max_rss_after = _get_max_rss_kb()
+    seconds = end_time - start_time
+    results = collections.OrderedDict([
+        ("name", name),
+        ("records", records),
+        ("seconds", seconds),
+        ("time_to_first_record", (
+            None if first_time is None else first_time - start_time)),
+        ("records_per_second", records / seconds if seconds > 0 else None),
+        (bytes_key, num_bytes),
+        ("megabytes_per_second", (
+            num_bytes / seconds / 1e6 if seconds > 0 else None)),
+        ("peak_memory_growth_kb", (
+            None if max_rss_before is None
+            else max_rss_after - max_rss_before)),
+    ])
+    return results
+
+
+def _run_benchmark_in_child(results_queue, name, url, options):
+    try:
+        results_queue.put(run_benchmark(name, url, options))
+    except Exception as exception:
+        results_queue.put(exception)
+
+
+# The number of seconds between checks that an isolated benchmark's child
+# process is still running
+_CHILD_POLL_SECONDS = 1
+
+
+def _run_isolated(name, url, options):
+    """
+    Runs the specified benchmark in a child process of its own, so that
+    its peak memory use is measured separately from that of the others.
+    Raises a RuntimeError if the child dies without reporting its results.
+    """
+    if hasattr(multiprocessing, "get_context"):
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing
+    results_queue = context.Queue()
+    process = context.Process(
+        target=_run_benchmark_in_child,
+        args=(results_queue, name, url, options))
+    process.start()
+    results = None
+    while results is None:
+        try:
+            results = results_queue.get(timeout=_CHILD_POLL_SECONDS)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+            # The results may have arrived just before the child exited
+            try:
+                results = results_queue.get(timeout=_CHILD_POLL_SECONDS)
+            except queue.Empty:
+                process.join()
+                raise RuntimeError(
+                    "Benchmark {} died with exit code {}".format(
+                        name, process.exitcode))
+    process.join()
+    if isinstance(results, Exception):
+        raise results
+    return results
+
+
+def run_benchmarks(names, options):
+    """
+    Starts a fake server with a synthetic backend configured by the
+    specified options and returns the results of each of the specified
+    benchmarks run against it.
+    """
+    backend = synthetic.SyntheticBackend(
+        num_records=options.records, page_size=options.server_page_size,
+        num_call_sets=options.call_sets)
+    results = []
+    with server.FakeServer(
+            backend, latency=options.latency,
+            compress=options.compress) as fake_server:
+        for name in names:
+            # The first runs render the responses of the server
+            for run in range(options.warmup + options.repeat):
+                if options.isolate:
+                    result = _run_isolated(
+                        name, fake_server.get_url(), options)
+                else:
+                    result = run_benchmark(
+                        name, fake_server.get_url(), options)
+                if run >= options.warmup:
+                    results.append(result)
+    return results
+
+
+def _format_value(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return "{:.3f}".format(value)
+    return "{}".format(value)
+
+
+def format_table(results):
+    """
+    Returns the specified benchmark results as a text table.
+    """
+    columns = [
+        ("name", "benchmark"), ("records", "records"),
+        ("seconds", "seconds"), ("time_to_first_record", "first (s)"),
+        ("records_per_second", "records/s"),
+        ("megabytes_per_second", "MB/s"),
+        ("peak_memory_growth_kb", "peak mem (kB)")]
+    rows = [[heading for _, heading in columns]]
+    for result in results:
+        rows.append([_format_value(result[key]) for key, _ in columns])
+    widths = [max(len(row[index]) for row in rows)
+              for index in range(len(columns))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths))
+        for row in rows)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Benchmark the client and CLI against a local fake server "
+            "serving synthetic data."))
+    parser.add_argument(
+        "benchmarks", nargs="*", metavar="BENCHMARK",
+        help="The benchmarks to run, from {}; all are run by default".format(
+            ", ".join(get_benchmark_names())))
+    parser.add_argument(
+        "--records", type=int, default=20000,
+        help="The number of records of each kind served")
+    parser.add_argument(
+        "--page-size", type=int, default=None,
+        help="The page size requested by the client")
+    parser.add_argument(
+        "--server-page-size", type=int, default=100,
+        help="The page size served when the client requests none")
+    parser.add_argument(
+        "--latency", type=float, default=0,
+        help="The delay in seconds before each response")
+    parser.add_argument(
+        "--call-sets", type=int, default=4,
+        help="The number of call sets of the variants served")
+    parser.add_argument(
+        "--prefetch-pages", type=int, default=0,
+        help="The number of pages the client requests ahead")
+    parser.add_argument(
+        "--region-shards", type=int, default=0,
+        help="The number of shards searches are split into")
+    parser.add_argument(
+        "--compress", default=False, action="store_true",
+        help="Compress responses with gzip")
+    parser.add_argument(
+        "--repeat", type=int, default=1,
+        help="The number of times each benchmark is run")
+    parser.add_argument(
+        "--warmup", type=int, default=1,
+        help="The number of unrecorded runs before each benchmark")
+    parser.add_argument(
+        "--no-isolate", dest="isolate", default=True, action="store_false",
+        help="Run the benchmarks in this process rather than a child each")
+    parser.add_argument(
+        "--json", default=False, action="store_true",
+        help="Write the results as JSON rather than a table")
+    return parser
+
+
+def main(args=None):
+    parser = get_parser()
+    options = parser.parse_args(args)
+    names = options.benchmarks or get_benchmark_names()
+    for name in names:
+        if name not in get_benchmark_names():
+            parser.error("Unknown benchmark {}".format(name))
+    results = run_benchmarks(names, options)
+    if options.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
@@ -0,0 +1,184 @@
+"""
+A synthetic backend that generates search results on demand.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import candig.schemas.protocol as protocol
+
+BASES = "ACGT"
+
+
+def make_sequence(start, length):
+    """
+    Returns the bases between start and start + length of a reference
+    that repeats ACGT.
+    """
+    offset = start % len(BASES)
+    repeats = (offset + length) // len(BASES) + 1
+    return (BASES * repeats)[offset:offset + length]
+
+
+class SyntheticBackend(object):
+    """
+    Generates pages of variants, genotypes, reads and features, and the
+    bases of references, for the requests of a client. Record i of each
+    kind lies at position i * spacing, so that searches over a region,
+    including searches split into shards, return the records that lie in
+    it. Each kind has num_records records, and references are
+    num_records * spacing bases long.
+
+    :param int num_records: The number of records of each kind.
+    :param int page_size: The page size used when a request gives none.
+    :param int max_page_size: The largest page size returned, however
+        large the page size requested.
+    :param int num_call_sets: The number of calls of each variant.
+    :param int read_length: The length of the sequence of each read.
+    :param int bases_page_size: The number of bases in each page of a
+        listing of reference bases.
+    """
+    spacing = 10
+
+    def __init__(
+            self, num_records=10000, page_size=100, max_page_size=10000,
+            num_call_sets=4, read_length=100, bases_page_size=100000):
+        self.num_records = num_records
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.call_set_ids = [
+            "callSet{}".format(index) for index in range(num_call_sets)]
+        self.read_length = read_length
+        self.bases_page_size = bases_page_size
+        self._search_methods = {
+            "variants": (
+                protocol.SearchVariantsRequest, self._search_variants),
+            "genotypes": (
+                protocol.SearchGenotypesRequest, self._search_genotypes),
+            "reads": (protocol.SearchReadsRequest, self._search_reads),
+            "features": (
+                protocol.SearchFeaturesRequest, self._search_features),
+        }
+
+    def get_object_names(self):
+        """
+        Returns the names of the objects that can be searched for.
+        """
+        return sorted(self._search_methods.keys())
+
+    def get_reference_length(self):
+        return self.num_records * self.spacing
+
+    def _get_page_range(self, request):
+        """
+        Returns the indexes of the first and last (exclusive) records of
+        the page of results for the specified search request.
+        """
+        first = -(-request.start // self.spacing)
+        last = self.num_records
+        if request.end > 0:
+            last = min(last, -(-request.end // self.spacing))
+        if request.page_token:
+            first = int(request.page_token)
+        page_size = min(
+            request.page_size or self.page_size, self.max_page_size)
+        return first, min(last, first + page_size), last
+
+    def _set_next_page_token(self, response, page_end, last):
+        if page_end < last:
+            response.next_page_token = str(page_end)
+
+    def _make_variant(self, variant, index, with_calls=True):
+        variant.id = "variant{}".format(index)
+        variant.variant_set_id = "variantSet"
+        variant.reference_name = "1"
+        variant.start = index * self.spacing
+        variant.end = variant.start + 1
+        variant.reference_bases = BASES[index % 4]
+        variant.alternate_bases.append(BASES[(index + 1) % 4])
+        if with_calls:
+            for column, call_set_id in enumerate(self.call_set_ids):
+                call = variant.calls.add()
+                call.call_set_id = call_set_id
+                call.genotype.extend([(index + column) % 2, column % 2])
+
+    def _search_variants(self, request):
+        response = protocol.SearchVariantsResponse()
+        first, page_end, last = self._get_page_range(request)
+        for index in range(first, page_end):
+            self._make_variant(response.variants.add(), index)
+        self._set_next_page_token(response, page_end, last)
+        return response
+
+    def _search_genotypes(self, request):
+        response = protocol.SearchGenotypesResponse()
+        first, page_end, last = self._get_page_range(request)
+        response.call_set_ids.extend(self.call_set_ids)
+        response.genotypes.nvariants = page_end - first
+        response.genotypes.nindividuals = len(self.call_set_ids)
+        for index in range(first, page_end):
+            self._make_variant(
+                response.variants.add(), index, with_calls=False)
+            response.genotypes.genotypes.extend(
+                (index + column) % 3
+                for column in range(len(self.call_set_ids)))
+        self._set_next_page_token(response, page_end, last)
+        return response
+
+    def _search_reads(self, request):
+        response = protocol.SearchReadsResponse()
+        first, page_end, last = self._get_page_range(request)
+        for index in range(first, page_end):
+            read = response.alignments.add()
+            read.id = "read{}".format(index)
+            read.read_group_id = "readGroup"
+            read.fragment_name = "fragment{}".format(index)
+            read.aligned_sequence = make_sequence(index, self.read_length)
+            read.aligned_quality.extend([30] * self.read_length)
+            read.alignment.position.reference_name = "1"
+            read.alignment.position.position = index * self.spacing
+            read.alignment.mapping_quality = 60
+        self._set_next_page_token(response, page_end, last)
+        return response
+
+    def _search_features(self, request):
+        response = protocol.SearchFeaturesResponse()
+        first, page_end, last = self._get_page_range(request)
+        for index in range(first, page_end):
+            feature = response.features.add()
+            feature.id = "feature{}".format(index)
+            feature.feature_set_id = "featureSet"
+            feature.reference_name = "1"
+            feature.start = index * self.spacing
+            feature.end = feature.start + self.spacing
+            feature.feature_type.term_id = "SO:0000704"
+            feature.feature_type.term = "gene"
+        self._set_next_page_token(response, page_end, last)
+        return response
+
+    def search(self, object_name, request_json):
+        """
+        Returns the page of results for the specified JSON search request
+        for objects of the specified name.
+        """
+        request_class, method = self._search_methods[object_name]
+        return method(protocol.fromJson(request_json, request_class))
+
+    def list_reference_bases(self, request_json):
+        """
+        Returns the page of bases for the specified JSON
+        ListReferenceBasesRequest.
+        """
+        request = protocol.fromJson(
+            request_json, protocol.ListReferenceBasesRequest)
+        end = request.end or self.get_reference_length()
+        start = request.start
+        if request.page_token:
+            start = int(request.page_token)
+        page_end = min(end, start + self.bases_page_size)
+        response = protocol.ListReferenceBasesResponse()
+        response.offset = start
+        response.sequence = make_sequence(start, page_end - start)
+        if page_end < end:
+            response.next_page_token = str(page_end)
+        return response
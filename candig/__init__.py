@@ -5,4 +5,15 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-__import__('pkg_resources').declare_namespace(__name__)
+import sys
+
+# candig is a namespace package shared with candig-schemas. Importing
+# pkg_resources takes longer than the rest of the CLI's startup, so it is
+# only used to declare the namespace if something has already imported it;
+# otherwise pkgutil extends the path, and pkg_resources declares the
+# namespace from the installed distributions' metadata if it is imported
+# later.
+if "pkg_resources" in sys.modules:
+    sys.modules["pkg_resources"].declare_namespace(__name__)
+else:
+    __path__ = __import__("pkgutil").extend_path(__path__, __name__)
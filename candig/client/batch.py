@@ -0,0 +1,60 @@
+"""
+Helpers for resolving many objects with a bounded number of concurrent
+requests.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import collections
+
+from concurrent import futures
+
+
+class GetResult(
+        collections.namedtuple("GetResult", ["id", "value", "error"])):
+    """
+    The outcome of getting a single object of a batch: either the object,
+    as value, or the exception raised while getting it, as error.
+    """
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        """
+        Whether the object was got successfully.
+        """
+        return self.error is None
+
+
+def _get_result(function, id_):
+    try:
+        return GetResult(id_, function(id_), None)
+    except Exception as error:
+        return GetResult(id_, None, error)
+
+
+def run_ordered(function, ids, max_concurrency):
+    """
+    Yields a :class:`GetResult` for each of the specified IDs in order,
+    calling function on each ID in up to max_concurrency threads at once.
+    IDs are only taken from the iterable as threads become free, so that
+    the results held in memory are bounded for long lists of IDs.
+    """
+    if max_concurrency <= 1:
+        for id_ in ids:
+            yield _get_result(function, id_)
+        return
+    executor = futures.ThreadPoolExecutor(max_concurrency)
+    pending = collections.deque()
+    try:
+        for id_ in ids:
+            pending.append(executor.submit(_get_result, function, id_))
+            if len(pending) >= max_concurrency:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
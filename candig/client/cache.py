@@ -0,0 +1,130 @@
+"""
+A persistent cache of the objects returned by the get_* client methods.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache(object):
+    """
+    A size-bounded cache of serialized protocol objects stored in an SQLite
+    database. The database file can be shared by many clients, including
+    clients in separate processes such as successive CLI invocations.
+
+    Entries expire after a time to live that depends on the type of object
+    they hold, given by the object name used in the request path (for
+    example "datasets" or "readgroups"). Once the cached data exceeds
+    max_bytes, the least recently used entries are evicted.
+
+    :param str path: The path of the database file, which is created if
+        it does not exist.
+    :param int max_bytes: The maximum total size of the cached data.
+    :param float default_ttl: The number of seconds for which an object is
+        cached, unless its object name is given in ttls.
+    :param dict ttls: The number of seconds for which objects of each
+        object name are cached. Objects with a time to live of zero are
+        not cached.
+    """
+    _schema = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            object_name TEXT NOT NULL,
+            data BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            accessed REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+    """
+
+    def __init__(
+            self, path, max_bytes=64 * 1024 * 1024, default_ttl=24 * 60 * 60,
+            ttls=None):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._default_ttl = default_ttl
+        self._ttls = dict(ttls or {})
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            path, timeout=30, check_same_thread=False,
+            isolation_level=None)
+        self._connection.executescript(self._schema)
+
+    def get_ttl(self, object_name):
+        """
+        Returns the number of seconds for which objects with the specified
+        object name are cached.
+        """
+        return self._ttls.get(object_name, self._default_ttl)
+
+    def get(self, key, object_name):
+        """
+        Returns the data cached under the specified key, or None if there
+        is no unexpired entry for it.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT data, created FROM entries WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                return None
+            data, created = row
+            if now - created >= self.get_ttl(object_name):
+                self._connection.execute(
+                    "DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._connection.execute(
+                "UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return bytes(data)
+
+    def put(self, key, object_name, data):
+        """
+        Caches the specified data under the specified key, evicting the
+        least recently used entries if the cache is now too large.
+        """
+        if self.get_ttl(object_name) <= 0 or len(data) > self._max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, object_name, sqlite3.Binary(data), len(data), now,
+                 now))
+            self._evict()
+
+    def _evict(self):
+        total_size, = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        excess = total_size - self._max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        cursor = self._connection.execute(
+            "SELECT key, size FROM entries ORDER BY accessed")
+        for key, size in cursor:
+            evicted.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        cursor.close()
+        self._connection.executemany(
+            "DELETE FROM entries WHERE key = ?", evicted)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM entries")
+
+    def close(self):
+        """
+        Closes the database connection.
+        """
+        with self._lock:
+            self._connection.close()
@@ -5,16 +5,27 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import argparse
+import codecs
+import collections
+import cProfile
 import json
 import logging
-import requests
+import os
+import sys
+import tempfile
+import threading
+import time
 
 import candig.client
-import candig.client.client as client
 import candig.client.exceptions as exceptions
 
 import ga4gh.common.cli as cli
-import candig.schemas.protocol as protocol
+
+# The client, the protocol, requests and the modules that use them take
+# far longer to import than it takes to parse a command line, so they are
+# imported only once a runner needs them, and not at all for --help or a
+# parse error.
 
 
 ###############
@@ -24,6 +35,10 @@ import candig.schemas.protocol as protocol
 
 AVRO_LONG_MAX = 2**31 - 1
 
+# The size of the client's connection pool, which is raised to the number
+# of workers of a parallel search
+DEFAULT_POOL_MAXSIZE = 10
+
 
 def addDisableUrllibWarningsArgument(parser):
     parser.add_argument(
@@ -31,14 +46,109 @@ def addDisableUrllibWarningsArgument(parser):
         help="Disable urllib3 warnings")
 
 
+class VersionAction(argparse.Action):
+    """
+    Prints the versions of the client and of the protocol and exits, like
+    argparse's version action, but only imports the protocol to find its
+    version if the option is given.
+    """
+    def __init__(
+            self, option_strings, dest=argparse.SUPPRESS,
+            default=argparse.SUPPRESS,
+            help="show program's version number and exit"):
+        super(VersionAction, self).__init__(
+            option_strings=option_strings, dest=dest, default=default,
+            nargs=0, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        import candig.schemas.protocol as protocol
+        parser.exit(message=(
+            "CanDIG Client Version {}\n"
+            "(Protocol Version {})\n".format(
+                candig.client.__version__, protocol.version)))
+
+
+class LazySubParsersAction(argparse._SubParsersAction):
+    """
+    A subparsers action whose subparsers are each added by a function
+    that is only called once the subcommand is given, or once help is
+    formatted. Most commands then pay only for building the one parser
+    they use. The names of all the subcommands are its choices, whether
+    or not their parsers have been added.
+    """
+    def __init__(self, *args, **kwargs):
+        super(LazySubParsersAction, self).__init__(*args, **kwargs)
+        self._parserAdders = collections.OrderedDict()
+        self._parsers = collections.OrderedDict()
+        self.choices = []
+
+    def add_parser(self, name, **kwargs):
+        parser = super(LazySubParsersAction, self).add_parser(name, **kwargs)
+        for choice in [name] + list(kwargs.get("aliases", [])):
+            self._parsers[choice] = parser
+            if choice not in self.choices:
+                self.choices.append(choice)
+        return parser
+
+    def addLazyParser(self, name, addParser):
+        """
+        Registers the subcommand with the specified name, whose parser is
+        added by calling addParser with this action.
+        """
+        self._parserAdders[name] = addParser
+        if name not in self.choices:
+            self.choices.append(name)
+
+    def _addParser(self, name):
+        addParser = self._parserAdders.pop(name, None)
+        if addParser is not None:
+            addParser(self)
+
+    def addAllParsers(self):
+        """
+        Adds the parsers of all the registered subcommands that have not
+        been added yet.
+        """
+        for name in list(self._parserAdders.keys()):
+            self._addParser(name)
+
+    def getParsers(self):
+        """
+        Returns a dictionary of the parsers added so far, by subcommand.
+        """
+        return collections.OrderedDict(self._parsers)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        self._addParser(values[0])
+        super(LazySubParsersAction, self).__call__(
+            parser, namespace, values, option_string)
+
+
+class LazyArgumentParser(argparse.ArgumentParser):
+    """
+    An argument parser whose subcommands are added lazily by a
+    :class:`LazySubParsersAction`, and are all added before its help is
+    formatted so that the help lists them.
+    """
+    def __init__(self, *args, **kwargs):
+        super(LazyArgumentParser, self).__init__(*args, **kwargs)
+        self._subparsersAction = None
+
+    def add_subparsers(self, **kwargs):
+        kwargs.setdefault("action", LazySubParsersAction)
+        kwargs.setdefault("parser_class", argparse.ArgumentParser)
+        self._subparsersAction = super(
+            LazyArgumentParser, self).add_subparsers(**kwargs)
+        return self._subparsersAction
+
+    def format_help(self):
+        if self._subparsersAction is not None:
+            self._subparsersAction.addAllParsers()
+        return super(LazyArgumentParser, self).format_help()
+
+
 def addVersionArgument(parser):
-    # TODO argparse strips newlines from version output
-    versionString = (
-        "CanDIG Client Version {}\n"
-        "(Protocol Version {})".format(
-            candig.client.__version__, protocol.version))
-    parser.add_argument(
-        "--version", version=versionString, action="version")
+    parser.add_argument("--version", action=VersionAction)
 
 ###############
 # Client
@@ -57,18 +167,197 @@ def verbosityToLogLevel(verbosity):
     return ret
 
 
+try:
+    _textType = unicode
+except NameError:
+    _textType = str
+
+
+def _toText(value):
+    """
+    Returns the specified value as it would be written by print.
+    """
+    if isinstance(value, _textType):
+        return value
+    if isinstance(value, str):
+        return value.decode("utf-8")
+    return _textType(value)
+
+
+def formatFields(fields, sep="\t"):
+    """
+    Returns the text of the specified fields joined by sep, as print
+    would write them.
+    """
+    return sep.join(_toText(field) for field in fields)
+
+
+class OutputWriter(object):
+    """
+    Collects the formatted output of a runner and writes it to a stream in
+    large chunks, rather than in a write for every field. The buffered
+    output is written once it holds bufferSize characters and whenever
+    flush() is called or, if lineBuffered is set, at the end of every
+    line. If stream is None the output is written to whatever sys.stdout
+    is at the time. Each write to the stream is recorded by the tracer,
+    if one is set, under traceName.
+    """
+    traceName = "write"
+
+    def __init__(self, stream=None, bufferSize=64 * 1024, lineBuffered=False):
+        self._stream = stream
+        self._bufferSize = bufferSize
+        self._lineBuffered = lineBuffered
+        self._chunks = []
+        self._bufferedSize = 0
+        self._tracer = None
+
+    def setTracer(self, tracer):
+        """
+        Sets the :class:`candig.client.tracing.Tracer` that records the
+        writes to the stream, or None to stop recording them.
+        """
+        self._tracer = tracer
+
+    def _getStream(self):
+        if self._stream is None:
+            return sys.stdout
+        return self._stream
+
+    def write(self, text):
+        """
+        Writes the specified text.
+        """
+        self._chunks.append(text)
+        self._bufferedSize += len(text)
+        if self._lineBuffered and "\n" in text:
+            self.flush()
+        elif self._bufferedSize >= self._bufferSize:
+            self._writeBuffer()
+
+    def writeLines(self, lines):
+        """
+        Writes each of the specified lines, followed by a newline.
+        """
+        for line in lines:
+            self.write(line + "\n")
+
+    def _writeBuffer(self):
+        if len(self._chunks) > 0:
+            startTime = time.time()
+            self._getStream().write("".join(self._chunks))
+            if self._tracer is not None:
+                self._tracer.record_write(
+                    startTime, time.time(), self._bufferedSize,
+                    self.traceName)
+            self._chunks = []
+            self._bufferedSize = 0
+
+    def flush(self):
+        """
+        Writes out the buffered output and flushes the stream.
+        """
+        self._writeBuffer()
+        stream = self._getStream()
+        if hasattr(stream, "flush"):
+            stream.flush()
+
+
+class _SpooledOutput(object):
+    """
+    A stream that keeps the output written to it in memory up to maxSize
+    bytes, and in a temporary file beyond that, until it is copied to a
+    writer.
+    """
+    def __init__(self, maxSize=1024 * 1024):
+        self._file = tempfile.SpooledTemporaryFile(max_size=maxSize)
+
+    def write(self, text):
+        self._file.write(text.encode("utf-8"))
+
+    def copyTo(self, writer, chunkSize=64 * 1024):
+        """
+        Writes the output kept so far to the specified writer.
+        """
+        self._file.seek(0)
+        reader = codecs.getreader("utf-8")(self._file)
+        while True:
+            text = reader.read(chunkSize)
+            if not text:
+                break
+            writer.write(text)
+
+    def close(self):
+        self._file.close()
+
+
+class _SearchCancelled(Exception):
+    """
+    Raised to stop a search run in parallel with others once one of them
+    has failed.
+    """
+
+
+class _CancellableOutputWriter(OutputWriter):
+    """
+    An OutputWriter for the output of one of several searches run in
+    parallel, which stops the search by raising _SearchCancelled at its
+    next record once the specified event is set. Its writes to the spool
+    are traced as "spool" writes.
+    """
+    traceName = "spool"
+
+    def __init__(self, stream, cancelled):
+        super(_CancellableOutputWriter, self).__init__(stream)
+        self._cancelled = cancelled
+
+    def write(self, text):
+        if self._cancelled.is_set():
+            raise _SearchCancelled()
+        super(_CancellableOutputWriter, self).write(text)
+
+
 class AbstractQueryRunner(object):
     """
     Abstract base class for runner classes
     """
     def __init__(self, args):
+        import candig.client.cache as cache
+        import candig.client.client as client
+        import candig.client.retry as retry
         self._key = args.key
         self._auth0_token = args.auth0_token
+        # Each worker of a parallel search needs a connection of its own
+        workers = getattr(args, "workers", 1)
         self._client = client.HttpClient(
             args.baseUrl,
             logLevel=verbosityToLogLevel(args.verbose),
             authentication_key=self._key,
-            id_token=self._auth0_token)
+            id_token=self._auth0_token,
+            pool_maxsize=max(DEFAULT_POOL_MAXSIZE, workers),
+            retry_policies=retry.default_policies(args.max_retries),
+            retry_budget=retry.RetryBudget())
+        if args.cache_file is not None:
+            self._client.set_response_cache(cache.ResponseCache(
+                args.cache_file, default_ttl=args.cache_ttl))
+        self._writer = OutputWriter(lineBuffered=args.line_buffered)
+        self._threadOutput = threading.local()
+        self._tracer = None
+
+    def _getWriter(self):
+        """
+        Returns the writer that output of the calling thread goes to.
+        """
+        return getattr(self._threadOutput, "writer", self._writer)
+
+    def setTracer(self, tracer):
+        """
+        Sets the :class:`candig.client.tracing.Tracer` that records the
+        requests of the client and the writes of output of this runner.
+        """
+        self._tracer = tracer
+        self._client.set_metrics(tracer)
+        self._writer.setTracer(tracer)
 
 
 class FormattedOutputRunner(AbstractQueryRunner):
@@ -77,28 +366,39 @@ class FormattedOutputRunner(AbstractQueryRunner):
     """
     def __init__(self, args):
         super(FormattedOutputRunner, self).__init__(args)
-        self._output = self._textOutput
+        self._formatter = self._textOutput
         if args.outputFormat == "json":
-            self._output = self._jsonOutput
+            self._formatter = self._jsonOutput
+        self._output = self._formattedOutput
+
+    def _formattedOutput(self, gaObjects):
+        """
+        Outputs the specified protocol objects in the chosen format, and
+        flushes the output once they are done or have failed.
+        """
+        try:
+            self._formatter(gaObjects)
+        finally:
+            self._getWriter().flush()
 
     def _jsonOutput(self, gaObjects):
         """
         Outputs the specified protocol objects as one JSON string per
         line.
         """
-        for gaObject in gaObjects:
-            print(protocol.toJson(gaObject))
+        import candig.schemas.protocol as protocol
+        self._getWriter().writeLines(
+            _toText(protocol.toJson(gaObject)) for gaObject in gaObjects)
 
     def _textOutput(self, gaObjects):
         """
         Outputs a text summary of the specified protocol objects, one
         per line.
         """
-        for gaObject in gaObjects:
-            if hasattr(gaObject, 'name'):
-                print(gaObject.id, gaObject.name, sep="\t")
-            else:
-                print(gaObject.id, sep="\t")
+        self._getWriter().writeLines(
+            formatFields([gaObject.id, gaObject.name])
+            if hasattr(gaObject, 'name') else _toText(gaObject.id)
+            for gaObject in gaObjects)
 
 
 class AbstractGetRunner(FormattedOutputRunner):
@@ -123,6 +423,166 @@ class AbstractSearchRunner(FormattedOutputRunner):
         super(AbstractSearchRunner, self).__init__(args)
         self._pageSize = args.pageSize
         self._client.set_page_size(self._pageSize)
+        if args.targetPageLatency is not None:
+            import candig.client.paging as paging
+            self._client.set_page_size_controller(
+                paging.PageSizeController(
+                    initial_page_size=self._pageSize or 100,
+                    target_latency=args.targetPageLatency))
+        self._client.set_prefetch_pages(args.prefetchPages)
+        # Only the searches over all containers take --workers
+        self._workers = getattr(args, "workers", 1)
+        self._checkpointFile = None
+        self._resumeFrom = None
+
+    def _setDecodeProcesses(self, decodeProcesses):
+        """
+        Parses large pages of results in the specified number of worker
+        processes, if more than zero.
+        """
+        if decodeProcesses > 0:
+            from concurrent import futures
+            self._client.set_decode_executor(
+                futures.ProcessPoolExecutor(decodeProcesses))
+
+    def _setCheckpointOptions(self, args):
+        """
+        Sets the file that the position of the search is saved to, and
+        the checkpoint file that the search is resumed from.
+        """
+        self._checkpointFile = args.checkpoint
+        self._resumeFrom = args.resumeFrom
+        if (self._checkpointFile is not None and
+                (args.workers > 1 or
+                 getattr(args, "regionShards", 0) > 1)):
+            raise exceptions.ErrantRequestException(
+                "Checkpoints cannot be saved for parallel searches")
+
+    def _checkSingleSearch(self):
+        """
+        Raises an error if a checkpoint file was given, since a checkpoint
+        saves the position of a single search.
+        """
+        if self._checkpointFile is not None:
+            raise exceptions.ErrantRequestException(
+                "Checkpoints can only be saved for a single search")
+
+    def _saveCheckpoint(self, cursor):
+        """
+        Saves the specified search cursor to the checkpoint file, after
+        flushing the output written so far.
+        """
+        self._getWriter().flush()
+        temporaryFile = self._checkpointFile + ".tmp"
+        with open(temporaryFile, "w") as checkpointFile:
+            checkpointFile.write(cursor.to_json())
+        os.rename(temporaryFile, self._checkpointFile)
+
+    def _checkpointed(self, iterator):
+        """
+        Returns an iterator over the results of the specified search
+        iterator that saves its position to the checkpoint file, if one
+        was given, when each page of results is started, when the search
+        fails and once it is done.
+        """
+        if self._checkpointFile is None:
+            return iterator
+        return self._checkpointing(iterator)
+
+    def _checkpointing(self, iterator):
+        savedPageToken = None
+        while True:
+            try:
+                result = next(iterator)
+            except StopIteration:
+                break
+            except BaseException:
+                # Every result consumed so far has been output
+                self._saveCheckpoint(iterator.get_cursor())
+                raise
+            cursor = iterator.get_cursor()
+            if cursor.protocol_request.page_token != savedPageToken:
+                # Every result but this one has been output
+                cursor.offset -= 1
+                self._saveCheckpoint(cursor)
+                savedPageToken = cursor.protocol_request.page_token
+            yield result
+        self._saveCheckpoint(iterator.get_cursor())
+
+    def _resume(self):
+        """
+        Resumes the search saved in the checkpoint file given by
+        --resume-from.
+        """
+        import candig.client.paging as paging
+        with open(self._resumeFrom) as checkpointFile:
+            cursor = paging.SearchCursor.from_json(checkpointFile.read())
+        self._output(self._checkpointed(self._client.resume_search(cursor)))
+
+    def _runSpooled(self, containerId, spool, cancelled):
+        """
+        Runs the search for the specified container, writing its output
+        to the specified spool rather than to the output, until the
+        specified event is set.
+        """
+        self._threadOutput.writer = _CancellableOutputWriter(
+            spool, cancelled)
+        self._threadOutput.writer.setTracer(self._tracer)
+        try:
+            self._run(containerId)
+        finally:
+            self._threadOutput.writer.flush()
+            del self._threadOutput.writer
+
+    def _runAll(self, containerIds):
+        """
+        Runs the search for each of the specified containers in turn. With
+        more than one worker the searches are run in parallel, but the
+        output of each container is still written together and in the
+        same order, once its search is done; until then it is spooled to
+        a temporary file if it is large. The first error stops any
+        searches not yet started, and those running once they have
+        fetched their current page, after the output of the failed search
+        is written as in a serial run.
+        """
+        self._checkSingleSearch()
+        if self._workers <= 1:
+            for containerId in containerIds:
+                self._run(containerId)
+            return
+        from concurrent import futures
+        executor = futures.ThreadPoolExecutor(self._workers)
+        cancelled = threading.Event()
+        pending = collections.deque()
+        try:
+            for containerId in containerIds:
+                spool = _SpooledOutput()
+                pending.append((spool, executor.submit(
+                    self._runSpooled, containerId, spool, cancelled)))
+                if len(pending) >= self._workers:
+                    self._writeSpooled(*pending.popleft())
+            while len(pending) > 0:
+                self._writeSpooled(*pending.popleft())
+        finally:
+            cancelled.set()
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for spool, _ in pending:
+                spool.close()
+
+    def _writeSpooled(self, spool, future):
+        """
+        Waits for the search of the specified future to finish and writes
+        its spooled output, before raising its error if it failed.
+        """
+        try:
+            future.result()
+        finally:
+            if future.done():
+                spool.copyTo(self._writer)
+                self._writer.flush()
+                spool.close()
 
     def getAllDatasets(self):
         """
@@ -240,8 +700,8 @@ class SearchReferencesRunner(AbstractSearchRunner):
 
     def run(self):
         if self._referenceSetId is None:
-            for referenceSet in self.getAllReferenceSets():
-                self._run(referenceSet.id)
+            self._runAll(
+                referenceSet.id for referenceSet in self.getAllReferenceSets())
         else:
             self._run(self._referenceSetId)
 
@@ -260,8 +720,7 @@ class SearchVariantSetsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -285,8 +744,7 @@ class SearchBiosamplesRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -308,8 +766,7 @@ class SearchIndividualsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -331,8 +788,7 @@ class SearchExperimentsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -354,8 +810,7 @@ class SearchAnalysesRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -391,8 +846,7 @@ class SearchFeatureSetsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -411,8 +865,7 @@ class SearchContinuousSetsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -433,8 +886,7 @@ class SearchReadGroupSetsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._datasetId is None:
-            for dataset in self.getAllDatasets():
-                self._run(dataset.id)
+            self._runAll(dataset.id for dataset in self.getAllDatasets())
         else:
             self._run(self._datasetId)
 
@@ -455,8 +907,8 @@ class SearchCallSetsRunner(AbstractSearchRunner):
 
     def run(self):
         if self._variantSetId is None:
-            for variantSet in self.getAllVariantSets():
-                self._run(variantSet.id)
+            self._runAll(
+                variantSet.id for variantSet in self.getAllVariantSets())
         else:
             self._run(self._variantSetId)
 
@@ -499,8 +951,8 @@ class SearchGenotypePhenotypeRunner(AbstractSearchRunner):
         """
         Prints out the specified FeaturePhenotypeAssociation objects.
         """
-        for association in gaObjects:
-            print(association.id)
+        self._getWriter().writeLines(
+            _toText(association.id) for association in gaObjects)
 
 
 class SearchPhenotypeRunner(AbstractSearchRunner):
@@ -540,32 +992,40 @@ class SearchPhenotypeAssociationSetsRunner(AbstractSearchRunner):
         self._output(iterator)
 
 
+def _formatVariant(variant):
+    """
+    Returns the fields and attributes of the specified Variant as text.
+    """
+    fields = formatFields([
+        variant.id, variant.variant_set_id, list(variant.names),
+        variant.reference_name, variant.start, variant.end,
+        variant.reference_bases, "".join(list(variant.alternate_bases))])
+    attributes = "".join(
+        formatFields([key, value.values[0].string_value], sep="=") + ";"
+        for key, value in variant.attributes.attr.items())
+    return fields + "\t" + attributes
+
+
 class VariantFormatterMixin(object):
     """
     Simple mixin to format variant objects.
     """
+    def _formatVariantLine(self, variant):
+        calls = "".join(
+            formatFields([
+                c.call_set_id,
+                list(c.genotype).__str__().replace('\n', ''),
+                c.genotype_likelihood, c.attributes, c.phaseset],
+                sep=":") + "\t"
+            for c in variant.calls)
+        return _formatVariant(variant) + "\t" + calls
+
     def _textOutput(self, gaObjects):
         """
         Prints out the specified Variant objects in a VCF-like form.
         """
-        for variant in gaObjects:
-            print(
-                variant.id, variant.variant_set_id, list(variant.names),
-                variant.reference_name, variant.start, variant.end,
-                variant.reference_bases,
-                "".join(list(variant.alternate_bases)),
-                sep="\t", end="\t")
-            for key, value in variant.attributes.attr.items():
-                val = value.values[0].string_value
-                print(key, val, sep="=", end=";")
-            print("\t", end="")
-            for c in variant.calls:
-                print(
-                    c.call_set_id,
-                    list(c.genotype).__str__().replace('\n', ''),
-                    c.genotype_likelihood, c.attributes,
-                    c.phaseset, sep=":", end="\t")
-            print()
+        self._getWriter().writeLines(
+            self._formatVariantLine(variant) for variant in gaObjects)
 
 
 class GenotypesFormatterMixin(object):
@@ -580,20 +1040,12 @@ class GenotypesFormatterMixin(object):
         genotype_mtx = list(genotypes.genotypes)
         nrow = genotypes.nvariants
         ncol = len(genotypes.genotypes)//nrow
-        print(list(calls))
-        for row in range(nrow):
-            print(list(genotype_mtx[row*ncol:(row+1)*ncol]))
-        for variant in variants:
-            print(
-                variant.id, variant.variant_set_id, list(variant.names),
-                variant.reference_name, variant.start, variant.end,
-                variant.reference_bases,
-                "".join(list(variant.alternate_bases)),
-                sep="\t", end="\t")
-            for key, value in variant.attributes.attr.items():
-                val = value.values[0].string_value
-                print(key, val, sep="=", end=";")
-            print()
+        out = self._getWriter()
+        out.writeLines([_toText(list(calls))])
+        out.writeLines(
+            _toText(list(genotype_mtx[row*ncol:(row+1)*ncol]))
+            for row in range(nrow))
+        out.writeLines(_formatVariant(variant) for variant in variants)
 
 
 class AnnotationFormatterMixin(object):
@@ -604,19 +1056,24 @@ class AnnotationFormatterMixin(object):
         """
         Prints out the specified Variant objects in a VCF-like form.
         """
-        for variantAnnotation in gaObjects:
-            print(
-                variantAnnotation.id, variantAnnotation.variant_id,
-                variantAnnotation.variant_annotation_set_id,
-                variantAnnotation.created, sep="\t", end="\t")
-            for effect in variantAnnotation.transcript_effects:
-                print(effect.alternate_bases, sep="|", end="|")
-                for so in effect.effects:
-                    print(so.term, sep="&", end="|")
-                    print(so.term_id, sep="&", end="|")
-                print(effect.hgvs_annotation.transcript,
-                      effect.hgvs_annotation.protein, sep="|", end="\t")
-            print()
+        self._getWriter().writeLines(
+            self._formatAnnotation(variantAnnotation)
+            for variantAnnotation in gaObjects)
+
+    def _formatAnnotation(self, variantAnnotation):
+        fields = formatFields([
+            variantAnnotation.id, variantAnnotation.variant_id,
+            variantAnnotation.variant_annotation_set_id,
+            variantAnnotation.created])
+        effects = []
+        for effect in variantAnnotation.transcript_effects:
+            effects.append(_toText(effect.alternate_bases) + "|")
+            for so in effect.effects:
+                effects.append(formatFields([so.term, so.term_id], "|") + "|")
+            effects.append(formatFields([
+                effect.hgvs_annotation.transcript,
+                effect.hgvs_annotation.protein], sep="|") + "\t")
+        return fields + "\t" + "".join(effects)
 
 
 class FeatureFormatterMixin(object):
@@ -624,19 +1081,22 @@ class FeatureFormatterMixin(object):
     Mix-in class to format Feature (Sequence Annotation) objects
     """
     def _textOutput(self, gaObjects):
-        for feature in gaObjects:
-            print(
-                feature.id, feature.parent_id, feature.feature_set_id,
-                feature.reference_name, feature.start, feature.end,
-                feature.strand, sep="\t", end="\t")
-            print(
-                "FeatureType:", feature.feature_type.id,
-                feature.feature_type.term, end="\t")
-            for attrkey in feature.attributes.vals.keys():
-                print(
-                    attrkey, feature.attributes.vals[attrkey],
-                    sep=":", end="; ")
-            print()
+        self._getWriter().writeLines(
+            self._formatFeature(feature) for feature in gaObjects)
+
+    def _formatFeature(self, feature):
+        fields = formatFields([
+            feature.id, feature.parent_id, feature.feature_set_id,
+            feature.reference_name, feature.start, feature.end,
+            feature.strand])
+        featureType = formatFields([
+            "FeatureType:", feature.feature_type.term_id,
+            feature.feature_type.term], sep=" ")
+        attributes = "".join(
+            formatFields([key, value.values[0].string_value],
+                         sep=":") + "; "
+            for key, value in feature.attributes.attr.items())
+        return fields + "\t" + featureType + "\t" + attributes
 
 
 class ContinuousFormatterMixin(object):
@@ -644,12 +1104,12 @@ class ContinuousFormatterMixin(object):
     Mix-in class to format Continuous (Sequence Annotation) objects
     """
     def _textOutput(self, gaObjects):
-        for continuous in gaObjects:
-            print(
+        self._getWriter().writeLines(
+            formatFields([
                 continuous.continuous_set_id,
-                continuous.reference_name, continuous.start, continuous.values,
-                sep="\t", end="\t")
-            print()
+                continuous.reference_name, continuous.start,
+                continuous.values]) + "\t"
+            for continuous in gaObjects)
 
 
 class SearchVariantsRunner(VariantFormatterMixin, AbstractSearchRunner):
@@ -658,6 +1118,9 @@ class SearchVariantsRunner(VariantFormatterMixin, AbstractSearchRunner):
     """
     def __init__(self, args):
         super(SearchVariantsRunner, self).__init__(args)
+        self._client.set_region_shards(args.regionShards)
+        self._setDecodeProcesses(args.decodeProcesses)
+        self._setCheckpointOptions(args)
         self._referenceName = args.referenceName
         self._variantSetId = args.variantSetId
         self._start = args.start
@@ -668,19 +1131,43 @@ class SearchVariantsRunner(VariantFormatterMixin, AbstractSearchRunner):
             self._callSetIds = None
         else:
             self._callSetIds = args.callSetIds.split(",")
+        self._outputFile = args.outputFile
+        if args.outputFormat == "parquet":
+            if self._outputFile is None:
+                raise exceptions.ErrantRequestException(
+                    "Parquet output requires an --outputFile")
+            if self._checkpointFile is not None or self._resumeFrom:
+                raise exceptions.ErrantRequestException(
+                    "Parquet output cannot be checkpointed")
+            self._output = self._parquetOutput
+
+    def _parquetOutput(self, variants):
+        """
+        Writes the specified Variant objects to the Parquet output file,
+        with a genotype column for each call set.
+        """
+        import candig.client.columnar as columnar
+        columnar.write_parquet(
+            columnar.iter_variant_batches(variants, self._callSetIds),
+            self._outputFile)
 
     def _run(self, variantSetId):
         iterator = self._client.search_variants(
             start=self._start, end=self._end,
             reference_name=self._referenceName,
-            variant_set_id=variantSetId,
+            variant_set_ids=[variantSetId],
             call_set_ids=self._callSetIds)
-        self._output(iterator)
+        self._output(self._checkpointed(iterator))
 
     def run(self):
-        if self._variantSetId is None:
-            for variantSet in self.getAllVariantSets():
-                self._run(variantSet.id)
+        if self._resumeFrom is not None:
+            self._resume()
+        elif self._variantSetId is None:
+            if self._output == self._parquetOutput:
+                raise exceptions.ErrantRequestException(
+                    "Parquet output requires a --variantSetId")
+            self._runAll(
+                variantSet.id for variantSet in self.getAllVariantSets())
         else:
             self._run(self._variantSetId)
 
@@ -712,8 +1199,8 @@ class SearchGenotypesRunner(GenotypesFormatterMixin, AbstractSearchRunner):
 
     def run(self):
         if self._variantSetId is None:
-            for variantSet in self.getAllVariantSets():
-                self._run(variantSet.id)
+            self._runAll(
+                variantSet.id for variantSet in self.getAllVariantSets())
         else:
             self._run(self._variantSetId)
 
@@ -734,6 +1221,7 @@ class SearchVariantAnnotationsRunner(
         if args.effects == "":
             self._effects = []
         else:
+            import candig.schemas.protocol as protocol
             self._effects = []
             for eff in args.effects.split(","):
                 term = protocol.OntologyTerm()
@@ -761,8 +1249,9 @@ class SearchVariantAnnotationsRunner(
 
     def run(self):
         if self._variantAnnotationSetId is None:
-            for annotationSet in self.getAllAnnotationSets():
-                self._run(annotationSet.id)
+            self._runAll(
+                annotationSet.id
+                for annotationSet in self.getAllAnnotationSets())
         else:
             self._run(self._variantAnnotationSetId)
 
@@ -773,6 +1262,8 @@ class SearchFeaturesRunner(FeatureFormatterMixin, AbstractSearchRunner):
     """
     def __init__(self, args):
         super(SearchFeaturesRunner, self).__init__(args)
+        self._client.set_region_shards(args.regionShards)
+        self._setCheckpointOptions(args)
         self._referenceName = args.referenceName
         self._featureSetId = args.featureSetId
         self._parentId = args.parentId
@@ -789,12 +1280,13 @@ class SearchFeaturesRunner(FeatureFormatterMixin, AbstractSearchRunner):
             reference_name=self._referenceName,
             feature_set_id=featureSetId, parent_id=self._parentId,
             feature_types=self._featureTypes)
-        self._output(iterator)
+        self._output(self._checkpointed(iterator))
 
     def run(self):
-        if self._featureSetId is None and not self._parentId:
-            for featureSet in self.getAllFeatureSets():
-                self._run(featureSet)
+        if self._resumeFrom is not None:
+            self._resume()
+        elif self._featureSetId is None and not self._parentId:
+            self._runAll(self.getAllFeatureSets())
         else:
             self._run(self._featureSetId)
 
@@ -805,6 +1297,7 @@ class SearchContinuousRunner(ContinuousFormatterMixin, AbstractSearchRunner):
     """
     def __init__(self, args):
         super(SearchContinuousRunner, self).__init__(args)
+        self._setCheckpointOptions(args)
         self._referenceName = args.referenceName
         self._continuousSetId = args.continuousSetId
         self._start = args.start
@@ -815,12 +1308,13 @@ class SearchContinuousRunner(ContinuousFormatterMixin, AbstractSearchRunner):
             start=self._start, end=self._end,
             reference_name=self._referenceName,
             continuous_set_id=continuousSetId)
-        self._output(iterator)
+        self._output(self._checkpointed(iterator))
 
     def run(self):
-        if self._continuousSetId is None:
-            for continuousSet in self.getAllContinuousSets():
-                self._run(continuousSet)
+        if self._resumeFrom is not None:
+            self._resume()
+        elif self._continuousSetId is None:
+            self._runAll(self.getAllContinuousSets())
         else:
             self._run(self._continuousSetId)
 
@@ -831,6 +1325,9 @@ class SearchReadsRunner(AbstractSearchRunner):
     """
     def __init__(self, args):
         super(SearchReadsRunner, self).__init__(args)
+        self._client.set_region_shards(args.regionShards)
+        self._setDecodeProcesses(args.decodeProcesses)
+        self._setCheckpointOptions(args)
         self._start = args.start
         self._end = args.end
         self._referenceId = args.referenceId
@@ -846,6 +1343,7 @@ class SearchReadsRunner(AbstractSearchRunner):
         if referenceId is None:
             referenceId = self._referenceId
         if referenceId is None:
+            self._checkSingleSearch()
             rg = self._client.get_read_group(
                 read_group_id=referenceGroupId)
             iterator = self._client.search_references(rg.reference_set_id)
@@ -856,16 +1354,19 @@ class SearchReadsRunner(AbstractSearchRunner):
                 read_group_ids=[referenceGroupId],
                 reference_id=referenceId,
                 start=self._start, end=self._end)
-            self._output(iterator)
+            self._output(self._checkpointed(iterator))
 
     def run(self):
         """
         Iterate passed read group ids, or go through all available read groups
         """
-        if not self._readGroupIds:
-            for referenceGroupId in self.getAllReadGroups():
-                self._run(referenceGroupId)
+        if self._resumeFrom is not None:
+            self._resume()
+        elif not self._readGroupIds:
+            self._runAll(self.getAllReadGroups())
         else:
+            if len(self._readGroupIds) > 1:
+                self._checkSingleSearch()
             for referenceGroupId in self._readGroupIds:
                 self._run(referenceGroupId)
 
@@ -873,9 +1374,9 @@ class SearchReadsRunner(AbstractSearchRunner):
         """
         Prints out the specified Variant objects in a VCF-like form.
         """
-        for read in gaObjects:
-            # TODO add in some more useful output here.
-            print(read.id)
+        # TODO add in some more useful output here.
+        self._getWriter().writeLines(
+            _toText(read.id) for read in gaObjects)
 
 
 class SearchRnaQuantificationSetsRunner(AbstractSearchRunner):
@@ -892,11 +1393,10 @@ class SearchRnaQuantificationSetsRunner(AbstractSearchRunner):
         self._output(iterator)
 
     def _textOutput(self, rnaQuants):
-        for rnaQuant in rnaQuants:
-            print(
-                rnaQuant.id, rnaQuant.dataset_id, rnaQuant.name,
-                sep="\t", end="\t")
-            print()
+        self._getWriter().writeLines(
+            formatFields([
+                rnaQuant.id, rnaQuant.dataset_id, rnaQuant.name]) + "\t"
+            for rnaQuant in rnaQuants)
 
 
 class SearchRnaQuantificationsRunner(AbstractSearchRunner):
@@ -913,15 +1413,14 @@ class SearchRnaQuantificationsRunner(AbstractSearchRunner):
         self._output(iterator)
 
     def _textOutput(self, rnaQuants):
-        for rnaQuant in rnaQuants:
-            print(
-                rnaQuant.id, rnaQuant.description, rnaQuant.name,
-                sep="\t", end="\t")
-            for featureSet in rnaQuant.feature_set_ids:
-                print(featureSet, sep=",", end="\t")
-            for readGroup in rnaQuant.read_group_ids:
-                print(readGroup, sep=",", end="")
-            print()
+        self._getWriter().writeLines(
+            formatFields([
+                rnaQuant.id, rnaQuant.description, rnaQuant.name]) + "\t" +
+            "".join(
+                _toText(featureSet) + "\t"
+                for featureSet in rnaQuant.feature_set_ids) +
+            formatFields(rnaQuant.read_group_ids, sep="")
+            for rnaQuant in rnaQuants)
 
 
 class SearchExpressionLevelsRunner(AbstractSearchRunner):
@@ -943,12 +1442,12 @@ class SearchExpressionLevelsRunner(AbstractSearchRunner):
         self._output(iterator)
 
     def _textOutput(self, expressionObjs):
-        for expression in expressionObjs:
-            print(
+        self._getWriter().writeLines(
+            formatFields([
                 expression.id, expression.expression, expression.name,
                 expression.is_normalized, expression.raw_read_count,
-                expression.score, expression.units, sep="\t", end="\t")
-            print()
+                expression.score, expression.units]) + "\t"
+            for expression in expressionObjs)
 
 
 class ListPeersRunner(FormattedOutputRunner):
@@ -964,8 +1463,7 @@ class ListPeersRunner(FormattedOutputRunner):
         self._output(iterator)
 
     def _textOutput(self, peers):
-        for peer in peers:
-            print(peer.url)
+        self._getWriter().writeLines(_toText(peer.url) for peer in peers)
 
 
 class AnnouncePeerRunner(FormattedOutputRunner):
@@ -978,10 +1476,12 @@ class AnnouncePeerRunner(FormattedOutputRunner):
         self._output(response)
 
     def _textOutput(self, response):
-        print("Server responded with {}".format(response.success))
+        self._getWriter().writeLines([
+            "Server responded with {}".format(response.success)])
 
     def _jsonOutput(self, response):
-        print(protocol.toJson(response))
+        import candig.schemas.protocol as protocol
+        self._getWriter().writeLines([_toText(protocol.toJson(response))])
 
 
 class GetInfoRunner(FormattedOutputRunner):
@@ -993,10 +1493,12 @@ class GetInfoRunner(FormattedOutputRunner):
         self._output(response)
 
     def _textOutput(self, response):
-        print("Protocol version: {}".format(response.protocol_version))
+        self._getWriter().writeLines([
+            "Protocol version: {}".format(response.protocol_version)])
 
     def _jsonOutput(self, response):
-        print(protocol.toJson(response))
+        import candig.schemas.protocol as protocol
+        self._getWriter().writeLines([_toText(protocol.toJson(response))])
 
 
 # ListReferenceBases is an oddball, and doesn't fit either get or
@@ -1011,20 +1513,38 @@ class ListReferenceBasesRunner(AbstractQueryRunner):
         self._start = args.start
         self._end = args.end
         self._outputFormat = args.outputFormat
+        self._client.set_region_shards(args.regionShards)
 
     def run(self):
-        sequence = self._client.list_reference_bases(
+        sequences = self._client.iter_reference_bases(
             self._referenceId, self._start, self._end)
-        if self._outputFormat == "text":
-            print(sequence)
-        else:
-            start = self._start if self._start else ""
-            end = self._end if self._end else ""
-            print(">{}:{}-{}".format(self._referenceId, start, end))
-
-            textWidth = 70
-            for index in xrange(0, len(sequence), textWidth):
-                print(sequence[index: index+textWidth])
+        out = self._getWriter()
+        try:
+            if self._outputFormat == "text":
+                for sequence in sequences:
+                    out.write(sequence)
+                out.write("\n")
+            else:
+                self._writeFasta(out, sequences)
+        finally:
+            out.flush()
+
+    def _writeFasta(self, out, sequences):
+        start = self._start if self._start else ""
+        end = self._end if self._end else ""
+        out.writeLines([">{}:{}-{}".format(self._referenceId, start, end)])
+
+        textWidth = 70
+        remainder = ""
+        for sequence in sequences:
+            sequence = remainder + sequence
+            lineEnd = len(sequence) - len(sequence) % textWidth
+            out.writeLines(
+                sequence[index: index+textWidth]
+                for index in xrange(0, lineEnd, textWidth))
+            remainder = sequence[lineEnd:]
+        if remainder:
+            out.writeLines([remainder])
 
 
 # Runners for the various GET methods.
@@ -1210,6 +1730,8 @@ def addVariantSearchOptions(parser):
     addStartArgument(parser)
     addEndArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
 
 
 def addGenotypeSearchOptions(parser):
@@ -1230,6 +1752,8 @@ def addAnnotationsSearchOptions(parser):
     addEndArgument(parser)
     addEffectsArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
 
 
 def addFeaturesSearchOptions(parser):
@@ -1435,6 +1959,22 @@ def addOutputFormatArgument(parser):
             "'json', which outputs each object in line-delimited JSON"))
 
 
+def addVariantOutputFormatArguments(parser):
+    parser.add_argument(
+        "--outputFormat", "-O", choices=['text', 'json', 'parquet'],
+        default="text",
+        help=(
+            "The format for variant output. Currently supported are "
+            "'text' (default), which gives a VCF-like summary of each "
+            "variant, 'json', which outputs each variant in line-delimited "
+            "JSON and 'parquet', which writes the variants with a genotype "
+            "column for each call set to the Parquet file given by "
+            "--outputFile"))
+    parser.add_argument(
+        "--outputFile", default=None,
+        help="The file to write Parquet output to")
+
+
 def addAccessionArgument(parser):
     parser.add_argument(
         "--accession", default=None,
@@ -1454,6 +1994,61 @@ def addPageSizeArgument(parser):
             "The maximum number of results returned in one page. "
             "The default is to let the server decide how many "
             "results to return in a single page."))
+    parser.add_argument(
+        "--targetPageLatency", default=None, type=float,
+        help=(
+            "Adapt the page size of each kind of search, starting from "
+            "--pageSize, so that a page takes about this many seconds."))
+
+
+def addRegionShardsArgument(parser):
+    parser.add_argument(
+        "--regionShards", default=0, type=int,
+        help=(
+            "The number of sub-regions to split the region between start "
+            "and end into. The sub-regions are searched concurrently and "
+            "the results merged in coordinate order."))
+
+
+def addDecodeProcessesArgument(parser):
+    parser.add_argument(
+        "--decodeProcesses", default=0, type=int,
+        help=(
+            "The number of worker processes that large JSON pages of "
+            "results are parsed in. Zero (the default) parses them in the "
+            "client process."))
+
+
+def addCheckpointArguments(parser):
+    parser.add_argument(
+        "--checkpoint", default=None,
+        help=(
+            "A file to save the position of the search in as it runs, so "
+            "that it can be resumed with --resume-from if interrupted."))
+    parser.add_argument(
+        "--resume-from", dest="resumeFrom", default=None,
+        help=(
+            "A checkpoint file saved with --checkpoint. The search saved "
+            "in it is resumed from where it stopped, and the other search "
+            "arguments are ignored."))
+
+
+def addWorkersArgument(parser):
+    parser.add_argument(
+        "--workers", default=1, type=int,
+        help=(
+            "The number of searches to run in parallel when searching over "
+            "all the containers on the server. Output is written in the "
+            "same order as with a single worker."))
+
+
+def addPrefetchPagesArgument(parser):
+    parser.add_argument(
+        "--prefetchPages", default=0, type=int,
+        help=(
+            "The number of pages of results to request in the background "
+            "while the current page is being output. The default is to "
+            "request each page only when the previous one is done."))
 
 
 def addDatasetIdArgument(parser):
@@ -1496,6 +2091,35 @@ def addClientGlobalOptions(parser):
     parser.add_argument(
         "--auth0-token", "-t", default=None,
         help="A token generated using Auth0 login.")
+    parser.add_argument(
+        "--max-retries", default=3, type=int,
+        help=(
+            "The number of times a get, search or list request is retried "
+            "after a transient failure; 0 disables retries."))
+    parser.add_argument(
+        "--cache-file", default=None,
+        help=(
+            "A file in which to cache the objects fetched by get requests, "
+            "so that they can be reused by later invocations."))
+    parser.add_argument(
+        "--cache-ttl", default=24 * 60 * 60, type=float,
+        help="The number of seconds for which cached objects are reused.")
+    parser.add_argument(
+        "--line-buffered", default=False, action="store_true",
+        help=(
+            "Write each line of output as soon as it is formatted, rather "
+            "than in large chunks."))
+    parser.add_argument(
+        "--profile", default=None, metavar="FILE",
+        help=(
+            "Profile the command and write the statistics to FILE, for "
+            "reading with pstats or snakeviz."))
+    parser.add_argument(
+        "--trace", default=None, metavar="FILE",
+        help=(
+            "Write a timeline of the requests, decoding of responses and "
+            "writes of output of the command to FILE, in the Chrome trace "
+            "format."))
     addDisableUrllibWarningsArgument(parser)
     addVersionArgument(parser)
 
@@ -1512,8 +2136,11 @@ def addVariantsSearchParser(subparsers):
         subparsers, "variants-search", "Search for variants")
     parser.set_defaults(runner=SearchVariantsRunner)
     addUrlArgument(parser)
-    addOutputFormatArgument(parser)
+    addVariantOutputFormatArguments(parser)
     addVariantSearchOptions(parser)
+    addRegionShardsArgument(parser)
+    addDecodeProcessesArgument(parser)
+    addCheckpointArguments(parser)
     return parser
 
 
@@ -1534,6 +2161,8 @@ def addVariantSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addDatasetIdArgument(parser)
     return parser
 
@@ -1559,6 +2188,7 @@ def addVariantAnnotationSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     addVariantSetIdMandatoryArgument(parser)
     return parser
 
@@ -1635,6 +2265,8 @@ def addBiosamplesSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addDatasetIdArgument(parser)
     addNameArgument(parser)
     addIndividualIdArgument(parser)
@@ -1651,6 +2283,8 @@ def addIndividualsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addDatasetIdArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addNameArgument(parser)
     return parser
 
@@ -1664,6 +2298,8 @@ def addExperimentsSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addNameArgument(parser)
     return parser
 
@@ -1677,6 +2313,8 @@ def addAnalysesSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addNameArgument(parser)
     return parser
 
@@ -1690,6 +2328,10 @@ def addFeaturesSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
+    addRegionShardsArgument(parser)
+    addCheckpointArguments(parser)
     addFeaturesSearchOptions(parser)
     return parser
 
@@ -1703,6 +2345,9 @@ def addContinuousSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
+    addCheckpointArguments(parser)
     addContinuousSearchOptions(parser)
     return parser
 
@@ -1716,6 +2361,8 @@ def addFeatureSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addDatasetIdArgument(parser)
     return parser
 
@@ -1729,6 +2376,8 @@ def addContinuousSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addDatasetIdArgument(parser)
     return parser
 
@@ -1740,6 +2389,7 @@ def addReferenceSetsSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     addAccessionArgument(parser)
     addMd5ChecksumArgument(parser)
     parser.add_argument(
@@ -1755,6 +2405,8 @@ def addReferencesSearchParser(subparsers):
     addUrlArgument(parser)
     addOutputFormatArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addAccessionArgument(parser)
     addMd5ChecksumArgument(parser)
     addReferenceSetIdArgument(parser)
@@ -1769,6 +2421,8 @@ def addReadGroupSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addBiosampleIdArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addDatasetIdArgument(parser)
     addNameArgument(parser)
     return parser
@@ -1782,6 +2436,8 @@ def addCallSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addBiosampleIdArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
     addNameArgument(parser)
     addVariantSetIdArgument(parser)
     return parser
@@ -1809,6 +2465,7 @@ def addDatasetsSearchParser(subparsers):
     parser.set_defaults(runner=SearchDatasetsRunner)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     addOutputFormatArgument(parser)
     return parser
 
@@ -1816,6 +2473,11 @@ def addDatasetsSearchParser(subparsers):
 def addReadsSearchParserArguments(parser):
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
+    addWorkersArgument(parser)
+    addRegionShardsArgument(parser)
+    addDecodeProcessesArgument(parser)
+    addCheckpointArguments(parser)
     addStartArgument(parser)
     addEndArgument(parser)
     parser.add_argument(
@@ -1904,6 +2566,7 @@ def addReferencesBasesListParser(subparsers):
     addIdArgument(parser)
     addStartArgument(parser)
     addEndArgument(parser, defaultValue=None)
+    addRegionShardsArgument(parser)
 
 
 def addRnaQuantificationSetsSearchParser(subparsers):
@@ -1914,6 +2577,7 @@ def addRnaQuantificationSetsSearchParser(subparsers):
     parser.set_defaults(runner=SearchRnaQuantificationSetsRunner)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     addDatasetIdArgument(parser)
     addOutputFormatArgument(parser)
     return parser
@@ -1927,6 +2591,7 @@ def addRnaQuantificationsSearchParser(subparsers):
     parser.set_defaults(runner=SearchRnaQuantificationsRunner)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     parser.add_argument(
         "--rnaQuantificationSetId", default=None,
         help="The rnaQuantification set to search over")
@@ -1942,6 +2607,7 @@ def addExpressionLevelsSearchParser(subparsers):
     parser.set_defaults(runner=SearchExpressionLevelsRunner)
     addUrlArgument(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     addNamesArgument(parser)
     parser.add_argument(
         "--rnaQuantificationId", default='',
@@ -1962,6 +2628,7 @@ def addGenotypePhenotypeSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addGenotypePhenotypeSearchOptions(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     return parser
 
 
@@ -1973,6 +2640,7 @@ def addPhenotypeSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addPhenotypeSearchOptions(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
     return parser
 
 
@@ -1985,6 +2653,7 @@ def addPhenotypeAssociationSetsSearchParser(subparsers):
     addOutputFormatArgument(parser)
     addPhenotypeAssociationSetsSearchOptions(parser)
     addPageSizeArgument(parser)
+    addPrefetchPagesArgument(parser)
 
 
 def addListPeersParser(subparsers):
@@ -2015,73 +2684,117 @@ def addAnnouncePeerParser(subparsers):
     addOutputFormatArgument(parser)
 
 
-def getClientParser():
-    parser = cli.createArgumentParser("GA4GH reference client")
+# The subcommands of the client, with the functions that add their
+# parsers, in the order they are listed by --help
+CLIENT_SUBCOMMANDS = collections.OrderedDict([
+    ("help", addHelpParser),
+    ("get-info", addGetInfoParser),
+    ("list-peers", addListPeersParser),
+    ("announce", addAnnouncePeerParser),
+    ("variants-search", addVariantsSearchParser),
+    ("genotypes-search", addGenotypesSearchParser),
+    ("variantsets-search", addVariantSetsSearchParser),
+    ("variantannotations-search", addVariantAnnotationSearchParser),
+    ("variantannotationsets-search", addVariantAnnotationSetsSearchParser),
+    ("variantsets-get", addVariantSetsGetParser),
+    ("variantannotationsets-get", addVariantAnnotationSetsGetParser),
+    ("features-search", addFeaturesSearchParser),
+    ("features-get", addFeaturesGetParser),
+    ("featuresets-get", addFeatureSetsGetParser),
+    ("featuresets-search", addFeatureSetsSearchParser),
+    ("continuous-search", addContinuousSearchParser),
+    ("continuoussets-get", addContinuousSetsGetParser),
+    ("continuoussets-search", addContinuousSetsSearchParser),
+    ("biosamples-search", addBiosamplesSearchParser),
+    ("biosamples-get", addBiosamplesGetParser),
+    ("individuals-search", addIndividualsSearchParser),
+    ("individuals-get", addIndividualsGetParser),
+    ("experiments-search", addExperimentsSearchParser),
+    ("experiments-get", addExperimentsGetParser),
+    ("analyses-search", addAnalysesSearchParser),
+    ("analyses-get", addAnalysesGetParser),
+    ("referencesets-search", addReferenceSetsSearchParser),
+    ("references-search", addReferencesSearchParser),
+    ("readgroupsets-search", addReadGroupSetsSearchParser),
+    ("callsets-search", addCallSetsSearchParser),
+    ("reads-search", addReadsSearchParser),
+    ("datasets-search", addDatasetsSearchParser),
+    ("referencesets-get", addReferenceSetsGetParser),
+    ("references-get", addReferencesGetParser),
+    ("readgroupsets-get", addReadGroupSetsGetParser),
+    ("readgroups-get", addReadGroupsGetParser),
+    ("callsets-get", addCallSetsGetParser),
+    ("variants-get", addVariantsGetParser),
+    ("datasets-get", addDatasetsGetParser),
+    ("rnaquantificationsets-get", addRnaQuantificationSetGetParser),
+    ("rnaquantifications-get", addRnaQuantificationGetParser),
+    ("expressionlevels-get", addExpressionLevelGetParser),
+    ("references-list-bases", addReferencesBasesListParser),
+    ("rnaquantificationsets-search", addRnaQuantificationSetsSearchParser),
+    ("rnaquantifications-search", addRnaQuantificationsSearchParser),
+    ("expressionlevels-search", addExpressionLevelsSearchParser),
+    ("genotypephenotype-search", addGenotypePhenotypeSearchParser),
+    ("phenotype-search", addPhenotypeSearchParser),
+    ("phenotypeassociationsets-search",
+     addPhenotypeAssociationSetsSearchParser),
+])
+
+
+def getClientParser(lazy=True):
+    """
+    Returns the parser of the client's command line. The parser of each
+    subcommand is only built once that subcommand is given or help is
+    asked for, unless lazy is False.
+    """
+    parser = LazyArgumentParser(
+        description="GA4GH reference client",
+        formatter_class=cli.SortedHelpFormatter)
     addClientGlobalOptions(parser)
-    subparsers = parser.add_subparsers(title='subcommands',)
-    addHelpParser(subparsers)
-    addGetInfoParser(subparsers)
-    addListPeersParser(subparsers)
-    addAnnouncePeerParser(subparsers)
-    addVariantsSearchParser(subparsers)
-    addGenotypesSearchParser(subparsers)
-    addVariantSetsSearchParser(subparsers)
-    addVariantAnnotationSearchParser(subparsers)
-    addVariantAnnotationSetsSearchParser(subparsers)
-    addVariantSetsGetParser(subparsers)
-    addVariantAnnotationSetsGetParser(subparsers)
-    addFeaturesSearchParser(subparsers)
-    addFeaturesGetParser(subparsers)
-    addFeatureSetsGetParser(subparsers)
-    addFeatureSetsSearchParser(subparsers)
-    addContinuousSearchParser(subparsers)
-    addContinuousSetsGetParser(subparsers)
-    addContinuousSetsSearchParser(subparsers)
-    addBiosamplesSearchParser(subparsers)
-    addBiosamplesGetParser(subparsers)
-    addIndividualsSearchParser(subparsers)
-    addIndividualsGetParser(subparsers)
-    addExperimentsSearchParser(subparsers)
-    addExperimentsGetParser(subparsers)
-    addAnalysesSearchParser(subparsers)
-    addAnalysesGetParser(subparsers)
-    addReferenceSetsSearchParser(subparsers)
-    addReferencesSearchParser(subparsers)
-    addReadGroupSetsSearchParser(subparsers)
-    addCallSetsSearchParser(subparsers)
-    addReadsSearchParser(subparsers)
-    addDatasetsSearchParser(subparsers)
-    addReferenceSetsGetParser(subparsers)
-    addReferencesGetParser(subparsers)
-    addReadGroupSetsGetParser(subparsers)
-    addReadGroupsGetParser(subparsers)
-    addCallSetsGetParser(subparsers)
-    addVariantsGetParser(subparsers)
-    addDatasetsGetParser(subparsers)
-    addRnaQuantificationSetGetParser(subparsers)
-    addRnaQuantificationGetParser(subparsers)
-    addExpressionLevelGetParser(subparsers)
-    addReferencesBasesListParser(subparsers)
-    addRnaQuantificationSetsSearchParser(subparsers)
-    addRnaQuantificationsSearchParser(subparsers)
-    addExpressionLevelsSearchParser(subparsers)
-    addGenotypePhenotypeSearchParser(subparsers)
-    addPhenotypeSearchParser(subparsers)
-    addPhenotypeAssociationSetsSearchParser(subparsers)
+    subparsers = parser.add_subparsers(title='subcommands')
+    for name, addParser in CLIENT_SUBCOMMANDS.items():
+        subparsers.addLazyParser(name, addParser)
+    if not lazy:
+        subparsers.addAllParsers()
     return parser
 
 
+def runProfiled(runner, profilePath=None, tracePath=None):
+    """
+    Runs the specified runner, profiling it if profilePath is given and
+    tracing its requests and output if tracePath is given. The profile
+    and trace are written even if the run fails or is interrupted.
+    """
+    tracer = None
+    if tracePath is not None:
+        import candig.client.tracing as tracing
+        tracer = tracing.Tracer()
+        runner.setTracer(tracer)
+    profiler = None
+    if profilePath is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        runner.run()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profilePath)
+        if tracer is not None:
+            tracer.write(tracePath)
+
+
 def client_main(args=None):
     parser = getClientParser()
     parsedArgs = parser.parse_args(args)
     if "runner" not in parsedArgs:
         parser.print_help()
     else:
+        import requests
         if parsedArgs.disable_urllib_warnings:
             requests.packages.urllib3.disable_warnings()
         try:
             runner = parsedArgs.runner(parsedArgs)
-            runner.run()
+            runProfiled(runner, parsedArgs.profile, parsedArgs.trace)
         except (exceptions.BaseClientException,
                 requests.exceptions.RequestException) as exception:
             # TODO suppress exception unless debug settings are enabled
@@ -5,29 +5,136 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import binascii
 import requests
+import urllib3
 import posixpath
 import logging
 import json
+import hashlib
+import threading
+import time
 
 from requests_oauthlib import OAuth2Session
 from oauthlib.oauth2 import LegacyApplicationClient
+from google.protobuf import json_format
 
+import candig.client.batch as batch
+import candig.client.columnar as columnar
+import candig.client.compression as compression
 import candig.client.exceptions as exceptions
+import candig.client.genotypes as genotypes
+import candig.client.paging as paging
+import candig.client.retry as retry
 
 import candig.schemas.pb as pb
 import candig.schemas.protocol as protocol
 
 
+_PROTOBUF_MIMETYPES = ["application/protobuf", "application/x-protobuf"]
+
+# The errors that fail an attempt to send a request or read its response
+# body, and are retried as allowed by the retry policy of the request
+_RETRIED_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ContentDecodingError,
+    urllib3.exceptions.ProtocolError,
+    urllib3.exceptions.TimeoutError) + compression.DECODING_ERRORS
+
+# The class of the objects returned by get requests for each object name
+_GET_RESPONSE_CLASSES = {
+    "analyses": protocol.Analysis,
+    "biosamples": protocol.Biosample,
+    "callsets": protocol.CallSet,
+    "continuoussets": protocol.ContinuousSet,
+    "datasets": protocol.Dataset,
+    "experiments": protocol.Experiment,
+    "expressionlevels": protocol.ExpressionLevel,
+    "features": protocol.Feature,
+    "featuresets": protocol.FeatureSet,
+    "individuals": protocol.Individual,
+    "readgroups": protocol.ReadGroup,
+    "readgroupsets": protocol.ReadGroupSet,
+    "references": protocol.Reference,
+    "referencesets": protocol.ReferenceSet,
+    "rnaquantifications": protocol.RnaQuantification,
+    "rnaquantificationsets": protocol.RnaQuantificationSet,
+    "variantannotationsets": protocol.VariantAnnotationSet,
+    "variants": protocol.Variant,
+    "variantsets": protocol.VariantSet,
+}
+
+
+def _defederate(response_json):
+    """
+    Returns the results of the specified response if it is a federated
+    response, or the response itself if not.
+
+    Note that federated responses have broken binary serialization,
+    as they are implemented outside of the schema, so we can assume
+    the response has already been parsed as JSON.
+    """
+    if (isinstance(response_json, dict) and
+            'status' in response_json and 'results' in response_json):
+        return response_json['results']
+    return response_json
+
+
+def _parse_json_response(response_data, protocol_response_class):
+    """
+    Returns an instance of protocol_response_class parsed from the
+    specified JSON response body.
+    """
+    if isinstance(response_data, memoryview):
+        response_data = response_data.tobytes()
+    try:
+        response_json = json.loads(response_data)
+    except ValueError as error:
+        raise json_format.ParseError(
+            "Failed to load JSON: {0}.".format(error))
+    return json_format.ParseDict(
+        _defederate(response_json), protocol_response_class(),
+        ignore_unknown_fields=True)
+
+
+def _decode_json_page(response_data, protocol_response_class_name):
+    """
+    Parses a JSON response body in a worker process of a decode executor,
+    returning the message serialized as protobuf, which is much faster to
+    parse in the client process than the JSON.
+    """
+    protocol_response_class = getattr(protocol, protocol_response_class_name)
+    return _parse_json_response(
+        response_data, protocol_response_class).SerializeToString()
+
+
 class AbstractClient(object):
     """
     The abstract superclass of GA4GH Client objects.
     """
+    # The number of get requests get_many runs at once by default
+    _max_get_concurrency = 10
+    # JSON responses smaller than this are parsed without the decode
+    # executor, as shipping them to a worker costs more than it saves
+    _parallel_decode_min_bytes = 256 * 1024
 
     def __init__(self, log_level=0, serialization="application/protobuf"):
         self._page_size = None
+        self._page_size_controller = None
+        self._prefetch_pages = 0
+        self._region_shards = 0
+        self._response_cache = None
+        self._decode_executor = None
+        self._metrics = None
         self._log_level = log_level
         self._protocol_bytes_received = 0
+        self._compressed_bytes_received = 0
+        self._uncompressed_bytes_received = 0
+        # Guards the byte counters, as pages may be fetched by several
+        # threads at once
+        self._bytes_lock = threading.Lock()
         logging.basicConfig()
         self._logger = logging.getLogger(__name__)
         self._logger.setLevel(log_level)
@@ -35,34 +142,45 @@ class AbstractClient(object):
         if serialization not in protocol.MIMETYPES:
             self._serialization = "application/protobuf"
 
-    def _defederate_response(self, response_text):
-        """
-        Pullout the results if this is a federated response
-
-        Note that federated responses have broken binary serialization,
-        as they are implemented outside of the schema, so we can assume text.
-        """
-        try:
-            response_body_json = json.loads(response_text)
-        except ValueError:
-            return response_text
-
-        if 'status' in response_body_json and 'results' in response_body_json:
-            return json.dumps(response_body_json['results'])
-        return response_text
-
     def _deserialize_response(
-            self, response_string, protocol_response_class,
+            self, response_data, protocol_response_class,
             content_type):
-        self._protocol_bytes_received += len(response_string)
-        self._logger.debug("response:{}".format(response_string))
-        defed_response_string = self._defederate_response(response_string)
-        self._logger.debug("defed_response:{}".format(defed_response_string))
-        if not defed_response_string and content_type == "application/json":
+        """
+        Returns an instance of protocol_response_class deserialized from
+        the specified response body. The body may be the raw bytes of the
+        response, a memoryview over them or the decoded text. Protobuf
+        bodies are base64-encoded by the server, as candig.schemas
+        serializes them, so they are decoded straight from the response
+        buffer into the one copy that is then parsed. JSON bodies are
+        parsed once without first being decoded to text, with the message
+        built directly from the parsed results of a federated response.
+        Large JSON bodies are parsed in the decode executor, if one is
+        set, after a memoryview is copied to bytes. A response that is
+        already an instance of protocol_response_class is returned as it
+        is.
+        """
+        if isinstance(response_data, protocol_response_class):
+            return response_data
+        with self._bytes_lock:
+            self._protocol_bytes_received += len(response_data)
+        self._logger.debug("response:%s", response_data)
+        if content_type in _PROTOBUF_MIMETYPES:
+            return protocol_response_class.FromString(
+                binascii.a2b_base64(response_data))
+        if not response_data and content_type == "application/json":
             raise exceptions.EmptyResponseException()
-        return protocol.deserialize(defed_response_string,
-                                    content_type,
-                                    protocol_response_class)
+        if (self._decode_executor is None or
+                len(response_data) < self._parallel_decode_min_bytes):
+            return _parse_json_response(
+                response_data, protocol_response_class)
+        if isinstance(response_data, memoryview):
+            response_data = response_data.tobytes()
+        future = self._decode_executor.submit(
+            _decode_json_page, response_data,
+            protocol_response_class.__name__)
+        response_object = protocol_response_class()
+        response_object.ParseFromString(future.result())
+        return response_object
 
     def _run_http_post_request(
             self, protocol_request, path, protocol_response_class):
@@ -90,6 +208,7 @@ class AbstractClient(object):
             value_list = getattr(
                 response_object,
                 protocol.getValueListName(protocol_response_class))
+            self._record_page(path, len(value_list))
             for extract in value_list:
                 yield extract
             not_done = bool(response_object.next_page_token)
@@ -103,26 +222,184 @@ class AbstractClient(object):
         """
         raise NotImplemented()
 
-    def _run_search_request(
+    def _run_measured_search_page_request(
             self, protocol_request, object_name, protocol_response_class):
         """
-        Runs the specified request at the specified object_name and
-        instantiates an object of the specified class. We yield each object in
-        listAttr.  If pages of results are present, repeat this process
-        until the pageToken is null.
+        Runs a search page request and returns the page together with the
+        number of bytes of the response it was deserialized from, as a
+        (response, num_bytes) pair. The number of bytes is 0 if it is not
+        known.
         """
-        not_done = True
-        while not_done:
+        response_object = self._run_search_page_request(
+            protocol_request, object_name, protocol_response_class)
+        return response_object, 0
+
+    def _record_page(self, endpoint, num_results):
+        if self._metrics is not None:
+            self._metrics.record_page(endpoint, num_results)
+
+    def _run_sized_search_page_request(
+            self, protocol_request, object_name, protocol_response_class):
+        """
+        Runs a search page request with the page size given by the page
+        size controller, if one is set, and reports the latency and size
+        of the page to it. The page is reported to the metrics hook.
+        """
+        controller = self._page_size_controller
+        if controller is None:
             response_object = self._run_search_page_request(
                 protocol_request, object_name, protocol_response_class)
-            value_list = getattr(
+            self._record_page(object_name + "/search", len(getattr(
                 response_object,
-                protocol.getValueListName(protocol_response_class))
-            for extract in value_list:
-                yield extract
+                protocol.getValueListName(protocol_response_class))))
+            return response_object
+        protocol_request.page_size = controller.get_page_size(object_name)
+        start_time = time.time()
+        response_object, num_bytes = self._run_measured_search_page_request(
+            protocol_request, object_name, protocol_response_class)
+        value_list = getattr(
+            response_object,
+            protocol.getValueListName(protocol_response_class))
+        self._record_page(object_name + "/search", len(value_list))
+        controller.record_page(
+            object_name, protocol_request.page_size, len(value_list),
+            time.time() - start_time, num_bytes,
+            bool(response_object.next_page_token))
+        return response_object
+
+    def _run_search_page_requests(
+            self, protocol_request, object_name, protocol_response_class):
+        """
+        Returns an iterator over the pages of results for the specified
+        request, following the next_page_token of each page until the
+        server reports that there are no more. Each page is yielded as a
+        (page_token, response) pair, with the token that requested it.
+        """
+        not_done = True
+        while not_done:
+            page_token = protocol_request.page_token
+            response_object = self._run_sized_search_page_request(
+                protocol_request, object_name, protocol_response_class)
+            yield page_token, response_object
             not_done = bool(response_object.next_page_token)
             protocol_request.page_token = response_object.next_page_token
 
+    def _run_search_request(
+            self, protocol_request, object_name, protocol_response_class,
+            offset=0):
+        """
+        Runs the specified request at the specified object_name and
+        instantiates an object of the specified class. We yield each object in
+        listAttr.  If pages of results are present, repeat this process
+        until the pageToken is null. If prefetching is enabled, the following
+        pages are requested in the background while the current one is being
+        consumed. The results of the first page before offset are skipped.
+
+        :return: A :class:`candig.client.paging.SearchIterator` over the
+            results, whose position can be saved.
+        """
+        cursor = paging.SearchCursor(
+            object_name, protocol_request, protocol_response_class, offset)
+        pages = self._run_search_page_requests(
+            protocol_request, object_name, protocol_response_class)
+        if self._prefetch_pages > 0:
+            pages = paging.BackgroundIterator(pages, self._prefetch_pages)
+        return paging.SearchIterator(pages, cursor)
+
+    def resume_search(self, cursor):
+        """
+        Returns an iterator over the results of a search not yet consumed
+        when the specified cursor was saved, as returned by the
+        ``get_cursor`` method of the iterators returned by search methods.
+        Searches split into region shards cannot be resumed.
+
+        :param cursor: The saved position of the search.
+        :type cursor: :class:`candig.client.paging.SearchCursor`
+        :return: A :class:`candig.client.paging.SearchIterator` over the
+            remaining results.
+        """
+        if cursor.done:
+            return paging.SearchIterator(iter(()), cursor)
+        protocol_request = cursor.protocol_request.__class__()
+        protocol_request.CopyFrom(cursor.protocol_request)
+        return self._run_search_request(
+            protocol_request, cursor.object_name,
+            cursor.protocol_response_class, cursor.offset)
+
+    def _run_region_search_request(
+            self, protocol_request, object_name, protocol_response_class,
+            start_key):
+        """
+        Runs the specified request over the genomic region given by its
+        start and end. If region sharding is enabled, the region is split
+        into that many sub-regions which are searched concurrently, and the
+        results are merged back in coordinate order. start_key returns the
+        start position of a record, which is used to skip the duplicates of
+        records overlapping the boundary between two sub-regions.
+        """
+        if (self._region_shards <= 1 or
+                protocol_request.end <= protocol_request.start):
+            return self._run_search_request(
+                protocol_request, object_name, protocol_response_class)
+        return self._run_sharded_search_request(
+            protocol_request, object_name, protocol_response_class,
+            start_key)
+
+    def _start_background(self, iterables):
+        """
+        Returns a :class:`candig.client.paging.BackgroundIterator` for each
+        of the specified iterables, which are to be read one after another.
+        They are all consumed at once, each keeping as many items ahead of
+        the caller as prefetching allows and at least one, so that the
+        later ones have started by the time the caller reaches them while
+        the items held in memory stay bounded.
+        """
+        max_buffered = max(1, self._prefetch_pages)
+        iterators = []
+        try:
+            for iterable in iterables:
+                iterators.append(
+                    paging.BackgroundIterator(iterable, max_buffered))
+        except Exception:
+            for iterator in iterators:
+                iterator.close()
+            raise
+        return iterators
+
+    def _run_sharded_search_request(
+            self, protocol_request, object_name, protocol_response_class,
+            start_key):
+        value_list_name = protocol.getValueListName(protocol_response_class)
+        regions = paging.split_region(
+            protocol_request.start, protocol_request.end,
+            self._region_shards)
+        shard_requests = []
+        for start, end in regions:
+            shard_request = protocol_request.__class__()
+            shard_request.CopyFrom(protocol_request)
+            shard_request.start = start
+            shard_request.end = end
+            shard_requests.append(shard_request)
+        shard_pages = self._start_background(
+            self._run_search_page_requests(
+                shard_request, object_name, protocol_response_class)
+            for shard_request in shard_requests)
+        try:
+            merged = paging.merge_shards(
+                [(start, self._page_values(pages, value_list_name))
+                 for (start, _), pages in zip(regions, shard_pages)],
+                start_key)
+            for extract in merged:
+                yield extract
+        finally:
+            for pages in shard_pages:
+                pages.close()
+
+    def _page_values(self, pages, value_list_name):
+        for _, response_object in pages:
+            for extract in getattr(response_object, value_list_name):
+                yield extract
+
     def _run_list_reference_bases_page_request(self, protocol_request):
         """
         Runs a complete transaction with the server to get a single
@@ -130,27 +407,84 @@ class AbstractClient(object):
         """
         raise NotImplemented()
 
-    def list_reference_bases(self, id_, start=0, end=None):
+    def _run_list_reference_bases_requests(self, id_, start, end):
         """
-        Returns an iterator over the bases from the server in the form
-        of consecutive strings. This command does not conform to the
-        patterns of the other search and get requests, and is implemented
-        differently.
+        Returns an iterator over the sequences of the pages of bases
+        between start and end.
         """
         request = protocol.ListReferenceBasesRequest()
         request.start = pb.int(start)
         request.end = pb.int(end)
         request.reference_id = id_
         not_done = True
-        # TODO We should probably use a StringIO here to make string buffering
-        # a bit more efficient.
-        bases_list = []
         while not_done:
             response = self._run_list_reference_bases_page_request(request)
-            bases_list.append(response.sequence)
+            self._record_page("listreferencebases", len(response.sequence))
+            yield response.sequence
             not_done = bool(response.next_page_token)
             request.page_token = response.next_page_token
-        return "".join(bases_list)
+
+    def iter_reference_bases(self, id_, start=0, end=None):
+        """
+        Returns an iterator over the bases of the specified reference
+        between start and end, yielding the sequence of each page as it
+        is received so that long spans are streamed in constant memory.
+        If region sharding is enabled and end is given, the span is split
+        into that many ranges which are fetched concurrently and yielded
+        in order; each later range fetches as many pages ahead as
+        prefetching allows, and at least one, until it is reached.
+
+        :param str id_: The ID of the :class:`candig.protocol.Reference`
+            of interest.
+        :param int start: The start of the span (0-based, inclusive).
+        :param int end: The end of the span (0-based, exclusive). If None,
+            the bases up to the end of the reference are returned.
+        :return: An iterator over consecutive strings of bases.
+        :rtype: iter
+        """
+        start = start or 0
+        if self._region_shards <= 1 or end is None or end <= start:
+            ranges = [(start, end)]
+        else:
+            ranges = paging.split_region(start, end, self._region_shards)
+        if len(ranges) == 1 and self._prefetch_pages <= 0:
+            for sequence in self._run_list_reference_bases_requests(
+                    id_, start, end):
+                yield sequence
+            return
+        pages = self._start_background(
+            self._run_list_reference_bases_requests(
+                id_, range_start, range_end)
+            for range_start, range_end in ranges)
+        try:
+            for range_pages in pages:
+                for sequence in range_pages:
+                    yield sequence
+        finally:
+            for range_pages in pages:
+                range_pages.close()
+
+    def write_reference_bases(self, id_, fileobj, start=0, end=None):
+        """
+        Writes the bases of the specified reference between start and end
+        to the specified file object as they are received, and returns the
+        number of bases written. See :meth:`iter_reference_bases`.
+        """
+        written = 0
+        for sequence in self.iter_reference_bases(id_, start, end):
+            fileobj.write(sequence)
+            written += len(sequence)
+        return written
+
+    def list_reference_bases(self, id_, start=0, end=None):
+        """
+        Returns the bases of the specified reference between start and end
+        as a single string. This command does not conform to the
+        patterns of the other search and get requests, and is implemented
+        differently. Use :meth:`iter_reference_bases` or
+        :meth:`write_reference_bases` to stream long spans instead.
+        """
+        return "".join(self.iter_reference_bases(id_, start, end))
 
     def _run_get_request(self, object_name, protocol_response_class, id_):
         """
@@ -160,6 +494,65 @@ class AbstractClient(object):
         """
         raise NotImplemented()
 
+    def _get_response_class(self, object_name):
+        """
+        Returns the class of the objects got with the specified object
+        name.
+        """
+        if object_name not in _GET_RESPONSE_CLASSES:
+            raise exceptions.ErrantRequestException(
+                "Cannot get objects of type {}".format(object_name))
+        return _GET_RESPONSE_CLASSES[object_name]
+
+    def get_many(self, object_name, ids, max_concurrency=None):
+        """
+        Gets the objects with the specified IDs, running up to
+        max_concurrency get requests at once. Each ID is got separately,
+        so a failure to get one object does not affect the others.
+
+        :param str object_name: The name of the type of the objects, as
+            used in the request path, for example "biosamples".
+        :param ids: The IDs of the objects.
+        :param int max_concurrency: The maximum number of requests run at
+            once, which should not exceed the connection pool size of the
+            client. The default depends on the client.
+        :return: A list holding a :class:`candig.client.batch.GetResult`
+            for each ID, in the order of the IDs, whose value is the object
+            or whose error is the exception raised while getting it.
+        """
+        protocol_response_class = self._get_response_class(object_name)
+        if max_concurrency is None:
+            max_concurrency = self._max_get_concurrency
+
+        def get(id_):
+            return self._run_get_request(
+                object_name, protocol_response_class, id_)
+        return list(batch.run_ordered(get, ids, max_concurrency))
+
+    def get_biosamples(self, biosample_ids, max_concurrency=None):
+        """
+        Gets the Biosamples with the specified IDs. See :meth:`get_many`.
+        """
+        return self.get_many("biosamples", biosample_ids, max_concurrency)
+
+    def get_individuals(self, individual_ids, max_concurrency=None):
+        """
+        Gets the Individuals with the specified IDs. See :meth:`get_many`.
+        """
+        return self.get_many("individuals", individual_ids, max_concurrency)
+
+    def get_call_sets(self, call_set_ids, max_concurrency=None):
+        """
+        Gets the CallSets with the specified IDs. See :meth:`get_many`.
+        """
+        return self.get_many("callsets", call_set_ids, max_concurrency)
+
+    def get_variants(self, variant_ids, max_concurrency=None):
+        """
+        Gets the Variants with the specified IDs. See :meth:`get_many`.
+        """
+        return self.get_many("variants", variant_ids, max_concurrency)
+
     def get_biosample(self, biosample_id):
         """
         Perform a get request for the given Biosample.
@@ -218,6 +611,136 @@ class AbstractClient(object):
         """
         self._page_size = page_size
 
+    def get_page_size_controller(self):
+        """
+        Returns the controller that adapts the page size of searches, or
+        None if the page size set with :meth:`set_page_size` is used.
+        """
+        return self._page_size_controller
+
+    def set_page_size_controller(self, page_size_controller):
+        """
+        Sets the controller that chooses the page size of each search
+        request, adapting it separately for each kind of object searched
+        for toward a target latency or size of pages. The page size set
+        with :meth:`set_page_size` is then ignored for searches. None (the
+        default) disables adaptive page sizes.
+
+        :param page_size_controller: The controller to use.
+        :type page_size_controller:
+            :class:`candig.client.paging.PageSizeController`
+        """
+        self._page_size_controller = page_size_controller
+
+    def get_prefetch_pages(self):
+        """
+        Returns the number of pages of search results that are requested
+        ahead of the caller in the background.
+        """
+        return self._prefetch_pages
+
+    def set_prefetch_pages(self, prefetch_pages):
+        """
+        Sets the number of pages of search results to request in the
+        background while the caller consumes the current page. At most
+        this many pages are held in memory ahead of the caller. Zero (the
+        default) disables prefetching, so that each page is only requested
+        once the previous one has been consumed.
+        """
+        self._prefetch_pages = prefetch_pages or 0
+
+    def get_region_shards(self):
+        """
+        Returns the number of sub-regions that searches over a genomic
+        region are split into.
+        """
+        return self._region_shards
+
+    def set_region_shards(self, region_shards):
+        """
+        Sets the number of sub-regions that searches for variants, reads
+        and features, and listings of reference bases, are split into.
+        The sub-regions are fetched concurrently and their results merged
+        in coordinate order, so that a search over a large region is not
+        one long serial chain of pages. Each sub-region fetches as many
+        pages ahead of the caller as prefetching allows, and at least one,
+        then waits until the caller reaches it. Zero or one disables
+        sharding; this is the default.
+
+        A record spanning the boundary of two sub-regions is returned by
+        both, and the copy from the later one is dropped, so only searches
+        whose records the server returns whole are sharded. Continuous
+        data is clipped to the region searched, and is never sharded.
+
+        A sharded search returns a plain iterator rather than a
+        :class:`candig.client.paging.SearchIterator`, so its position
+        cannot be saved with get_cursor() and resumed with resume_search().
+
+        :param int region_shards: The number of sub-regions to search
+            concurrently.
+        """
+        self._region_shards = region_shards or 0
+
+    def get_response_cache(self):
+        """
+        Returns the cache used for the objects returned by the get_*
+        methods, or None if they are not cached.
+        """
+        return self._response_cache
+
+    def set_response_cache(self, response_cache):
+        """
+        Sets the cache used for the objects returned by the get_* methods.
+        Objects found in the cache are returned without a request to the
+        server. None (the default) disables caching.
+
+        :param response_cache: The cache to use.
+        :type response_cache: :class:`candig.client.cache.ResponseCache`
+        """
+        self._response_cache = response_cache
+
+    def get_decode_executor(self):
+        """
+        Returns the executor that large JSON responses are parsed in, or
+        None if they are parsed in the calling thread.
+        """
+        return self._decode_executor
+
+    def set_decode_executor(self, decode_executor):
+        """
+        Sets the executor that large JSON responses, such as pages of
+        reads or variants, are parsed in. With a process pool executor,
+        pages are parsed in parallel by the worker processes instead of
+        contending for the interpreter lock in the threads requesting
+        them, which pays off with prefetching or region sharding. The
+        workers return the parsed messages serialized as protobuf, which
+        is quick to parse. None (the default) parses every response in the
+        thread that received it.
+
+        :param decode_executor: The executor to use.
+        :type decode_executor: :class:`concurrent.futures.Executor`
+        """
+        self._decode_executor = decode_executor
+
+    def get_metrics(self):
+        """
+        Returns the hook that requests are reported to, or None if they
+        are not measured.
+        """
+        return self._metrics
+
+    def set_metrics(self, metrics):
+        """
+        Sets the hook that each request, the decoding of each response and
+        each page of results are reported to, with their endpoint, timings
+        and sizes. None (the default) disables the reports.
+
+        :param metrics: The hook to report to, such as a
+            :class:`candig.client.metrics.MetricsRecorder`.
+        :type metrics: :class:`candig.client.metrics.MetricsHook`
+        """
+        self._metrics = metrics
+
     def get_protocol_bytes_received(self):
         """
         Returns the total number of protocol bytes received from the server
@@ -229,6 +752,28 @@ class AbstractClient(object):
         """
         return self._protocol_bytes_received
 
+    def get_compressed_bytes_received(self):
+        """
+        Returns the total number of bytes of response bodies received from
+        the server by this client, as sent over the network.
+
+        :return: The number of bytes of response bodies before decoding
+            their content encoding.
+        :rtype: int
+        """
+        return self._compressed_bytes_received
+
+    def get_uncompressed_bytes_received(self):
+        """
+        Returns the total number of bytes of response bodies received from
+        the server by this client, once decompressed.
+
+        :return: The number of bytes of response bodies after decoding
+            their content encoding.
+        :rtype: int
+        """
+        return self._uncompressed_bytes_received
+
     def get_info(self):
         return self._run_get_request_path(
             "info", protocol.GetInfoResponse)
@@ -452,15 +997,18 @@ class AbstractClient(object):
         request.variant_set_ids.extend(variant_set_ids)
         request.call_set_ids.extend(pb.string(call_set_ids))
         request.page_size = pb.int(self._page_size)
-        return self._run_search_request(
-            request, "variants", protocol.SearchVariantsResponse)
+        return self._run_region_search_request(
+            request, "variants", protocol.SearchVariantsResponse,
+            lambda variant: variant.start)
 
     def search_genotypes(
             self, variant_set_id, start=None, end=None, reference_name=None,
-            call_set_ids=None):
+            call_set_ids=None, as_arrays=False):
         """
         Returns a genotype matrix over the Variants fulfilling the specified
-        conditions from the specified VariantSet.
+        conditions from the specified VariantSet. The rows of every page of
+        results are appended to the matrix as the page is received; use
+        :meth:`iter_genotype_blocks` to process the pages one at a time.
 
         :param str variant_set_id: The ID of the
             :class:`candig.protocol.VariantSet` of interest.
@@ -477,11 +1025,37 @@ class AbstractClient(object):
         :param list call_set_ids: Only return variant calls which belong to
             call sets with these IDs. If an empty array, returns variants
             without any call objects. If null, returns all variant calls.
-
-        :return: An iterator over the :class:`candig.protocol.Variant` objects
-            defined by the query parameters.
+        :param bool as_arrays: Return the matrix as NumPy arrays rather than
+            protocol objects. This requires the numpy package.
+
+        :return: A tuple of the :class:`candig.protocol.GenotypeMatrix`, the
+            :class:`candig.protocol.Variant` objects it covers and the call
+            set IDs of its columns, or a
+            :class:`candig.client.genotypes.GenotypeArrays` if as_arrays is
+            set.
         :rtype: tuple
         """
+        blocks = self.iter_genotype_blocks(
+            variant_set_id, start, end, reference_name, call_set_ids)
+        if as_arrays:
+            return genotypes.concatenate_arrays(
+                genotypes.to_arrays(*block) for block in blocks)
+        return genotypes.merge_blocks(blocks)
+
+    def iter_genotype_blocks(
+            self, variant_set_id, start=None, end=None, reference_name=None,
+            call_set_ids=None):
+        """
+        Returns an iterator over the genotype matrix of the Variants
+        fulfilling the specified conditions from the specified VariantSet,
+        in blocks of rows. Each page of results is yielded as it is
+        received, so that only one block is held in memory at a time.
+        See :meth:`search_genotypes` for the parameters.
+
+        :return: An iterator over (genotypes, variants, call_set_ids)
+            tuples, one per block of rows.
+        :rtype: iter
+        """
         request = protocol.SearchGenotypesRequest()
         request.reference_name = pb.string(reference_name)
         request.start = pb.int(start)
@@ -489,18 +1063,58 @@ class AbstractClient(object):
         request.variant_set_id = variant_set_id
         if call_set_ids is not None:
             request.call_set_ids.extend(call_set_ids)
+        request.page_size = pb.int(self._page_size)
+        pages = self._run_search_page_requests(
+            request, "genotypes", protocol.SearchGenotypesResponse)
+        if self._prefetch_pages > 0:
+            pages = paging.BackgroundIterator(pages, self._prefetch_pages)
+        try:
+            for _, response_object in pages:
+                yield (
+                    response_object.genotypes, response_object.variants,
+                    response_object.call_set_ids)
+        finally:
+            pages.close()
+
+    def export_variants_arrow(
+            self, variant_set_id, start=None, end=None, reference_name=None,
+            call_set_ids=None, batch_size=10000):
+        """
+        Returns an iterator over Arrow record batches holding the Variants
+        fulfilling the specified conditions from the specified VariantSet,
+        with a column for the genotypes of each call set. See
+        :meth:`search_variants` for the parameters and
+        :func:`candig.client.columnar.variants_to_record_batch` for the
+        columns. The batches can be written to a Parquet file with
+        :func:`candig.client.columnar.write_parquet`. Requires pyarrow.
+
+        :param int batch_size: The maximum number of rows of each batch.
+        :return: An iterator over :class:`pyarrow.RecordBatch` objects.
+        :rtype: iter
+        """
+        return columnar.iter_variant_batches(
+            self.search_variants(
+                [variant_set_id], start=start, end=end,
+                reference_name=reference_name, call_set_ids=call_set_ids),
+            call_set_ids, batch_size)
 
-        # do the paging here, then combine
-        not_done = True
-        resps = []
-        while not_done:
-            response_object = self._run_search_page_request(
-                request, "genotypes", protocol.SearchGenotypesResponse)
-            resps.append(response_object)
-            not_done = bool(response_object.next_page_token)
-            request.page_token = response_object.next_page_token
-        # assume just the one page now
-        return resps[0].genotypes, resps[0].variants, resps[0].call_set_ids
+    def export_genotypes_arrow(
+            self, variant_set_id, start=None, end=None, reference_name=None,
+            call_set_ids=None):
+        """
+        Returns an iterator over Arrow record batches holding the genotype
+        matrix of the Variants fulfilling the specified conditions from
+        the specified VariantSet, one batch per page of results. See
+        :meth:`search_genotypes` for the parameters and
+        :func:`candig.client.columnar.genotypes_to_record_batch` for the
+        columns. Requires pyarrow.
+
+        :return: An iterator over :class:`pyarrow.RecordBatch` objects.
+        :rtype: iter
+        """
+        return columnar.iter_genotype_batches(self.iter_genotype_blocks(
+            variant_set_id, start=start, end=end,
+            reference_name=reference_name, call_set_ids=call_set_ids))
 
     def search_variant_annotations(
             self, variant_annotation_set_id, reference_name="",
@@ -573,9 +1187,10 @@ class AbstractClient(object):
         request.end = end
         request.feature_types.extend(feature_types)
         request.page_size = pb.int(self._page_size)
-        return self._run_search_request(
+        return self._run_region_search_request(
             request, "features",
-            protocol.SearchFeaturesResponse)
+            protocol.SearchFeaturesResponse,
+            lambda feature: feature.start)
 
     def search_continuous(
             self, continuous_set_id=None, reference_name="", start=0, end=0):
@@ -590,6 +1205,9 @@ class AbstractClient(object):
         :param int end: end position on reference
         :return: an iterator over Continuous returned in the
             SearchContinuousResponse object.
+
+        The server clips continuous values to the region searched, so the
+        search is never split into region shards.
         """
         request = protocol.SearchContinuousRequest()
         request.continuous_set_id = continuous_set_id
@@ -598,8 +1216,7 @@ class AbstractClient(object):
         request.end = end
         request.page_size = pb.int(self._page_size)
         return self._run_search_request(
-            request, "continuous",
-            protocol.SearchContinuousResponse)
+            request, "continuous", protocol.SearchContinuousResponse)
 
     def search_datasets(self):
         """
@@ -874,8 +1491,9 @@ class AbstractClient(object):
         request.start = pb.int(start)
         request.end = pb.int(end)
         request.page_size = pb.int(self._page_size)
-        return self._run_search_request(
-            request, "reads", protocol.SearchReadsResponse)
+        return self._run_region_search_request(
+            request, "reads", protocol.SearchReadsResponse,
+            lambda read: read.alignment.position.position)
 
     def search_phenotype_association_sets(self, dataset_id):
         """
@@ -995,17 +1613,54 @@ class HttpClient(AbstractClient):
         server after logging in.
     :param str serialization: "application/protobuf" or "application/json",
         the serialization protocol used for the protobuf objects
+    :param int pool_connections: The number of hosts for which pools of
+        connections are kept.
+    :param int pool_maxsize: The maximum number of connections kept open
+        to each host. This should be at least the number of threads making
+        requests through the client at once.
+    :param bool keep_alive: Whether connections are kept open for reuse
+        by later requests.
+    :param float idle_timeout: The number of seconds after which idle
+        connections are closed rather than reused, or None to always reuse
+        them. This should be shorter than the server's keep-alive timeout.
+    :param timeout: The number of seconds to wait for the server to accept
+        a connection and to send a response, as a single number or a
+        (connect, read) tuple. None (the default) waits forever.
+    :param dict retry_policies: The :class:`candig.client.retry.RetryPolicy`
+        for each kind of request ("get", "search", "list" or "post") that
+        is retried after a transient failure. Kinds without a policy are
+        not retried; :func:`candig.client.retry.default_policies` returns
+        policies for the idempotent kinds.
+    :param retry_budget: Limits the retries made by the client.
+    :type retry_budget: :class:`candig.client.retry.RetryBudget`
+    :param str request_encoding: The content encoding, gzip or deflate,
+        used to compress the bodies of large requests, or None to send
+        them uncompressed. The server must support compressed requests.
     """
+    _read_chunk_size = 64 * 1024
 
     def __init__(
             self, url_prefix, logLevel=logging.WARNING,
             serialization="application/json",
             authentication_key=None,
-            id_token=None):
+            id_token=None,
+            pool_connections=10, pool_maxsize=10, keep_alive=True,
+            idle_timeout=None, timeout=None, retry_policies=None,
+            retry_budget=None, request_encoding=None):
         super(HttpClient, self).__init__(logLevel, serialization)
         self._url_prefix = url_prefix
         self._authentication_key = authentication_key
         self._id_token = id_token
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._keep_alive = keep_alive
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._retry_policies = dict(retry_policies or {})
+        self._retry_budget = retry_budget
+        self._request_encoding = request_encoding
+        self._last_request_time = None
+        self._idle_evictions = 0
         self._session = requests.Session()
         self._serialization = serialization
         self._setup_http_session()
@@ -1018,13 +1673,149 @@ class HttpClient(AbstractClient):
         Sets up the common HTTP session parameters used by requests.
         """
         headers = {"Content-type": "application/json",
-                   "Accept": self._serialization}
+                   "Accept": self._serialization,
+                   "Accept-Encoding": compression.accept_encoding()}
         if (self._id_token):
             headers.update({"authorization": "Bearer {}".format(
                 self._id_token)})
+        if not self._keep_alive:
+            headers["Connection"] = "close"
         self._session.headers.update(headers)
         # TODO is this unsafe????
         self._session.verify = False
+        self._mount_http_adapters()
+
+    def _mount_http_adapters(self):
+        """
+        Mounts HTTP adapters with the configured connection pool sizes on
+        the session.
+        """
+        for prefix in ["http://", "https://"]:
+            self._session.mount(prefix, requests.adapters.HTTPAdapter(
+                pool_connections=self._pool_connections,
+                pool_maxsize=self._pool_maxsize))
+
+    def _evict_idle_connections(self):
+        """
+        Closes the pooled connections if the client has been idle for
+        longer than the idle timeout, as the server may have closed them.
+        The client is idle from the time the last response was read or
+        released, so slow responses do not count as idle time.
+        """
+        if (self._idle_timeout is not None and
+                self._last_request_time is not None and
+                time.time() - self._last_request_time > self._idle_timeout):
+            for adapter in self._session.adapters.values():
+                adapter.poolmanager.clear()
+            self._idle_evictions += 1
+
+    def _may_retry(self, policy, retry_number):
+        return (
+            policy is not None and retry_number < policy.max_retries and
+            (self._retry_budget is None or self._retry_budget.try_spend()))
+
+    def _send_request(self, method, url, data=None, request_kind=None):
+        """
+        Sends an HTTP request through the session's connection pools and
+        reads the body of a successful response, retrying as allowed by
+        the retry policy for its kind of request. A connection reset or a
+        corrupt or truncated body while the body is read is retried like a
+        failure to connect. Returns the response, the time its headers
+        arrived and its decompressed body, which is None if the response
+        was not successful.
+        """
+        policy = self._retry_policies.get(request_kind)
+        if self._retry_budget is not None:
+            self._retry_budget.record_request()
+        headers = None
+        if (data is not None and self._request_encoding is not None and
+                len(data) >= compression.MIN_COMPRESSED_SIZE):
+            data = compression.compress(
+                data.encode("utf-8"), self._request_encoding)
+            headers = {"Content-Encoding": self._request_encoding}
+        retry_number = 0
+        while True:
+            self._evict_idle_connections()
+            response = None
+            try:
+                response = self._session.request(
+                    method, url, params=self._get_http_parameters(),
+                    data=data, headers=headers, timeout=self._timeout,
+                    stream=True)
+                first_byte_time = time.time()
+                if (policy is None or
+                        response.status_code not in policy.retry_statuses or
+                        not self._may_retry(policy, retry_number)):
+                    body = None
+                    if response.status_code == requests.codes.ok:
+                        body = self._read_response_body(response)
+                    return response, first_byte_time, body
+                response.close()
+            except _RETRIED_ERRORS:
+                if not self._may_retry(policy, retry_number):
+                    raise
+                if response is not None:
+                    response.close()
+                    response = None
+            finally:
+                self._last_request_time = time.time()
+            delay = policy.get_delay(retry_number, response)
+            self._logger.warning(
+                "Retrying %s %s in %.1fs (retry %d of %d)", method, url,
+                delay, retry_number + 1, policy.max_retries)
+            time.sleep(delay)
+            retry_number += 1
+
+    def _read_response_body(self, response):
+        """
+        Reads the body of the specified response, decompressing it chunk
+        by chunk as it arrives if it has a content encoding we negotiated,
+        and counts its compressed and uncompressed bytes.
+        """
+        decoder = compression.get_decoder(
+            response.headers.get("Content-Encoding"))
+        if decoder is None:
+            body = response.content
+            compressed_bytes = len(body)
+        else:
+            chunks = []
+            compressed_bytes = 0
+            for chunk in response.raw.stream(
+                    self._read_chunk_size, decode_content=False):
+                compressed_bytes += len(chunk)
+                chunks.append(decoder.decompress(chunk))
+            chunks.append(decoder.flush())
+            body = b"".join(chunks)
+        with self._bytes_lock:
+            self._compressed_bytes_received += compressed_bytes
+            self._uncompressed_bytes_received += len(body)
+        return body
+
+    def get_pool_stats(self):
+        """
+        Returns statistics about the connection pools of this client, as a
+        dictionary holding the number of pools, the number of connections
+        opened, the number of requests sent, the number of idle
+        connections now held open for reuse and the number of times idle
+        connections were evicted.
+        """
+        stats = {
+            "pools": 0, "connections_opened": 0, "requests": 0,
+            "idle_connections": 0, "idle_evictions": self._idle_evictions}
+        for adapter in self._session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats["pools"] += 1
+                stats["connections_opened"] += pool.num_connections
+                stats["requests"] += pool.num_requests
+                if pool.pool is not None:
+                    stats["idle_connections"] += sum(
+                        1 for conn in list(pool.pool.queue)
+                        if conn is not None)
+        return stats
 
     def _check_response_status(self, response):
         """
@@ -1054,62 +1845,131 @@ class HttpClient(AbstractClient):
         """
         return {}
 
-    def _run_http_get_request(
-            self, path, protocol_response_class):
+    def _run_http_request(
+            self, method, path, protocol_response_class, data=None,
+            request_kind=None, endpoint=None):
+        """
+        Sends a request to the specified path and returns the response
+        deserialized as an instance of protocol_response_class. See
+        :meth:`_run_measured_http_request`.
+        """
+        response_object, _ = self._run_measured_http_request(
+            method, path, protocol_response_class, data=data,
+            request_kind=request_kind, endpoint=endpoint)
+        return response_object
+
+    def _run_measured_http_request(
+            self, method, path, protocol_response_class, data=None,
+            request_kind=None, endpoint=None):
+        """
+        Sends a request to the specified path and returns the response
+        deserialized as an instance of protocol_response_class, together
+        with the number of bytes of its decompressed body, as a
+        (response, num_bytes) pair. The request and the decoding of its
+        response are reported to the metrics hook, if one is set, under
+        the specified endpoint, which defaults to the path.
+        """
         url = posixpath.join(self._url_prefix, path)
-        response = self._session.get(url, params=self._get_http_parameters())
-        self._check_response_status(response)
-        return self._deserialize_response(
-            response.text, protocol_response_class,
+        self._logger.debug("url:{}".format(url))
+        metrics = self._metrics
+        endpoint = endpoint or path
+        start_time = time.time()
+        first_byte_time = None
+        try:
+            response, first_byte_time, response_data = self._send_request(
+                method, url, data=data, request_kind=request_kind)
+            self._check_response_status(response)
+        except Exception as error:
+            if metrics is not None:
+                metrics.record_request(
+                    endpoint, start_time, first_byte_time, time.time(), 0,
+                    error)
+            raise
+        end_time = time.time()
+        response_object = self._deserialize_response(
+            response_data, protocol_response_class,
             self._get_response_mimetype(response))
+        if metrics is not None:
+            metrics.record_request(
+                endpoint, start_time, first_byte_time, end_time,
+                len(response_data))
+            metrics.record_decode(
+                endpoint, end_time, time.time(), len(response_data))
+        return response_object, len(response_data)
+
+    def _run_http_get_request(
+            self, path, protocol_response_class):
+        return self._run_http_request(
+            "GET", path, protocol_response_class, request_kind=retry.GET)
 
     def _run_http_post_request(
             self, protocol_request, path, protocol_response_class):
-        url = posixpath.join(self._url_prefix, path)
-        self._logger.debug("url:{}".format(url))
         data = protocol.toJson(protocol_request)
         self._logger.debug("request:{}".format(data))
-        response = self._session.post(
-            url, params=self._get_http_parameters(), data=data)
-        self._check_response_status(response)
-        return self._deserialize_response(
-            response.text, protocol_response_class,
-            self._get_response_mimetype(response))
+        return self._run_http_request(
+            "POST", path, protocol_response_class, data=data,
+            request_kind=retry.POST)
 
     def _run_search_page_request(
             self, protocol_request, object_name, protocol_response_class):
-        url = posixpath.join(self._url_prefix, object_name + '/search')
-        self._logger.debug("url:{}".format(url))
+        response_object, _ = self._run_measured_search_page_request(
+            protocol_request, object_name, protocol_response_class)
+        return response_object
+
+    def _run_measured_search_page_request(
+            self, protocol_request, object_name, protocol_response_class):
         data = protocol.toJson(protocol_request)
         self._logger.debug("request:{}".format(data))
-        response = self._session.post(
-            url, params=self._get_http_parameters(), data=data)
-        self._logger.debug("response:{}".format(response))
-        self._check_response_status(response)
-        return self._deserialize_response(
-            response.text, protocol_response_class,
-            self._get_response_mimetype(response))
+        return self._run_measured_http_request(
+            "POST", object_name + '/search', protocol_response_class,
+            data=data, request_kind=retry.SEARCH)
+
+    def _get_credentials(self):
+        """
+        Returns the credentials that requests may be authorized by: the
+        Authorization header, the authentication key and the cookies of
+        the session.
+        """
+        return [
+            self._session.headers.get("Authorization"),
+            self._authentication_key] + sorted(
+                "{}={}".format(cookie.name, cookie.value)
+                for cookie in self._session.cookies)
+
+    def _get_cache_key(self, url):
+        """
+        Returns the key under which the response from the specified URL is
+        cached. Objects are cached separately for each set of credentials,
+        as users may be authorized to see different data.
+        """
+        credentials_digest = hashlib.sha256(
+            json.dumps(self._get_credentials()).encode("utf-8")).hexdigest()
+        return "{} {}".format(url, credentials_digest)
 
     def _run_get_request(self, object_name, protocol_response_class, id_):
         url_suffix = "{object_name}/{id}".format(
             object_name=object_name, id=id_)
-        url = posixpath.join(self._url_prefix, url_suffix)
-        response = self._session.get(url, params=self._get_http_parameters())
-        self._check_response_status(response)
-        return self._deserialize_response(
-            response.text, protocol_response_class,
-            self._get_response_mimetype(response))
+        if self._response_cache is not None:
+            cache_key = self._get_cache_key(
+                posixpath.join(self._url_prefix, url_suffix))
+            data = self._response_cache.get(cache_key, object_name)
+            if data is not None:
+                response_object = protocol_response_class()
+                response_object.ParseFromString(data)
+                return response_object
+        response_object = self._run_http_request(
+            "GET", url_suffix, protocol_response_class,
+            request_kind=retry.GET, endpoint=object_name + "/{id}")
+        if self._response_cache is not None:
+            self._response_cache.put(
+                cache_key, object_name, response_object.SerializeToString())
+        return response_object
 
     def _run_list_reference_bases_page_request(self, request):
-        url_suffix = "listreferencebases"
-        url = posixpath.join(self._url_prefix, url_suffix)
-        response = self._session.post(
-            url, params=self._get_http_parameters(),
-            data=protocol.toJson(request))
-        self._check_response_status(response)
-        return self._deserialize_response(
-            response.text, protocol.ListReferenceBasesResponse,
-            self._get_response_mimetype(response))
+        return self._run_http_request(
+            "POST", "listreferencebases",
+            protocol.ListReferenceBasesResponse,
+            data=protocol.toJson(request), request_kind=retry.LIST)
 
 
 class OidcClient(HttpClient):
@@ -1142,20 +2002,50 @@ class OidcClient(HttpClient):
                                       auto_refresh_url=refresh_endpoint,
                                       auto_refresh_kwargs=self._extra,
                                       token_updater=self._token_saver)
+        self._mount_http_adapters()
 
     def _token_saver(self, token):
         self._token = token
         return token
 
+    def _get_credentials(self):
+        """
+        Returns the credentials of the session, including its OAuth2
+        access token, which is not one of the session's headers. A
+        refreshed token gets responses cached separately.
+        """
+        return super(OidcClient, self)._get_credentials() + [
+            self._token.get("access_token")]
+
 
 class LocalClient(AbstractClient):
+    """
+    A client that calls the methods of a server backend directly, within
+    the same process.
+
+    :param backend: The backend of the server.
+    :param str serialization: "application/protobuf" or
+        "application/json", the serialization protocol used for the
+        protobuf objects passed to and returned by the backend.
+    :param bool passthrough: Whether protocol objects are passed to the
+        backend and returned by it as they are, with a return mimetype of
+        None, rather than serialized. The backend must support this.
+    """
+    # The backend is called directly, so get requests are run one at a time
+    _max_get_concurrency = 1
 
-    def __init__(self, backend, serialization="application/protobuf"):
+    def __init__(
+            self, backend, serialization="application/protobuf",
+            passthrough=False):
         super(LocalClient, self).__init__(serialization=serialization)
         self._backend = backend
         self._serialization = serialization
         if self._serialization not in protocol.MIMETYPES:
             self._serialization = "application/protobuf"
+        self._passthrough = passthrough
+        self._return_mimetype = self._serialization
+        if passthrough:
+            self._return_mimetype = None
         self._get_method_map = {
             "callsets": self._backend.runGetCallSet,
             "datasets": self._backend.runGetDataset,
@@ -1209,25 +2099,41 @@ class LocalClient(AbstractClient):
             "expressionlevels": self._backend.runSearchExpressionLevels,
         }
 
+    def _encode_request(self, protocol_request):
+        """
+        Returns the specified request in the form passed to the backend.
+        """
+        if self._passthrough:
+            return protocol_request
+        return protocol.toJson(protocol_request)
+
     def _run_get_request(self, object_name, protocol_response_class, id_):
         get_method = self._get_method_map[object_name]
-        response_string = get_method(id_, self._serialization)
+        response_string = get_method(id_, self._return_mimetype)
         return self._deserialize_response(
             response_string, protocol_response_class, self._serialization)
 
     def _run_search_page_request(
             self, protocol_request, object_name, protocol_response_class):
+        response_object, _ = self._run_measured_search_page_request(
+            protocol_request, object_name, protocol_response_class)
+        return response_object
+
+    def _run_measured_search_page_request(
+            self, protocol_request, object_name, protocol_response_class):
         search_method = self._search_method_map[object_name]
-        response_string = search_method(protocol.toJson(protocol_request),
-                                        self._serialization)
-        return self._deserialize_response(
-                            response_string,
-                            protocol_response_class,
-                            self._serialization)
+        response_string = search_method(
+            self._encode_request(protocol_request), self._return_mimetype)
+        num_bytes = 0
+        if not isinstance(response_string, protocol_response_class):
+            num_bytes = len(response_string)
+        response_object = self._deserialize_response(
+            response_string, protocol_response_class, self._serialization)
+        return response_object, num_bytes
 
     def _run_list_reference_bases_page_request(self, request):
         response_string = self._backend.runListReferenceBases(
-            protocol.toJson(request), self._serialization)
+            self._encode_request(request), self._return_mimetype)
         return self._deserialize_response(
             response_string,
             protocol.ListReferenceBasesResponse,
@@ -1237,7 +2143,7 @@ class LocalClient(AbstractClient):
             self, path, protocol_response_class):
         if path == "info":
             response_string = self._backend.runGetInfo(
-                protocol.GetInfoRequest(), self._serialization)
+                protocol.GetInfoRequest(), self._return_mimetype)
             return self._deserialize_response(
                 response_string,
                 protocol_response_class,
@@ -1249,14 +2155,14 @@ class LocalClient(AbstractClient):
             self, protocol_request, path, protocol_response_class):
         if path == "announce":
             response_json = self._backend.runAddAnnouncement(
-                protocol.toJson(protocol_request))
+                self._encode_request(protocol_request))
             return self._deserialize_response(
                 response_json,
                 protocol_response_class,
                 self._serialization)
         elif path == "peers/list":
             response_json = self._backend.runListPeers(
-                protocol.toJson(protocol_request))
+                self._encode_request(protocol_request))
             return self._deserialize_response(
                 response_json,
                 protocol_response_class,
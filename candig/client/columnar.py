@@ -0,0 +1,206 @@
+"""
+Conversion of variant and genotype search results to Arrow record
+batches, and streaming of record batches to Parquet files.
+
+pyarrow is an optional dependency of the client, and is only needed for
+columnar output.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import candig.client.exceptions as exceptions
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise exceptions.DependencyNotInstalledException(
+            "Columnar output requires the pyarrow package")
+    return pyarrow
+
+
+def _variant_columns(pyarrow, variants):
+    """
+    Returns the names and arrays of the columns describing the specified
+    variants, in the order of the variants.
+    """
+    return [
+        ("id", pyarrow.array(
+            [variant.id for variant in variants], type=pyarrow.string())),
+        ("reference_name", pyarrow.array(
+            [variant.reference_name for variant in variants],
+            type=pyarrow.string())),
+        ("start", pyarrow.array(
+            [variant.start for variant in variants], type=pyarrow.int64())),
+        ("end", pyarrow.array(
+            [variant.end for variant in variants], type=pyarrow.int64())),
+        ("reference_bases", pyarrow.array(
+            [variant.reference_bases for variant in variants],
+            type=pyarrow.string())),
+        ("alternate_bases", pyarrow.array(
+            [list(variant.alternate_bases) for variant in variants],
+            type=pyarrow.list_(pyarrow.string()))),
+    ]
+
+
+def _record_batch(pyarrow, columns):
+    return pyarrow.RecordBatch.from_arrays(
+        [array for _, array in columns], [name for name, _ in columns])
+
+
+def variants_to_record_batch(variants, call_set_ids):
+    """
+    Returns an Arrow record batch with a row for each of the specified
+    Variants. The variant columns are followed by a column for each of the
+    specified call set IDs, named after it, holding the genotype of the
+    call of that call set as a list of allele indexes, or null if the
+    variant has no call for it.
+    """
+    pyarrow = _import_pyarrow()
+    columns = _variant_columns(pyarrow, variants)
+    column_indexes = {
+        call_set_id: index for index, call_set_id in enumerate(call_set_ids)}
+    genotypes = [[None] * len(variants) for _ in call_set_ids]
+    for row, variant in enumerate(variants):
+        for call in variant.calls:
+            index = column_indexes.get(call.call_set_id)
+            if index is not None:
+                genotypes[index][row] = list(call.genotype)
+    for call_set_id, column in zip(call_set_ids, genotypes):
+        columns.append((call_set_id, pyarrow.array(
+            column, type=pyarrow.list_(pyarrow.int32()))))
+    return _record_batch(pyarrow, columns)
+
+
+def genotypes_to_record_batch(genotypes, variants, call_set_ids):
+    """
+    Returns an Arrow record batch with a row for each variant of the
+    specified block of a genotype matrix, as yielded by
+    iter_genotype_blocks. The variant columns are followed by an int8
+    column for each call set, named after its ID, holding the values of
+    the :class:`candig.protocol.Genotype` enum.
+    """
+    pyarrow = _import_pyarrow()
+    columns = _variant_columns(pyarrow, variants)
+    ncallsets = len(call_set_ids)
+    values = list(genotypes.genotypes)
+    for column, call_set_id in enumerate(call_set_ids):
+        columns.append((call_set_id, pyarrow.array(
+            values[column::ncallsets], type=pyarrow.int8())))
+    return _record_batch(pyarrow, columns)
+
+
+def iter_variant_batches(variants, call_set_ids=None, batch_size=10000):
+    """
+    Returns an iterator over Arrow record batches of up to batch_size rows
+    holding the specified Variants. See :func:`variants_to_record_batch`.
+    If call_set_ids is None, the genotype columns are those of the call
+    sets of the first variant. A single empty batch is yielded if there
+    are no variants, so that the schema is still known.
+    """
+    _import_pyarrow()
+
+    def batches():
+        column_ids = call_set_ids
+        block = []
+        yielded = False
+        for variant in variants:
+            if column_ids is None:
+                column_ids = [call.call_set_id for call in variant.calls]
+            block.append(variant)
+            if len(block) >= batch_size:
+                yield variants_to_record_batch(block, column_ids)
+                yielded = True
+                block = []
+        if block or not yielded:
+            yield variants_to_record_batch(block, column_ids or [])
+    return batches()
+
+
+def iter_genotype_batches(blocks):
+    """
+    Returns an iterator over an Arrow record batch for each of the
+    specified blocks of a genotype matrix, as yielded by
+    iter_genotype_blocks. See :func:`genotypes_to_record_batch`.
+    """
+    _import_pyarrow()
+    return (
+        genotypes_to_record_batch(genotypes, variants, call_set_ids)
+        for genotypes, variants, call_set_ids in blocks)
+
+
+class ParquetBatchWriter(object):
+    """
+    Writes Arrow record batches to a Parquet file as they are produced.
+    Batches are buffered until they hold row_group_size rows, which are
+    then flushed to the file as one row group, so that only a row group
+    is held in memory at a time. The file is created with the schema of
+    the first batch.
+
+    :param where: The path of the file, or a writable binary file object.
+    :param int row_group_size: The number of rows in each row group.
+    :param str compression: The compression codec of the file.
+    """
+    def __init__(self, where, row_group_size=65536, compression="snappy"):
+        self._pyarrow = _import_pyarrow()
+        self._where = where
+        self._row_group_size = row_group_size
+        self._compression = compression
+        self._writer = None
+        self._batches = []
+        self._buffered_rows = 0
+        self.rows_written = 0
+
+    def write_batch(self, batch):
+        """
+        Writes the specified record batch to the file.
+        """
+        self._batches.append(batch)
+        self._buffered_rows += batch.num_rows
+        if self._buffered_rows >= self._row_group_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered batches to the file as a row group.
+        """
+        if not self._batches:
+            return
+        table = self._pyarrow.Table.from_batches(self._batches)
+        if self._writer is None:
+            self._writer = self._pyarrow.parquet.ParquetWriter(
+                self._where, table.schema, compression=self._compression)
+        self._writer.write_table(table)
+        self.rows_written += table.num_rows
+        self._batches = []
+        self._buffered_rows = 0
+
+    def close(self):
+        """
+        Flushes the buffered batches and closes the file.
+        """
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_parquet(batches, where, row_group_size=65536):
+    """
+    Writes the specified Arrow record batches to a Parquet file, flushing
+    a row group every row_group_size rows, and returns the number of rows
+    written.
+    """
+    with ParquetBatchWriter(where, row_group_size) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+    return writer.rows_written
@@ -0,0 +1,197 @@
+"""
+Negotiation and incremental decoding of compressed HTTP message bodies.
+
+Responses compressed with gzip or deflate can always be decoded. Brotli
+and Zstandard are also negotiated when the brotli and zstandard packages
+are installed.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import io
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+IDENTITY = "identity"
+GZIP = "gzip"
+DEFLATE = "deflate"
+BROTLI = "br"
+ZSTD = "zstd"
+
+# Request bodies smaller than this are sent uncompressed, as compressing
+# them saves little and costs the server a decoding step
+MIN_COMPRESSED_SIZE = 1024
+
+# The errors raised by decoders for a corrupt or truncated body
+DECODING_ERRORS = (zlib.error,)
+if brotli is not None:
+    DECODING_ERRORS += (getattr(brotli, "error", None) or brotli.Error,)
+if zstandard is not None:
+    DECODING_ERRORS += (zstandard.ZstdError,)
+
+
+class _ZlibDecoder(object):
+    """
+    Decodes a gzip or deflate body. Some servers send deflate bodies
+    without the zlib header that HTTP requires, so a deflate body that
+    does not start with one is decoded as raw deflate data. A body that
+    ends before its compressed stream does raises zlib.error on flush,
+    where zlib can tell.
+    """
+    def __init__(self, encoding):
+        self._encoding = encoding
+        self._decompressor = None
+        self._received_data = False
+        if encoding == GZIP:
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        self._received_data = self._received_data or bool(data)
+        if self._decompressor is None:
+            try:
+                self._decompressor = zlib.decompressobj()
+                return self._decompressor.decompress(data)
+            except zlib.error:
+                self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        if self._decompressor is None:
+            return b""
+        data = self._decompressor.flush()
+        # Decompress objects only report the end of the stream on Python 3
+        if self._received_data and not getattr(
+                self._decompressor, "eof", True):
+            raise zlib.error("The compressed body is truncated")
+        return data
+
+
+class _BrotliDecoder(object):
+    def __init__(self):
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data):
+        if hasattr(self._decompressor, "process"):
+            return self._decompressor.process(data)
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+class _ZstdDecoder(object):
+    def __init__(self):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b""
+
+
+class _ChainedDecoder(object):
+    """
+    Decodes a body to which several encodings were applied, undoing the
+    last one first.
+    """
+    def __init__(self, decoders):
+        self._decoders = decoders
+
+    def decompress(self, data):
+        for decoder in self._decoders:
+            data = decoder.decompress(data)
+        return data
+
+    def flush(self):
+        data = b""
+        for decoder in self._decoders:
+            data = decoder.decompress(data) + decoder.flush()
+        return data
+
+
+def available_encodings():
+    """
+    Returns the content encodings that can be decoded, most compact
+    first.
+    """
+    encodings = []
+    if zstandard is not None:
+        encodings.append(ZSTD)
+    if brotli is not None:
+        encodings.append(BROTLI)
+    encodings.extend([GZIP, DEFLATE])
+    return encodings
+
+
+def accept_encoding():
+    """
+    Returns the value of the Accept-Encoding header listing the content
+    encodings that can be decoded.
+    """
+    return ", ".join(available_encodings())
+
+
+def _get_single_decoder(encoding):
+    if encoding in (GZIP, "x-gzip"):
+        return _ZlibDecoder(GZIP)
+    if encoding == DEFLATE:
+        return _ZlibDecoder(DEFLATE)
+    if encoding == BROTLI and brotli is not None:
+        return _BrotliDecoder()
+    if encoding == ZSTD and zstandard is not None:
+        return _ZstdDecoder()
+    return None
+
+
+def get_decoder(content_encoding):
+    """
+    Returns a decoder for a body with the specified Content-Encoding,
+    whose decompress method takes each chunk of the body as it arrives
+    and returns the decoded data available so far, and whose flush method
+    returns any data left once the body is complete. Returns None if the
+    body is not encoded or uses an encoding that cannot be decoded.
+    """
+    encodings = [
+        encoding.strip().lower()
+        for encoding in (content_encoding or "").split(",")]
+    encodings = [
+        encoding for encoding in encodings
+        if encoding and encoding != IDENTITY]
+    if not encodings:
+        return None
+    decoders = []
+    for encoding in reversed(encodings):
+        decoder = _get_single_decoder(encoding)
+        if decoder is None:
+            return None
+        decoders.append(decoder)
+    if len(decoders) == 1:
+        return decoders[0]
+    return _ChainedDecoder(decoders)
+
+
+def compress(data, encoding):
+    """
+    Returns the specified request body compressed with the specified
+    encoding, which is gzip or deflate.
+    """
+    if encoding == GZIP:
+        buffer_ = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer_, mode="wb") as gzip_file:
+            gzip_file.write(data)
+        return buffer_.getvalue()
+    if encoding == DEFLATE:
+        return zlib.compress(data)
+    raise ValueError("Cannot compress requests with {}".format(encoding))
@@ -29,3 +29,9 @@ class ErrantRequestException(BaseClientException):
     """
     An error was encountered in the process of creating the request
     """
+
+
+class DependencyNotInstalledException(BaseClientException):
+    """
+    An optional package needed to fulfil the request is not installed
+    """
@@ -0,0 +1,176 @@
+"""
+Assembly of the genotype matrices returned by search_genotypes, and their
+NumPy representation.
+
+NumPy is an optional dependency of the client, and is only needed to
+request genotypes as arrays.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import candig.client.exceptions as exceptions
+
+import candig.schemas.protocol as protocol
+
+
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise exceptions.DependencyNotInstalledException(
+            "Genotype arrays require the numpy package")
+    return numpy
+
+
+class GenotypeArrays(object):
+    """
+    A genotype matrix held as NumPy arrays. The genotypes are a contiguous
+    int8 array of shape (nvariants, ncallsets) holding the values of the
+    :class:`candig.protocol.Genotype` enum, so that missing calls are
+    :data:`NA`. The call set IDs label the columns, and the variant IDs,
+    reference names, starts and ends are parallel arrays labelling the
+    rows.
+    """
+    NA = 6
+
+    def __init__(
+            self, genotypes, call_set_ids, variant_ids, reference_names,
+            starts, ends):
+        self.genotypes = genotypes
+        self.call_set_ids = call_set_ids
+        self.variant_ids = variant_ids
+        self.reference_names = reference_names
+        self.starts = starts
+        self.ends = ends
+
+    @property
+    def shape(self):
+        return self.genotypes.shape
+
+
+def to_arrays(genotypes, variants, call_set_ids):
+    """
+    Returns a :class:`GenotypeArrays` holding the specified genotype
+    matrix, variants and call set IDs, as returned by search_genotypes.
+    The genotypes are copied straight from the repeated enum field without
+    creating a list of Python objects.
+    """
+    numpy = _import_numpy()
+    ncallsets = len(call_set_ids)
+    nvariants = len(variants)
+    matrix = numpy.fromiter(
+        genotypes.genotypes, dtype=numpy.int8,
+        count=len(genotypes.genotypes))
+    return GenotypeArrays(
+        matrix.reshape((nvariants, ncallsets)),
+        numpy.array(list(call_set_ids), dtype=object),
+        numpy.array([variant.id for variant in variants], dtype=object),
+        numpy.array(
+            [variant.reference_name for variant in variants], dtype=object),
+        numpy.fromiter(
+            (variant.start for variant in variants), dtype=numpy.int64,
+            count=nvariants),
+        numpy.fromiter(
+            (variant.end for variant in variants), dtype=numpy.int64,
+            count=nvariants))
+
+
+def merge_blocks(blocks):
+    """
+    Returns the (genotypes, variants, call_set_ids) tuple of the genotype
+    matrix formed by stacking the rows of the specified blocks, as yielded
+    by iter_genotype_blocks. Each block is appended to the matrix as it is
+    consumed, so that only one block is held alongside the result.
+    """
+    merged = protocol.SearchGenotypesResponse()
+    for index, (matrix, variants, call_set_ids) in enumerate(blocks):
+        if index == 0:
+            merged.call_set_ids.extend(call_set_ids)
+            merged.genotypes.nindividuals = matrix.nindividuals
+        merged.genotypes.nvariants += matrix.nvariants
+        merged.genotypes.genotypes.extend(matrix.genotypes)
+        merged.variants.extend(variants)
+    return merged.genotypes, merged.variants, merged.call_set_ids
+
+
+class GenotypeArraysBuilder(object):
+    """
+    Stacks the rows of :class:`GenotypeArrays` blocks, which must share
+    their call sets, as they are appended. The rows are copied into output
+    arrays that are preallocated and grown geometrically, then trimmed to
+    size in place by build(), so that each block can be dropped once it
+    has been appended rather than held until the end.
+    """
+    # The names of the arrays of GenotypeArrays holding a row per variant
+    _row_arrays = [
+        "genotypes", "variant_ids", "reference_names", "starts", "ends"]
+
+    def __init__(self):
+        self._first_block = None
+        self._arrays = None
+        self._nvariants = 0
+
+    def _allocate(self, capacity):
+        numpy = _import_numpy()
+        block = self._first_block
+        self._arrays = {}
+        for name in self._row_arrays:
+            array = getattr(block, name)
+            self._arrays[name] = numpy.empty(
+                (capacity,) + array.shape[1:], dtype=array.dtype)
+            self._arrays[name][:len(array)] = array
+
+    def append(self, block):
+        """
+        Appends the rows of the specified :class:`GenotypeArrays`.
+        """
+        if self._first_block is None:
+            self._first_block = block
+            self._nvariants = block.shape[0]
+            return
+        nvariants = self._nvariants + block.shape[0]
+        if self._arrays is None:
+            self._allocate(2 * nvariants)
+        capacity = len(self._arrays["starts"])
+        if nvariants > capacity:
+            capacity = max(2 * capacity, nvariants)
+            for array in self._arrays.values():
+                array.resize(
+                    (capacity,) + array.shape[1:], refcheck=False)
+        for name in self._row_arrays:
+            self._arrays[name][self._nvariants:nvariants] = getattr(
+                block, name)
+        self._nvariants = nvariants
+
+    def build(self):
+        """
+        Returns the :class:`GenotypeArrays` holding the rows appended so
+        far. No more blocks can be appended afterwards.
+        """
+        if self._first_block is None:
+            raise ValueError("No genotype blocks were appended")
+        if self._arrays is None:
+            return self._first_block
+        for array in self._arrays.values():
+            array.resize(
+                (self._nvariants,) + array.shape[1:], refcheck=False)
+        arrays = self._arrays
+        self._arrays = None
+        return GenotypeArrays(
+            arrays["genotypes"], self._first_block.call_set_ids,
+            arrays["variant_ids"], arrays["reference_names"],
+            arrays["starts"], arrays["ends"])
+
+
+def concatenate_arrays(blocks):
+    """
+    Returns a :class:`GenotypeArrays` stacking the rows of the specified
+    :class:`GenotypeArrays` blocks, which must share their call sets. The
+    blocks are consumed one at a time; see
+    :class:`GenotypeArraysBuilder`.
+    """
+    builder = GenotypeArraysBuilder()
+    for block in blocks:
+        builder.append(block)
+    return builder.build()
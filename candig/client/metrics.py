@@ -0,0 +1,254 @@
+"""
+Per-endpoint metrics of the requests made by a client.
+
+A client reports each request, the decoding of each response and each
+page of results to the metrics hook set with
+:meth:`candig.client.client.AbstractClient.set_metrics`. The hook is
+given the times at which each step started and ended, so that it can
+aggregate them, as :class:`MetricsRecorder` does, or lay them out on a
+timeline.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import bisect
+import collections
+import json
+import threading
+
+# The upper bounds in seconds of the buckets of the timing histograms
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+    60.0)
+
+
+class MetricsHook(object):
+    """
+    The interface of the metrics hook of a client, whose methods do
+    nothing. Subclasses override the methods for the events they record.
+    The methods may be called from several threads at once. Times are
+    those of :func:`time.time`.
+    """
+    def record_request(
+            self, endpoint, start_time, first_byte_time, end_time,
+            num_bytes, error=None):
+        """
+        Records a request to the specified endpoint, such as
+        "variants/search", "variants/{id}" or "listreferencebases". The
+        first byte time is when the response headers were received, or
+        None if no response was received, and the end time is when the
+        whole body was read. The error is the exception raised if the
+        request failed.
+        """
+
+    def record_decode(self, endpoint, start_time, end_time, num_bytes):
+        """
+        Records the decoding of a response body of the specified size
+        received from the specified endpoint.
+        """
+
+    def record_page(self, endpoint, num_results):
+        """
+        Records a page holding the specified number of results received
+        from the specified endpoint.
+        """
+
+
+class Histogram(object):
+    """
+    A histogram of observed values, counted in buckets with the specified
+    upper bounds and an implicit last bucket holding all larger values.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Adds the specified value to the histogram.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self):
+        """
+        Returns a list of (upper bound, count) pairs holding the number of
+        values no greater than each bound, ending with a bound of
+        infinity.
+        """
+        bounds = list(self.buckets) + [float("inf")]
+        counts = []
+        total = 0
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            counts.append((bound, total))
+        return counts
+
+    def to_dict(self):
+        return {
+            "buckets": list(self.buckets), "counts": list(self.counts),
+            "count": self.count, "sum": self.sum}
+
+
+class EndpointMetrics(object):
+    """
+    The metrics of the requests made to a single endpoint.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.requests = 0
+        self.errors = 0
+        self.pages = 0
+        self.results = 0
+        self.bytes = 0
+        self.time_to_first_byte = Histogram(buckets)
+        self.latency = Histogram(buckets)
+        self.decode_time = Histogram(buckets)
+
+    def to_dict(self):
+        return {
+            "requests": self.requests, "errors": self.errors,
+            "pages": self.pages, "results": self.results,
+            "bytes": self.bytes,
+            "time_to_first_byte": self.time_to_first_byte.to_dict(),
+            "latency": self.latency.to_dict(),
+            "decode_time": self.decode_time.to_dict()}
+
+
+# The name, description and EndpointMetrics attribute of each metric
+_COUNTERS = [
+    ("candig_client_requests_total", "The number of requests sent.",
+     "requests"),
+    ("candig_client_request_errors_total", "The number of failed requests.",
+     "errors"),
+    ("candig_client_pages_total", "The number of pages of results received.",
+     "pages"),
+    ("candig_client_results_total",
+     "The number of results received in pages.", "results"),
+    ("candig_client_response_bytes_total",
+     "The number of response body bytes received.", "bytes"),
+]
+_HISTOGRAMS = [
+    ("candig_client_time_to_first_byte_seconds",
+     "The time until the response headers were received.",
+     "time_to_first_byte"),
+    ("candig_client_request_latency_seconds",
+     "The time until the whole response body was received.", "latency"),
+    ("candig_client_decode_seconds",
+     "The time taken to decode response bodies.", "decode_time"),
+]
+
+
+def _escape_label(value):
+    return (
+        value.replace("\\", "\\\\").replace("\"", "\\\"")
+        .replace("\n", "\\n"))
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRecorder(MetricsHook):
+    """
+    A metrics hook that keeps, for each endpoint, the number of requests,
+    failed requests, pages, results and response bytes, and histograms of
+    the time to first byte, the total latency and the decode time of its
+    requests. The metrics can be exported as a JSON snapshot or in the
+    Prometheus text format.
+
+    :param buckets: The upper bounds in seconds of the histogram buckets.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._endpoints = collections.OrderedDict()
+
+    def _get_endpoint(self, endpoint):
+        metrics = self._endpoints.get(endpoint)
+        if metrics is None:
+            metrics = EndpointMetrics(self._buckets)
+            self._endpoints[endpoint] = metrics
+        return metrics
+
+    def record_request(
+            self, endpoint, start_time, first_byte_time, end_time,
+            num_bytes, error=None):
+        with self._lock:
+            metrics = self._get_endpoint(endpoint)
+            metrics.requests += 1
+            metrics.bytes += num_bytes
+            if error is not None:
+                metrics.errors += 1
+                return
+            metrics.time_to_first_byte.observe(first_byte_time - start_time)
+            metrics.latency.observe(end_time - start_time)
+
+    def record_decode(self, endpoint, start_time, end_time, num_bytes):
+        with self._lock:
+            self._get_endpoint(endpoint).decode_time.observe(
+                end_time - start_time)
+
+    def record_page(self, endpoint, num_results):
+        with self._lock:
+            metrics = self._get_endpoint(endpoint)
+            metrics.pages += 1
+            metrics.results += num_results
+
+    def get_endpoints(self):
+        """
+        Returns the endpoints that metrics have been recorded for.
+        """
+        with self._lock:
+            return list(self._endpoints.keys())
+
+    def snapshot(self):
+        """
+        Returns a dictionary mapping each endpoint to a dictionary of its
+        metrics.
+        """
+        with self._lock:
+            return collections.OrderedDict(
+                (endpoint, metrics.to_dict())
+                for endpoint, metrics in self._endpoints.items())
+
+    def to_json(self):
+        """
+        Returns a snapshot of the metrics as a JSON string.
+        """
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format, with
+        an endpoint label on each sample.
+        """
+        with self._lock:
+            endpoints = [
+                ('endpoint="{}"'.format(_escape_label(endpoint)), metrics)
+                for endpoint, metrics in self._endpoints.items()]
+            lines = []
+            for name, description, attribute in _COUNTERS:
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} counter".format(name))
+                for label, metrics in endpoints:
+                    lines.append("{}{{{}}} {}".format(
+                        name, label, getattr(metrics, attribute)))
+            for name, description, attribute in _HISTOGRAMS:
+                lines.append("# HELP {} {}".format(name, description))
+                lines.append("# TYPE {} histogram".format(name))
+                for label, metrics in endpoints:
+                    histogram = getattr(metrics, attribute)
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                            name, label, _format_value(bound), count))
+                    lines.append("{}_sum{{{}}} {}".format(
+                        name, label, _format_value(histogram.sum)))
+                    lines.append("{}_count{{{}}} {}".format(
+                        name, label, histogram.count))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,328 @@
+"""
+Helpers for iterating over paged responses from the server.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import candig.schemas.protocol as protocol
+
+
+class BackgroundIterator(object):
+    """
+    Consumes the specified iterable in a background thread, keeping at
+    most max_buffered items waiting to be taken by the caller, or any
+    number of them if max_buffered is None. Any exception raised while
+    producing items is re-raised in the calling thread once the items
+    produced before it have been consumed.
+
+    :param iterable: The iterable to consume in the background.
+    :param int max_buffered: The maximum number of items held in memory
+        ahead of the caller, or None for no limit.
+    """
+    _poll_interval = 0.1
+
+    def __init__(self, iterable, max_buffered=1):
+        maxsize = 0
+        if max_buffered is not None:
+            maxsize = max(1, max_buffered)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stopped = threading.Event()
+        self._done = False
+        self._thread = threading.Thread(
+            target=self._produce, args=(iterable,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, entry):
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(entry, timeout=self._poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put((True, item)):
+                    return
+        except Exception as exception:
+            self._put((False, exception))
+        else:
+            self._put((False, None))
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._done:
+            raise StopIteration
+        has_item, value = self._queue.get()
+        if has_item:
+            return value
+        self._done = True
+        if value is not None:
+            raise value
+        raise StopIteration
+
+    __next__ = next
+
+    def close(self):
+        """
+        Stops the background thread and discards any buffered items.
+        """
+        self._done = True
+        self._stopped.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+
+def split_region(start, end, shards):
+    """
+    Splits the half-open region [start, end) into at most the specified
+    number of contiguous, non-empty sub-regions of near equal length,
+    returned as (start, end) pairs in coordinate order.
+    """
+    shards = max(1, min(shards, end - start))
+    bounds = [
+        start + (end - start) * index // shards
+        for index in range(shards + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def merge_shards(shards, start_key):
+    """
+    Yields the records of each of the specified shards in turn. The shards
+    are (shard_start, records) pairs in coordinate order, so that the
+    records are yielded in coordinate order too. A record overlapping the
+    boundary between two shards is returned by both of them; the copy from
+    the later shard, which starts before that shard does, is skipped.
+
+    :param shards: The (shard_start, records) pairs to merge.
+    :param start_key: A function returning the start position of a record.
+    """
+    for index, (shard_start, records) in enumerate(shards):
+        for record in records:
+            if index == 0 or start_key(record) >= shard_start:
+                yield record
+
+
+class SearchCursor(object):
+    """
+    The position of a search: the request for the page of results being
+    consumed, including its page token, and the number of results of that
+    page already consumed. A cursor can be saved as JSON and the search
+    resumed from it later with
+    :meth:`candig.client.client.AbstractClient.resume_search`.
+
+    :param str object_name: The name of the objects searched for, as used
+        in the request path.
+    :param protocol_request: The request for the page being consumed.
+    :param protocol_response_class: The class of the responses.
+    :param int offset: The number of results of the page consumed.
+    :param bool done: Whether every result of the search was consumed.
+    """
+    def __init__(
+            self, object_name, protocol_request, protocol_response_class,
+            offset=0, done=False):
+        self.object_name = object_name
+        self.protocol_request = protocol_request.__class__()
+        self.protocol_request.CopyFrom(protocol_request)
+        self.protocol_response_class = protocol_response_class
+        self.offset = offset
+        self.done = done
+
+    def to_json(self):
+        """
+        Returns the cursor as a JSON string.
+        """
+        return json.dumps({
+            "objectName": self.object_name,
+            "requestClass": self.protocol_request.__class__.__name__,
+            "responseClass": self.protocol_response_class.__name__,
+            "request": json.loads(protocol.toJson(self.protocol_request)),
+            "offset": self.offset,
+            "done": self.done})
+
+    @classmethod
+    def from_json(cls, json_string):
+        """
+        Returns the cursor saved as the specified JSON string.
+        """
+        cursor_json = json.loads(json_string)
+        protocol_request = protocol.fromJson(
+            json.dumps(cursor_json["request"]),
+            getattr(protocol, cursor_json["requestClass"]))
+        return cls(
+            cursor_json["objectName"], protocol_request,
+            getattr(protocol, cursor_json["responseClass"]),
+            cursor_json["offset"], cursor_json["done"])
+
+
+class SearchIterator(object):
+    """
+    An iterator over the results of a search, which keeps track of its
+    position so that it can be saved with :meth:`get_cursor`.
+
+    :param pages: An iterator over (page_token, response) pairs, giving
+        each page of results with the token that requested it.
+    :param SearchCursor cursor: The position the search starts from. The
+        results of the first page before its offset are skipped.
+    """
+    def __init__(self, pages, cursor):
+        self._pages = pages
+        self._cursor = cursor
+        self._value_list_name = protocol.getValueListName(
+            cursor.protocol_response_class)
+        self._page_token = cursor.protocol_request.page_token
+        self._offset = cursor.offset
+        self._skip = cursor.offset
+        self._done = cursor.done
+        self._values = iter(())
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            for value in self._values:
+                self._offset += 1
+                return value
+            if self._done:
+                raise StopIteration
+            try:
+                page_token, response_object = next(self._pages)
+            except StopIteration:
+                self._done = True
+                raise
+            values = getattr(response_object, self._value_list_name)
+            self._page_token = page_token
+            self._offset = self._skip
+            self._values = iter(values[self._skip:])
+            self._skip = 0
+
+    __next__ = next
+
+    def get_cursor(self):
+        """
+        Returns a :class:`SearchCursor` for the current position, from
+        which a new iterator yields the results not yet consumed.
+        """
+        protocol_request = self._cursor.protocol_request.__class__()
+        protocol_request.CopyFrom(self._cursor.protocol_request)
+        protocol_request.page_token = self._page_token
+        return SearchCursor(
+            self._cursor.object_name, protocol_request,
+            self._cursor.protocol_response_class, self._offset, self._done)
+
+    def close(self):
+        """
+        Stops requesting pages of results.
+        """
+        self._done = True
+        if hasattr(self._pages, "close"):
+            self._pages.close()
+
+    def __del__(self):
+        self.close()
+
+
+class PageSizeController(object):
+    """
+    Adapts the page size requested by each kind of search to the cost of
+    its results. After each page the time taken and the number of bytes
+    received are used to estimate the cost of a single result, and the
+    page size of that endpoint is moved toward the size at which a page
+    would meet the target latency and target size in bytes, by at most a
+    factor of max_step per page. Cheap objects are thus fetched in large
+    pages and expensive ones, such as reads, in small pages.
+
+    The page size stays within min_page_size and max_page_size. If the
+    server returns fewer results than requested but has more to give, it
+    has capped the page size, and that cap becomes the maximum for the
+    endpoint.
+
+    :param int initial_page_size: The page size of the first request to
+        each endpoint.
+    :param int min_page_size: The smallest page size requested.
+    :param int max_page_size: The largest page size requested.
+    :param float target_latency: The number of seconds a page should take,
+        or None to ignore latency.
+    :param int target_bytes: The number of bytes a page should contain, or
+        None to ignore the size of pages.
+    :param float max_step: The largest factor by which the page size of an
+        endpoint changes from one page to the next.
+    """
+    def __init__(
+            self, initial_page_size=100, min_page_size=10,
+            max_page_size=10000, target_latency=1.0, target_bytes=None,
+            max_step=2.0):
+        self._initial_page_size = initial_page_size
+        self._min_page_size = min_page_size
+        self._max_page_size = max_page_size
+        self._target_latency = target_latency
+        self._target_bytes = target_bytes
+        self._max_step = max_step
+        self._page_sizes = {}
+        self._server_max_page_sizes = {}
+        self._lock = threading.Lock()
+
+    def _clamp(self, endpoint, page_size):
+        max_page_size = min(
+            self._max_page_size,
+            self._server_max_page_sizes.get(endpoint, self._max_page_size))
+        return int(max(self._min_page_size, min(max_page_size, page_size)))
+
+    def get_page_size(self, endpoint):
+        """
+        Returns the page size to request from the specified endpoint.
+        """
+        with self._lock:
+            return self._clamp(endpoint, self._page_sizes.get(
+                endpoint, self._initial_page_size))
+
+    def record_page(
+            self, endpoint, page_size, num_results, latency, num_bytes,
+            more_results):
+        """
+        Records a page of results received from the specified endpoint,
+        and adapts the page size of the endpoint to it.
+
+        :param str endpoint: The endpoint the page was requested from.
+        :param int page_size: The page size that was requested.
+        :param int num_results: The number of results in the page.
+        :param float latency: The number of seconds the page took.
+        :param int num_bytes: The number of bytes received for the page.
+        :param bool more_results: Whether the server has more results.
+        """
+        if num_results == 0 or (num_results < page_size and not more_results):
+            # The final page of a search tells nothing of larger pages
+            return
+        ideal_page_size = None
+        if self._target_latency is not None and latency > 0:
+            ideal_page_size = self._target_latency * num_results / latency
+        if self._target_bytes is not None and num_bytes > 0:
+            by_size = self._target_bytes * num_results / num_bytes
+            if ideal_page_size is None or by_size < ideal_page_size:
+                ideal_page_size = by_size
+        with self._lock:
+            if num_results < page_size:
+                self._server_max_page_sizes[endpoint] = num_results
+            if ideal_page_size is None:
+                return
+            self._page_sizes[endpoint] = self._clamp(endpoint, max(
+                page_size / self._max_step,
+                min(page_size * self._max_step, ideal_page_size)))
@@ -0,0 +1,135 @@
+"""
+Policies for retrying requests that fail for transient reasons.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import email.utils
+import random
+import threading
+import time
+
+GET = "get"
+SEARCH = "search"
+LIST = "list"
+POST = "post"
+
+
+class RetryPolicy(object):
+    """
+    Describes when and how often a failed request is retried. A request is
+    retried if the server responds with one of the retry statuses or the
+    connection fails. The delay before each retry grows exponentially from
+    backoff_factor up to max_backoff, and is drawn uniformly between zero
+    and that bound if jitter is enabled, so that many clients failing at
+    once do not retry in lockstep. A Retry-After header sent by the server
+    is honoured in place of the backoff, up to max_retry_after seconds.
+
+    :param int max_retries: The maximum number of retries of a request.
+    :param float backoff_factor: The delay in seconds before the first
+        retry, which doubles for each later retry.
+    :param float max_backoff: The maximum delay in seconds between retries.
+    :param bool jitter: Whether the delays are randomised.
+    :param retry_statuses: The HTTP status codes to retry.
+    :param float max_retry_after: The maximum delay in seconds honoured
+        from a Retry-After header.
+    """
+    def __init__(
+            self, max_retries=3, backoff_factor=0.5, max_backoff=30,
+            jitter=True, retry_statuses=(429, 500, 502, 503, 504),
+            max_retry_after=120):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.max_retry_after = max_retry_after
+
+    def get_backoff(self, retry_number):
+        """
+        Returns the delay in seconds before the specified retry, counting
+        from zero.
+        """
+        backoff = min(
+            self.max_backoff, self.backoff_factor * (2 ** retry_number))
+        if self.jitter:
+            backoff = random.uniform(0, backoff)
+        return backoff
+
+    def get_delay(self, retry_number, response=None):
+        """
+        Returns the delay in seconds before the specified retry of a
+        request that received the specified response, which is None if the
+        connection failed.
+        """
+        if response is not None:
+            retry_after = parse_retry_after(
+                response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_retry_after)
+        return self.get_backoff(retry_number)
+
+
+class RetryBudget(object):
+    """
+    Limits the retries made by a client to a fraction of its requests, so
+    that retries cannot multiply the load on a server that is failing.
+    Retries are allowed while they number at most min_retries plus ratio
+    times the number of requests made.
+
+    :param float ratio: The fraction of requests that may be retried.
+    :param int min_retries: The number of retries always allowed.
+    """
+    def __init__(self, ratio=0.2, min_retries=10):
+        self._ratio = ratio
+        self._min_retries = min_retries
+        self._requests = 0
+        self._retries = 0
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        """
+        Records that a new request was made.
+        """
+        with self._lock:
+            self._requests += 1
+
+    def try_spend(self):
+        """
+        Returns True and records a retry if the budget allows one.
+        """
+        with self._lock:
+            allowed = self._min_retries + self._ratio * self._requests
+            if self._retries + 1 > allowed:
+                return False
+            self._retries += 1
+            return True
+
+
+def default_policies(max_retries=3):
+    """
+    Returns a dictionary of the default retry policies for the idempotent
+    kinds of request: gets, search pages and pages of reference bases.
+    """
+    return {
+        kind: RetryPolicy(max_retries=max_retries)
+        for kind in [GET, SEARCH, LIST]}
+
+
+def parse_retry_after(value):
+    """
+    Returns the number of seconds to wait given by the specified value of
+    a Retry-After header, which is either a number of seconds or an HTTP
+    date, or None if there is no valid value.
+    """
+    if not value:
+        return None
+    try:
+        return max(0, float(value))
+    except ValueError:
+        pass
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(0, email.utils.mktime_tz(parsed) - time.time())
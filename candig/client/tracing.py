@@ -0,0 +1,110 @@
+"""
+A timeline of the requests, decodes and output writes made by a client
+and the CLI, in the Chrome trace event format.
+
+The trace can be loaded into chrome://tracing or https://ui.perfetto.dev
+to see where the time of a slow search or export goes.
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import threading
+import time
+
+import candig.client.metrics as metrics
+
+
+class Tracer(metrics.MetricsHook):
+    """
+    A metrics hook that records each request, response decode and page of
+    results reported by a client, and each write of output reported by a
+    :class:`candig.client.cli.OutputWriter`, as an event on a timeline of
+    the thread that made it. Times are given in microseconds since the
+    tracer was created.
+    """
+    def __init__(self):
+        self._start_time = time.time()
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events = []
+        self._thread_names = {}
+
+    def _add_event(self, event):
+        thread = threading.current_thread()
+        event["pid"] = self._pid
+        event["tid"] = thread.ident
+        with self._lock:
+            self._thread_names.setdefault(thread.ident, thread.name)
+            self._events.append(event)
+
+    def _get_timestamp(self, event_time):
+        return (event_time - self._start_time) * 1e6
+
+    def _add_span(self, name, category, start_time, end_time, args):
+        self._add_event({
+            "name": name, "cat": category, "ph": "X",
+            "ts": self._get_timestamp(start_time),
+            "dur": (end_time - start_time) * 1e6, "args": args})
+
+    def record_request(
+            self, endpoint, start_time, first_byte_time, end_time,
+            num_bytes, error=None):
+        args = {"bytes": num_bytes}
+        if first_byte_time is not None:
+            args["time_to_first_byte"] = first_byte_time - start_time
+        if error is not None:
+            args["error"] = repr(error)
+        self._add_span(endpoint, "http", start_time, end_time, args)
+
+    def record_decode(self, endpoint, start_time, end_time, num_bytes):
+        self._add_span(
+            endpoint, "decode", start_time, end_time, {"bytes": num_bytes})
+
+    def record_page(self, endpoint, num_results):
+        self._add_event({
+            "name": endpoint, "cat": "page", "ph": "i", "s": "t",
+            "ts": self._get_timestamp(time.time()),
+            "args": {"results": num_results}})
+
+    def record_write(
+            self, start_time, end_time, num_characters, name="write"):
+        """
+        Records a write of the specified number of characters of output,
+        under the specified name: "write" for output written out, or
+        "spool" for the output of a parallel search held back until the
+        searches before it are done.
+        """
+        self._add_span(
+            name, "output", start_time, end_time,
+            {"characters": num_characters})
+
+    def get_events(self):
+        """
+        Returns the trace events recorded so far, preceded by an event
+        naming each thread that made them.
+        """
+        with self._lock:
+            events = [
+                {"name": "thread_name", "ph": "M", "pid": self._pid,
+                 "tid": tid, "args": {"name": name}}
+                for tid, name in self._thread_names.items()]
+            events.extend(self._events)
+        return events
+
+    def to_json(self):
+        """
+        Returns the trace as a JSON string in the Chrome trace event
+        format.
+        """
+        return json.dumps({
+            "traceEvents": self.get_events(), "displayTimeUnit": "ms"})
+
+    def write(self, path):
+        """
+        Writes the trace to the file with the specified path.
+        """
+        with open(path, "w") as trace_file:
+            trace_file.write(self.to_json())
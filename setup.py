@@ -53,6 +53,11 @@ setup(
     },
     long_description=long_description,
     install_requires=install_requires,
+    extras_require={
+        'numpy': ['numpy'],
+        'compression': ['brotli', 'zstandard'],
+        'arrow': ['pyarrow'],
+    },
     dependency_links=dependency_links,
     license='Apache License 2.0',
     include_package_data=True,
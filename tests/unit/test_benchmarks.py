@@ -0,0 +1,112 @@
+"""
+Tests that the benchmarks run against the fake server
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import unittest
+
+import mock
+
+import candig.client.client as client
+
+import candig.schemas.protocol as protocol
+
+import benchmarks.server as server
+import benchmarks.suite as suite
+import benchmarks.synthetic as synthetic
+
+
+class TestSyntheticBackend(unittest.TestCase):
+    """
+    Tests the pages generated by the synthetic backend
+    """
+    def setUp(self):
+        self.backend = synthetic.SyntheticBackend(
+            num_records=25, page_size=10, num_call_sets=2)
+
+    def _search(self, objectName, request):
+        return self.backend.search(objectName, protocol.toJson(request))
+
+    def testPages(self):
+        request = protocol.SearchVariantsRequest()
+        ids = []
+        while True:
+            response = self._search("variants", request)
+            ids.extend(variant.id for variant in response.variants)
+            if not response.next_page_token:
+                break
+            request.page_token = response.next_page_token
+        self.assertEqual(ids, ["variant{}".format(i) for i in range(25)])
+        self.assertEqual(len(response.variants[0].calls), 2)
+
+    def testRegion(self):
+        request = protocol.SearchReadsRequest()
+        request.start = 45
+        request.end = 100
+        request.page_size = 100
+        response = self._search("reads", request)
+        self.assertEqual(
+            [read.alignment.position.position
+             for read in response.alignments], [50, 60, 70, 80, 90])
+
+    def testReferenceBases(self):
+        self.assertEqual(synthetic.make_sequence(2, 6), "GTACGT")
+        request = protocol.ListReferenceBasesRequest()
+        request.start = 1
+        response = self.backend.list_reference_bases(
+            protocol.toJson(request))
+        self.assertEqual(len(response.sequence), 249)
+        self.assertEqual(response.sequence[:3], "CGT")
+
+
+class TestBenchmarks(unittest.TestCase):
+    """
+    Tests running the benchmarks of the client and the CLI
+    """
+    def testFakeServer(self):
+        backend = synthetic.SyntheticBackend(num_records=30, page_size=7)
+        with server.FakeServer(backend, compress=True) as fakeServer:
+            httpClient = client.HttpClient(fakeServer.get_url())
+            features = list(httpClient.search_features(
+                feature_set_id="featureSet"))
+            self.assertEqual(len(features), 30)
+            self.assertLess(
+                httpClient.get_compressed_bytes_received(),
+                httpClient.get_uncompressed_bytes_received())
+
+    def testResponseBodiesAreBounded(self):
+        backend = synthetic.SyntheticBackend(num_records=30, page_size=7)
+        with server.FakeServer(backend, max_cached_bodies=2) as fakeServer:
+            httpClient = client.HttpClient(fakeServer.get_url())
+            features = list(httpClient.search_features(
+                feature_set_id="featureSet"))
+            self.assertEqual(len(features), 30)
+            self.assertEqual(len(fakeServer.response_bodies), 2)
+
+    def testRunBenchmarks(self):
+        options = suite.get_parser().parse_args([
+            "--records", "50", "--page-size", "20", "--warmup", "0",
+            "--region-shards", "3", "--no-isolate"])
+        names = [
+            "client-variants", "client-reference-bases",
+            "cli-features-search"]
+        results = suite.run_benchmarks(names, options)
+        self.assertEqual([result["name"] for result in results], names)
+        self.assertEqual(
+            [result["records"] for result in results], [50, 500, 50])
+        self.assertIsNotNone(results[0]["time_to_first_record"])
+        self.assertGreater(results[0]["bytes_received"], 0)
+        self.assertGreater(results[2]["bytes_written"], 0)
+        self.assertEqual(
+            len(suite.format_table(results).splitlines()), 4)
+
+    def testIsolatedChildDies(self):
+        options = suite.get_parser().parse_args([])
+        with mock.patch.object(
+                suite, "run_benchmark", side_effect=lambda *args: os._exit(1)):
+            with self.assertRaises(RuntimeError):
+                suite._run_isolated(
+                    "client-variants", "http://127.0.0.1:1/", options)
@@ -0,0 +1,149 @@
+"""
+Tests for the persistent response cache
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import candig.client.cache as cache
+import candig.client.client as client
+
+import candig.schemas.protocol as protocol
+
+
+class TestResponseCache(unittest.TestCase):
+    """
+    Tests the SQLite backed cache
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache.db")
+        self.time = 1000.0
+        patcher = mock.patch("time.time", side_effect=lambda: self.time)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _makeCache(self, **kwargs):
+        responseCache = cache.ResponseCache(self.path, **kwargs)
+        self.addCleanup(responseCache.close)
+        return responseCache
+
+    def testGetAndPut(self):
+        responseCache = self._makeCache()
+        self.assertIsNone(responseCache.get("key", "datasets"))
+        responseCache.put("key", "datasets", b"\x00data\xff")
+        self.assertEqual(responseCache.get("key", "datasets"), b"\x00data\xff")
+
+    def testSharedBetweenInstances(self):
+        self._makeCache().put("key", "datasets", b"data")
+        self.assertEqual(self._makeCache().get("key", "datasets"), b"data")
+
+    def testPerTypeTtl(self):
+        responseCache = self._makeCache(
+            default_ttl=100, ttls={"readgroups": 10, "variants": 0})
+        responseCache.put("dataset", "datasets", b"dataset")
+        responseCache.put("readgroup", "readgroups", b"readgroup")
+        responseCache.put("variant", "variants", b"variant")
+        self.assertIsNone(responseCache.get("variant", "variants"))
+        self.time += 50
+        self.assertIsNone(responseCache.get("readgroup", "readgroups"))
+        self.assertEqual(responseCache.get("dataset", "datasets"), b"dataset")
+        self.time += 50
+        self.assertIsNone(responseCache.get("dataset", "datasets"))
+
+    def testLeastRecentlyUsedEviction(self):
+        responseCache = self._makeCache(max_bytes=30)
+        for index in range(3):
+            self.time += 1
+            responseCache.put("key{}".format(index), "datasets", b"x" * 10)
+        self.time += 1
+        responseCache.get("key0", "datasets")
+        self.time += 1
+        responseCache.put("key3", "datasets", b"x" * 10)
+        self.assertIsNone(responseCache.get("key1", "datasets"))
+        for key in ["key0", "key2", "key3"]:
+            self.assertIsNotNone(responseCache.get(key, "datasets"))
+
+    def testClear(self):
+        responseCache = self._makeCache()
+        responseCache.put("key", "datasets", b"data")
+        responseCache.clear()
+        self.assertIsNone(responseCache.get("key", "datasets"))
+
+
+class TestHttpClientResponseCache(unittest.TestCase):
+    """
+    Tests that the HTTP client answers get requests from the cache
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.responseCache = cache.ResponseCache(
+            os.path.join(self.directory, "cache.db"))
+        dataset = protocol.Dataset()
+        dataset.id = "datasetId"
+        dataset.name = "name"
+        self.response = mock.Mock()
+        self.response.status_code = 200
+        self.response.headers = {"Content-Type": "application/json"}
+        self.response.content = protocol.toJson(dataset).encode("utf-8")
+
+    def tearDown(self):
+        self.responseCache.close()
+        shutil.rmtree(self.directory)
+
+    def _makeClient(self, id_token=None):
+        httpClient = client.HttpClient(
+            "http://example.com", id_token=id_token)
+        httpClient.set_response_cache(self.responseCache)
+        httpClient._session.request = mock.Mock(return_value=self.response)
+        return httpClient
+
+    def testGetIsCached(self):
+        httpClient = self._makeClient()
+        self.assertIs(httpClient.get_response_cache(), self.responseCache)
+        for _ in range(3):
+            dataset = httpClient.get_dataset("datasetId")
+            self.assertEqual(dataset.name, "name")
+        self.assertEqual(httpClient._session.request.call_count, 1)
+        otherClient = self._makeClient()
+        self.assertEqual(otherClient.get_dataset("datasetId").name, "name")
+        self.assertEqual(otherClient._session.request.call_count, 0)
+
+    def testCachedPerUser(self):
+        self._makeClient("token1").get_dataset("datasetId")
+        httpClient = self._makeClient("token2")
+        httpClient.get_dataset("datasetId")
+        self.assertEqual(httpClient._session.request.call_count, 1)
+
+    def testCachedPerAuthorizationHeader(self):
+        self._makeClient().get_dataset("datasetId")
+        httpClient = self._makeClient()
+        httpClient._session.headers["Authorization"] = "Bearer other"
+        httpClient.get_dataset("datasetId")
+        self.assertEqual(httpClient._session.request.call_count, 1)
+
+    def testCachedPerCookie(self):
+        self._makeClient().get_dataset("datasetId")
+        httpClient = self._makeClient()
+        httpClient._session.cookies.set("session", "user2")
+        httpClient.get_dataset("datasetId")
+        self.assertEqual(httpClient._session.request.call_count, 1)
+
+    def testCachedPerAccessToken(self):
+        self._makeClient().get_dataset("datasetId")
+        oidcClient = client.OidcClient.__new__(client.OidcClient)
+        client.HttpClient.__init__(oidcClient, "http://example.com")
+        oidcClient._token_saver({"access_token": "token"})
+        self.assertNotEqual(
+            oidcClient._get_cache_key("url"),
+            self._makeClient()._get_cache_key("url"))
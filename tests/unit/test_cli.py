@@ -5,11 +5,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import argparse
 import json
 import mock
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
 
 import candig.client.cli as cli_client
+import candig.client.exceptions as exceptions
+import candig.client.tracing as tracing
+import candig.schemas.protocol as protocol
 
 import ga4gh.common.utils as utils
 
@@ -412,6 +422,78 @@ class TestClientArguments(unittest.TestCase):
         self.assertEqual(args.baseUrl, "BASEURL")
 
 
+class TestLazySubparsers(unittest.TestCase):
+    """
+    Tests that subcommand parsers are only built when they are needed
+    """
+    def _getSubparsersAction(self, parser):
+        return parser._subparsersAction
+
+    def testParserAddedOnDemand(self):
+        parser = cli_client.getClientParser()
+        action = self._getSubparsersAction(parser)
+        self.assertEqual(
+            action.choices, list(cli_client.CLIENT_SUBCOMMANDS.keys()))
+        self.assertEqual(action.getParsers(), {})
+        args = parser.parse_args(["variants-get", "BASEURL", "ID"])
+        self.assertEqual(args.runner, cli_client.GetVariantRunner)
+        self.assertEqual(list(action.getParsers().keys()), ["variants-get"])
+
+    def testUnknownSubcommand(self):
+        parser = cli_client.getClientParser()
+        with utils.suppressOutput():
+            with self.assertRaises(SystemExit):
+                parser.parse_args(["variants-got", "BASEURL", "ID"])
+        self.assertEqual(self._getSubparsersAction(parser).getParsers(), {})
+
+    def testAllParsers(self):
+        parser = cli_client.getClientParser(lazy=False)
+        parsers = self._getSubparsersAction(parser).getParsers()
+        self.assertEqual(
+            list(parsers.keys()), list(cli_client.CLIENT_SUBCOMMANDS.keys()))
+        for name, subparser in parsers.items():
+            self.assertTrue(subparser.prog.endswith(" " + name))
+
+    def testHelpListsAllSubcommands(self):
+        parser = cli_client.getClientParser()
+        helpText = parser.format_help()
+        for name in cli_client.CLIENT_SUBCOMMANDS:
+            self.assertIn(name, helpText)
+        self.assertEqual(
+            list(self._getSubparsersAction(parser).getParsers().keys()),
+            list(cli_client.CLIENT_SUBCOMMANDS.keys()))
+
+    def testNoConflictingSubparsers(self):
+        # Python 3.11 and later refuse to add a parser under a name that is
+        # already taken, so a name must only be taken by adding its parser
+        addParser = argparse._SubParsersAction.add_parser
+
+        def checkedAddParser(action, name, **kwargs):
+            self.assertNotIn(name, action._name_parser_map)
+            return addParser(action, name, **kwargs)
+        with mock.patch.object(
+                argparse._SubParsersAction, "add_parser", checkedAddParser):
+            parser = cli_client.getClientParser()
+            parser.parse_args(["variants-get", "BASEURL", "ID"])
+            parser.format_help()
+            cli_client.getClientParser(lazy=False)
+
+
+class FakeStream(object):
+    def __init__(self):
+        self.chunks = []
+        self.flushes = 0
+
+    def write(self, text):
+        self.chunks.append(text)
+
+    def flush(self):
+        self.flushes += 1
+
+    def getvalue(self):
+        return "".join(self.chunks)
+
+
 class TestOutputFormats(unittest.TestCase):
     """
     Tests the different output formats of the cli
@@ -424,6 +506,9 @@ class TestOutputFormats(unittest.TestCase):
             self.auth0_token = 'auth0_token'
             self.baseUrl = 'baseUrl'
             self.verbose = 'verbose'
+            self.cache_file = None
+            self.max_retries = 0
+            self.line_buffered = False
 
     def makeFakeObject(self):
         returnObj = fakeobj.FakeObject()
@@ -431,41 +516,498 @@ class TestOutputFormats(unittest.TestCase):
         returnObj.name = 'name'
         return returnObj
 
-    def _getRunPrintMethodCalls(self, runner):
-        printCalls = []
-        with mock.patch('__builtin__.print') as printMethod:
-            printMethod.side_effect = \
-                lambda *args, **kwargs: printCalls.append((args, kwargs))
+    def _getRunOutput(self, runner):
+        stream = FakeStream()
+        with mock.patch('sys.stdout', stream):
             runner.run()
-        return printCalls
+        return stream.getvalue()
 
     def testListReferenceBasesFasta(self):
         args = self.FakeArgs('fasta')
         args.start = 1
         args.end = 100
+        args.regionShards = 0
         returnVal = 'AGCT' * 100  # 400 bases
         runner = cli_client.ListReferenceBasesRunner(args)
-        runner._client.list_reference_bases = mock.Mock(
-            return_value=returnVal)
-        printCalls = self._getRunPrintMethodCalls(runner)
-        self.assertEqual(printCalls[0][0][0], '>id:1-100')
-        self.assertEqual(len(printCalls), 7)
-        self.assertEqual(
-            printCalls[-1][0][0],
-            returnVal[-50:])  # 50 = 400 % 70
+        # Pages of 100 bases, which do not line up with the FASTA lines
+        pages = [returnVal[i:i + 100] for i in range(0, 400, 100)]
+        runner._client.iter_reference_bases = mock.Mock(
+            return_value=iter(pages))
+        lines = self._getRunOutput(runner).splitlines()
+        self.assertEqual(lines[0], '>id:1-100')
+        self.assertEqual(len(lines), 7)
+        self.assertEqual("".join(lines[1:]), returnVal)
+        self.assertEqual(lines[-1], returnVal[-50:])  # 50 = 400 % 70
+
+    def testListReferenceBasesText(self):
+        args = self.FakeArgs('text')
+        args.start = 0
+        args.end = None
+        args.regionShards = 0
+        runner = cli_client.ListReferenceBasesRunner(args)
+        runner._client.iter_reference_bases = mock.Mock(
+            return_value=iter(['AC', 'GT']))
+        self.assertEqual(self._getRunOutput(runner), 'ACGT\n')
 
     def testTextOutput(self):
         returnObj = self.makeFakeObject()
         args = self.FakeArgs()
         runner = cli_client.AbstractGetRunner(args)
         runner._method = mock.Mock(return_value=returnObj)
-        printCalls = self._getRunPrintMethodCalls(runner)
-        self.assertEqual(printCalls, [((u'id', u'name'), {'sep': u'\t'})])
+        self.assertEqual(self._getRunOutput(runner), 'id\tname\n')
 
     def testJsonOutput(self):
         returnObj = self.makeFakeObject()
         args = self.FakeArgs('json')
         runner = cli_client.AbstractGetRunner(args)
         runner._method = mock.Mock(return_value=returnObj)
-        printCalls = self._getRunPrintMethodCalls(runner)
-        self.assertEqual(json.loads(printCalls[0][0][0])['name'], 'name')
+        output = self._getRunOutput(runner)
+        self.assertEqual(json.loads(output)['name'], 'name')
+
+    def testVariantTextOutput(self):
+        variant = protocol.Variant()
+        variant.id = 'id'
+        variant.variant_set_id = 'vs'
+        variant.reference_name = '1'
+        variant.start = 10
+        variant.end = 11
+        variant.reference_bases = 'A'
+        variant.alternate_bases.extend(['T', 'G'])
+        variant.attributes.attr['key'].values.add().string_value = 'value'
+        call = variant.calls.add()
+        call.call_set_id = 'cs'
+        call.genotype.extend([0, 1])
+        runner = cli_client.GetVariantRunner(self.FakeArgs())
+        runner._method = mock.Mock(return_value=variant)
+        output = self._getRunOutput(runner)
+        self.assertTrue(output.startswith(
+            "id\tvs\t[]\t1\t10\t11\tA\tTG\tkey=value;\t"
+            "cs:[0.0, 1.0]:"))
+        self.assertTrue(output.endswith("::\t\n"))
+        self.assertEqual(len(output.splitlines()), 1)
+
+    def testFeatureTextOutput(self):
+        feature = protocol.Feature()
+        feature.id = 'id'
+        feature.parent_id = 'parent'
+        feature.feature_set_id = 'fs'
+        feature.reference_name = '1'
+        feature.start = 10
+        feature.end = 20
+        feature.feature_type.term_id = 'SO:0000704'
+        feature.feature_type.term = 'gene'
+        feature.attributes.attr['gene_name'].values.add().string_value = 'A'
+        runner = cli_client.GetFeatureRunner(self.FakeArgs())
+        runner._method = mock.Mock(return_value=feature)
+        self.assertEqual(
+            self._getRunOutput(runner),
+            "id\tparent\tfs\t1\t10\t20\t0\t"
+            "FeatureType: SO:0000704 gene\tgene_name:A; \n")
+
+
+class TestOutputWriter(unittest.TestCase):
+    """
+    Tests that output is written in large chunks
+    """
+    def testBuffering(self):
+        stream = FakeStream()
+        writer = cli_client.OutputWriter(stream, bufferSize=10)
+        writer.writeLines(["abc", "def"])
+        self.assertEqual(stream.chunks, [])
+        writer.writeLines(["ghi"])
+        self.assertEqual(stream.chunks, ["abc\ndef\nghi\n"])
+        writer.write("jkl")
+        writer.flush()
+        self.assertEqual(stream.getvalue(), "abc\ndef\nghi\njkl")
+        self.assertEqual(stream.flushes, 1)
+
+    def testLineBuffering(self):
+        stream = FakeStream()
+        writer = cli_client.OutputWriter(stream, lineBuffered=True)
+        writer.write("abc")
+        self.assertEqual(stream.chunks, [])
+        writer.writeLines(["def", "ghi"])
+        self.assertEqual(stream.chunks, ["abcdef\n", "ghi\n"])
+        self.assertEqual(stream.flushes, 2)
+
+    def testDefaultStream(self):
+        writer = cli_client.OutputWriter()
+        stream = FakeStream()
+        writer.write("abc")
+        with mock.patch('sys.stdout', stream):
+            writer.flush()
+        self.assertEqual(stream.getvalue(), "abc")
+
+
+class TestParallelSearches(unittest.TestCase):
+    """
+    Tests that searches over all containers can be run in parallel without
+    changing the output
+    """
+    class FakeArgs(object):
+        def __init__(self, workers):
+            self.outputFormat = 'text'
+            self.key = 'key'
+            self.auth0_token = 'auth0_token'
+            self.baseUrl = 'baseUrl'
+            self.verbose = 'verbose'
+            self.cache_file = None
+            self.max_retries = 0
+            self.line_buffered = False
+            self.pageSize = None
+            self.targetPageLatency = None
+            self.prefetchPages = 0
+            self.workers = workers
+            self.datasetId = None
+
+    def _makeVariantSets(self, datasetId):
+        # Finish the earlier datasets last to mix up the completion order
+        time.sleep(0.05 * (3 - int(datasetId[-1])))
+        variantSets = []
+        for index in range(3):
+            variantSet = protocol.VariantSet()
+            variantSet.id = "{}-vs{}".format(datasetId, index)
+            variantSet.name = "name"
+            variantSets.append(variantSet)
+        return variantSets
+
+    def _runSearchVariantSets(
+            self, workers, searchVariantSets, stream=None, tracer=None):
+        runner = cli_client.SearchVariantSetsRunner(self.FakeArgs(workers))
+        if tracer is not None:
+            runner.setTracer(tracer)
+        datasets = []
+        for index in range(4):
+            dataset = protocol.Dataset()
+            dataset.id = "dataset{}".format(index)
+            datasets.append(dataset)
+        runner._client.search_datasets = mock.Mock(return_value=datasets)
+        runner._client.search_variant_sets = mock.Mock(
+            side_effect=searchVariantSets)
+        if stream is None:
+            stream = FakeStream()
+        with mock.patch('sys.stdout', stream):
+            runner.run()
+            self.assertIs(sys.stdout, stream)
+        return stream.getvalue()
+
+    def testOutputMatchesSerialRun(self):
+        def searchVariantSets(dataset_id):
+            return self._makeVariantSets(dataset_id)
+        serialOutput = self._runSearchVariantSets(1, searchVariantSets)
+        self.assertEqual(len(serialOutput.splitlines()), 12)
+        for workers in [2, 4, 8]:
+            self.assertEqual(
+                self._runSearchVariantSets(workers, searchVariantSets),
+                serialOutput)
+
+    def testFirstErrorIsRaised(self):
+        def searchVariantSets(dataset_id):
+            if dataset_id == "dataset1":
+                raise ValueError(dataset_id)
+            return self._makeVariantSets(dataset_id)
+        with self.assertRaises(ValueError):
+            self._runSearchVariantSets(2, searchVariantSets)
+
+    def testPartialOutputOfFailedSearch(self):
+        def searchVariantSets(dataset_id):
+            for variantSet in self._makeVariantSets(dataset_id)[:2]:
+                yield variantSet
+            if dataset_id == "dataset1":
+                raise ValueError(dataset_id)
+            yield self._makeVariantSets(dataset_id)[2]
+        outputs = []
+        for workers in [1, 3]:
+            stream = FakeStream()
+            with self.assertRaises(ValueError):
+                self._runSearchVariantSets(
+                    workers, searchVariantSets, stream)
+            outputs.append(stream.getvalue())
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertEqual(
+            [line.split("\t")[0] for line in outputs[0].splitlines()],
+            ["dataset0-vs0", "dataset0-vs1", "dataset0-vs2",
+             "dataset1-vs0", "dataset1-vs1"])
+
+    def testFailureStopsRunningSearches(self):
+        produced = []
+
+        def searchVariantSets(dataset_id):
+            if dataset_id == "dataset0":
+                # Fail once the search of dataset1 is under way
+                time.sleep(0.1)
+                raise ValueError(dataset_id)
+            variantSet = protocol.VariantSet()
+            variantSet.id = "{}-vs".format(dataset_id)
+            for _ in range(1000):
+                time.sleep(0.01)
+                produced.append(dataset_id)
+                yield variantSet
+        with self.assertRaises(ValueError):
+            self._runSearchVariantSets(2, searchVariantSets)
+        self.assertGreater(len(produced), 0)
+        self.assertLess(len(produced), 100)
+
+    def testSpooledOutput(self):
+        spool = cli_client._SpooledOutput(maxSize=10)
+        text = "\u00e9t\u00e9\n" * 20
+        spool.write(text)
+        self.assertTrue(spool._file._rolled)
+        stream = FakeStream()
+        writer = cli_client.OutputWriter(stream)
+        spool.copyTo(writer, chunkSize=7)
+        writer.flush()
+        spool.close()
+        self.assertEqual(stream.getvalue(), text)
+
+    def testPoolHoldsAConnectionPerWorker(self):
+        for workers, poolMaxsize in [(1, 10), (10, 10), (16, 16)]:
+            runner = cli_client.SearchVariantSetsRunner(
+                self.FakeArgs(workers))
+            self.assertEqual(runner._client._pool_maxsize, poolMaxsize)
+            adapter = runner._client._session.get_adapter("http://example")
+            self.assertEqual(adapter._pool_maxsize, poolMaxsize)
+
+    def testSpooledOutputIsTraced(self):
+        def searchVariantSets(dataset_id):
+            return self._makeVariantSets(dataset_id)
+        tracer = tracing.Tracer()
+        self._runSearchVariantSets(2, searchVariantSets, tracer=tracer)
+        writes = [
+            event for event in tracer.get_events()
+            if event.get("cat") == "output"]
+        spooled = [event for event in writes if event["name"] == "spool"]
+        self.assertEqual(len(spooled), 4)
+        mainThreads = set(
+            event["tid"] for event in writes if event["name"] == "write")
+        self.assertEqual(len(mainThreads), 1)
+        self.assertTrue(all(
+            event["tid"] not in mainThreads for event in spooled))
+
+    def testWorkersOnlyForSearchesOverContainers(self):
+        parser = cli_client.getClientParser()
+        args = parser.parse_args(
+            "variantsets-search BASEURL --workers 2".split())
+        self.assertEqual(args.workers, 2)
+        with utils.suppressOutput():
+            with self.assertRaises(SystemExit):
+                parser.parse_args(
+                    "datasets-search BASEURL --workers 2".split())
+
+
+class TestSearchCheckpoints(unittest.TestCase):
+    """
+    Tests that an interrupted search can be resumed from its checkpoint
+    """
+    class FakeArgs(object):
+        def __init__(self, checkpoint=None, resumeFrom=None):
+            self.outputFormat = 'text'
+            self.key = 'key'
+            self.auth0_token = 'auth0_token'
+            self.baseUrl = 'baseUrl'
+            self.verbose = 'verbose'
+            self.cache_file = None
+            self.max_retries = 0
+            self.line_buffered = False
+            self.pageSize = 3
+            self.targetPageLatency = None
+            self.prefetchPages = 0
+            self.workers = 1
+            self.regionShards = 1
+            self.decodeProcesses = 0
+            self.checkpoint = checkpoint
+            self.resumeFrom = resumeFrom
+            self.start = 0
+            self.end = 100
+            self.referenceId = 'referenceId'
+            self.readGroupIds = 'readGroupId'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, "checkpoint.json")
+        self.pages = {}
+        token = ""
+        for page in range(4):
+            response = protocol.SearchReadsResponse()
+            for index in range(3):
+                response.alignments.add().id = "{}-{}".format(page, index)
+            if page < 3:
+                response.next_page_token = "token{}".format(page)
+            self.pages[token] = response
+            token = response.next_page_token
+        self.failingToken = None
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _runSearchPageRequest(
+            self, protocol_request, object_name, protocol_response_class):
+        if protocol_request.page_token == self.failingToken:
+            raise exceptions.RequestNonSuccessException()
+        return self.pages[protocol_request.page_token]
+
+    def _run(self, args, ids):
+        runner = cli_client.SearchReadsRunner(args)
+        runner._client._run_search_page_request = self._runSearchPageRequest
+        stream = FakeStream()
+        try:
+            with mock.patch('sys.stdout', stream):
+                runner.run()
+        finally:
+            ids.extend(stream.getvalue().splitlines())
+        return ids
+
+    def testResumeAfterFailure(self):
+        self.failingToken = "token1"
+        ids = []
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            self._run(self.FakeArgs(checkpoint=self.checkpoint), ids)
+        self.assertEqual(len(ids), 6)
+        self.failingToken = None
+        self._run(self.FakeArgs(
+            checkpoint=self.checkpoint, resumeFrom=self.checkpoint), ids)
+        self.assertEqual(
+            ids, ["{}-{}".format(page, index)
+                  for page in range(4) for index in range(3)])
+        with open(self.checkpoint) as checkpointFile:
+            self.assertTrue(json.load(checkpointFile)["done"])
+        self.assertEqual(
+            self._run(self.FakeArgs(resumeFrom=self.checkpoint), []), [])
+
+    def testParallelSearchesAreNotCheckpointed(self):
+        args = self.FakeArgs(checkpoint=self.checkpoint)
+        args.regionShards = 4
+        with self.assertRaises(exceptions.ErrantRequestException):
+            cli_client.SearchReadsRunner(args)
+        args = self.FakeArgs(checkpoint=self.checkpoint)
+        args.readGroupIds = 'readGroupId1,readGroupId2'
+        with self.assertRaises(exceptions.ErrantRequestException):
+            cli_client.SearchReadsRunner(args).run()
+
+
+class TestVariantsParquetOutput(unittest.TestCase):
+    """
+    Tests writing variants to a Parquet file
+    """
+    class FakeArgs(object):
+        def __init__(self, outputFile):
+            self.outputFormat = 'parquet'
+            self.outputFile = outputFile
+            self.key = 'key'
+            self.auth0_token = 'auth0_token'
+            self.baseUrl = 'baseUrl'
+            self.verbose = 'verbose'
+            self.cache_file = None
+            self.max_retries = 0
+            self.line_buffered = False
+            self.pageSize = None
+            self.targetPageLatency = None
+            self.prefetchPages = 0
+            self.workers = 1
+            self.regionShards = 1
+            self.decodeProcesses = 0
+            self.checkpoint = None
+            self.resumeFrom = None
+            self.referenceName = '1'
+            self.variantSetId = 'variantSetId'
+            self.start = 0
+            self.end = 100
+            self.callSetIds = 'cs0,cs1'
+
+    def testOutputFileIsRequired(self):
+        with self.assertRaises(exceptions.ErrantRequestException):
+            cli_client.SearchVariantsRunner(self.FakeArgs(None))
+        args = self.FakeArgs("variants.parquet")
+        args.variantSetId = None
+        with self.assertRaises(exceptions.ErrantRequestException):
+            cli_client.SearchVariantsRunner(args).run()
+
+    def testParquetOutput(self):
+        runner = cli_client.SearchVariantsRunner(
+            self.FakeArgs("variants.parquet"))
+        runner._client._run_search_page_request = mock.Mock(
+            return_value=protocol.SearchVariantsResponse())
+
+        def iterVariantBatches(variants, callSetIds):
+            self.assertEqual(list(variants), [])
+            self.assertEqual(callSetIds, ["cs0", "cs1"])
+            return "batches"
+        with mock.patch(
+                'candig.client.columnar.write_parquet') as writeParquet, \
+                mock.patch(
+                    'candig.client.columnar.iter_variant_batches',
+                    side_effect=iterVariantBatches):
+            runner.run()
+        writeParquet.assert_called_once_with("batches", "variants.parquet")
+        request = runner._client._run_search_page_request.call_args[0][0]
+        self.assertEqual(list(request.variant_set_ids), ["variantSetId"])
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Tests that parsing a command line does not pay for importing the
+    client and the protocol
+    """
+    # The longest time, in seconds, that importing the candig package and
+    # the cli, building the parser and parsing a command line may take,
+    # not counting the start of the interpreter. This takes about 25ms on
+    # a developer's machine, so the budget leaves a wide margin for a slow
+    # or busy one.
+    startupBudget = 0.1
+
+    # The modules that should only be imported once a runner needs them.
+    # pkg_resources alone takes longer to import than the budget allows.
+    deferredModules = [
+        "requests", "requests_oauthlib", "candig.schemas.pb",
+        "candig.schemas.protocol", "candig.client.client",
+        "concurrent.futures", "google.protobuf", "numpy", "pyarrow",
+        "pkg_resources"]
+
+    # Imports the cli and builds its parser, then parses the command line
+    # given as JSON in the first argument, if any. Prints the time this
+    # took and which of the modules named in the remaining arguments were
+    # imported
+    startupScript = """
+import argparse
+import json
+import sys
+import time
+startTime = time.time()
+import dev_glue
+import candig.client.cli as cli
+parser = cli.getClientParser()
+arguments = json.loads(sys.argv[1])
+if arguments is not None:
+    parser.parse_args(arguments)
+print(json.dumps({
+    "seconds": time.time() - startTime,
+    "modules": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+    def _runStartupScript(self, arguments=None):
+        """
+        Builds the parser and parses the specified command line in a
+        fresh interpreter, returning the time this took and the deferred
+        modules it imported.
+        """
+        rootDir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        output = subprocess.check_output(
+            [sys.executable, "-c", self.startupScript,
+             json.dumps(arguments)] + self.deferredModules, cwd=rootDir)
+        return json.loads(output.decode("utf-8"))
+
+    def testParserImportsNothingDeferred(self):
+        self.assertEqual(self._runStartupScript()["modules"], [])
+
+    def testDeferredImports(self):
+        self.assertEqual(
+            self._runStartupScript(
+                ["variants-get", "BASEURL", "ID"])["modules"], [])
+
+    def testStartupBudget(self):
+        # The fastest of a few runs, to discount a busy machine
+        seconds = min(
+            self._runStartupScript(["variants-get", "BASEURL", "ID"])[
+                "seconds"] for _ in range(3))
+        self.assertLess(seconds, self.startupBudget)
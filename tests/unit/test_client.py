@@ -5,12 +5,28 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import itertools
+import json
+import threading
+import time
 import unittest
 
+try:
+    import http.server as BaseHTTPServer
+    import socketserver as SocketServer
+except ImportError:
+    import BaseHTTPServer
+    import SocketServer
+
 import mock
 
+from concurrent import futures
+
+from google.protobuf import json_format
+
 import candig.client.client as client
 import candig.client.exceptions as exceptions
+import candig.client.paging as paging
 
 import candig.schemas.protocol as protocol
 
@@ -446,3 +462,674 @@ class TestSearchMethodsCallRunRequest(unittest.TestCase):
         request.peer.url = url
         self.httpClient._run_post_request.assert_called_once_with(
             request, "announce", protocol.AnnouncePeerResponse)
+
+
+class TestRunSearchRequest(unittest.TestCase):
+    """
+    Test the paging performed when running search requests
+    """
+    def setUp(self):
+        self.client = client.AbstractClient()
+        self.pages = {}
+        token = ""
+        for page in range(5):
+            response = protocol.SearchDatasetsResponse()
+            for index in range(3):
+                response.datasets.add().id = "{}-{}".format(page, index)
+            if page < 4:
+                response.next_page_token = "token{}".format(page)
+            self.pages[token] = response
+            token = response.next_page_token
+        self.requestedTokens = []
+        self.client._run_search_page_request = self._runSearchPageRequest
+
+    def _runSearchPageRequest(
+            self, protocol_request, object_name, protocol_response_class):
+        self.assertEqual(object_name, "datasets")
+        self.assertEqual(
+            protocol_response_class, protocol.SearchDatasetsResponse)
+        self.requestedTokens.append(protocol_request.page_token)
+        return self.pages[protocol_request.page_token]
+
+    def _search(self):
+        return self.client._run_search_request(
+            protocol.SearchDatasetsRequest(), "datasets",
+            protocol.SearchDatasetsResponse)
+
+    def _expectedIds(self):
+        return ["{}-{}".format(page, index)
+                for page in range(5) for index in range(3)]
+
+    def testPrefetchPagesDefault(self):
+        self.assertEqual(self.client.get_prefetch_pages(), 0)
+        self.client.set_prefetch_pages(None)
+        self.assertEqual(self.client.get_prefetch_pages(), 0)
+
+    def testSerialPaging(self):
+        ids = [dataset.id for dataset in self._search()]
+        self.assertEqual(ids, self._expectedIds())
+        self.assertEqual(
+            self.requestedTokens, ["", "token0", "token1", "token2", "token3"])
+
+    def testPrefetchedPaging(self):
+        for prefetchPages in [1, 2, 10]:
+            self.requestedTokens = []
+            self.client.set_prefetch_pages(prefetchPages)
+            ids = [dataset.id for dataset in self._search()]
+            self.assertEqual(ids, self._expectedIds())
+            self.assertEqual(
+                self.requestedTokens,
+                ["", "token0", "token1", "token2", "token3"])
+
+    def testResumeSearch(self):
+        for prefetchPages in [0, 2]:
+            self.client.set_prefetch_pages(prefetchPages)
+            iterator = self._search()
+            ids = [next(iterator).id for _ in range(7)]
+            cursor = iterator.get_cursor()
+            iterator.close()
+            ids.extend(
+                dataset.id for dataset in self.client.resume_search(cursor))
+            self.assertEqual(ids, self._expectedIds())
+        self.client.set_prefetch_pages(0)
+        iterator = self._search()
+        for _ in range(7):
+            next(iterator)
+        self.requestedTokens = []
+        list(self.client.resume_search(iterator.get_cursor()))
+        self.assertEqual(
+            self.requestedTokens, ["token1", "token2", "token3"])
+
+    def testAdaptivePageSize(self):
+        controller = paging.PageSizeController(
+            initial_page_size=3, min_page_size=1, target_latency=1)
+        self.client.set_page_size_controller(controller)
+        self.assertIs(self.client.get_page_size_controller(), controller)
+        requestedPageSizes = []
+
+        def runSearchPageRequest(protocol_request, *args):
+            requestedPageSizes.append(protocol_request.page_size)
+            return self._runSearchPageRequest(protocol_request, *args)
+        self.client._run_search_page_request = runSearchPageRequest
+        # Every page takes three seconds
+        clock = itertools.count(0, 3)
+        with mock.patch("time.time", side_effect=lambda: next(clock)):
+            ids = [dataset.id for dataset in self._search()]
+        self.assertEqual(ids, self._expectedIds())
+        self.assertEqual(requestedPageSizes, [3, 1, 1, 1, 1])
+
+    def testPageSizeReportedPerResponse(self):
+        controller = paging.PageSizeController(
+            initial_page_size=3, target_latency=None, target_bytes=300)
+        self.client.set_page_size_controller(controller)
+
+        def runMeasuredSearchPageRequest(protocol_request, *args):
+            # Responses received by other requests at the same time must
+            # not be counted toward this page
+            self.client._protocol_bytes_received += 1000
+            return self._runSearchPageRequest(protocol_request, *args), 300
+        self.client._run_measured_search_page_request = \
+            runMeasuredSearchPageRequest
+        with mock.patch.object(
+                controller, "record_page",
+                wraps=controller.record_page) as recordPage:
+            ids = [dataset.id for dataset in self._search()]
+        self.assertEqual(ids, self._expectedIds())
+        self.assertEqual(
+            [call[0][4] for call in recordPage.call_args_list], [300] * 5)
+
+    def testPrefetchedPagingPropagatesErrors(self):
+        def failingRequest(*args):
+            raise exceptions.RequestNonSuccessException()
+        self.client._run_search_page_request = failingRequest
+        self.client.set_prefetch_pages(2)
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            list(self._search())
+
+
+class TestRegionShardedSearch(unittest.TestCase):
+    """
+    Test that searches over a sharded region return the same variants as
+    a search over the whole region
+    """
+    def setUp(self):
+        self.client = client.AbstractClient()
+        self.client.set_page_size(4)
+        # Variants of length 10 every 7 bases, so that many of them
+        # overlap the boundaries between shards
+        self.variants = []
+        for start in range(0, 1000, 7):
+            variant = protocol.Variant()
+            variant.id = "variant{}".format(start)
+            variant.start = start
+            variant.end = start + 10
+            self.variants.append(variant)
+        self.requestedRegions = []
+        self.client._run_search_page_request = self._runSearchPageRequest
+
+    def _runSearchPageRequest(
+            self, protocol_request, object_name, protocol_response_class):
+        self.assertEqual(object_name, "variants")
+        if not protocol_request.page_token:
+            self.requestedRegions.append(
+                (protocol_request.start, protocol_request.end))
+        overlapping = [
+            variant for variant in self.variants
+            if variant.start < protocol_request.end and
+            variant.end > protocol_request.start]
+        offset = int(protocol_request.page_token or "0")
+        pageSize = protocol_request.page_size
+        response = protocol.SearchVariantsResponse()
+        response.variants.extend(overlapping[offset:offset + pageSize])
+        if offset + pageSize < len(overlapping):
+            response.next_page_token = str(offset + pageSize)
+        return response
+
+    def _searchIds(self, start, end):
+        return [variant.id for variant in self.client.search_variants(
+            ["variantSetId"], start=start, end=end, reference_name="1")]
+
+    def testRegionShardsDefault(self):
+        self.assertEqual(self.client.get_region_shards(), 0)
+        self.client.set_region_shards(None)
+        self.assertEqual(self.client.get_region_shards(), 0)
+
+    def testShardedSearchMatchesUnsharded(self):
+        expected = self._searchIds(3, 995)
+        self.assertEqual(self.requestedRegions, [(3, 995)])
+        for shards in [2, 3, 7, 50]:
+            self.requestedRegions = []
+            self.client.set_region_shards(shards)
+            self.assertEqual(self._searchIds(3, 995), expected)
+            self.assertEqual(len(self.requestedRegions), shards)
+
+    def testShardedSearchWithPrefetch(self):
+        expected = self._searchIds(0, 1000)
+        self.client.set_region_shards(4)
+        self.client.set_prefetch_pages(3)
+        self.assertEqual(self._searchIds(0, 1000), expected)
+
+    def _waitFor(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def _assertLaterShardsBounded(self, requestedPages, pages):
+        laterStarts = [250, 500, 750]
+        # Each later shard fetches a page to buffer and one more that
+        # waits for room, then stops until the caller reaches it
+        self.assertTrue(self._waitFor(lambda: all(
+            requestedPages.get(start) == pages for start in laterStarts)))
+        time.sleep(0.2)
+        self.assertEqual(
+            [requestedPages[start] for start in laterStarts],
+            [pages] * len(laterStarts))
+
+    def testShardsFetchedConcurrently(self):
+        requestedPages = {}
+        runSearchPageRequest = self._runSearchPageRequest
+
+        def countPages(
+                protocol_request, object_name, protocol_response_class):
+            start = protocol_request.start
+            requestedPages[start] = requestedPages.get(start, 0) + 1
+            return runSearchPageRequest(
+                protocol_request, object_name, protocol_response_class)
+        self.client._run_search_page_request = countPages
+        self.client.set_region_shards(4)
+        variants = self.client.search_variants(
+            ["variantSetId"], start=0, end=1000, reference_name="1")
+        try:
+            next(variants)
+            self._assertLaterShardsBounded(requestedPages, 2)
+        finally:
+            variants.close()
+
+    def testShardBuffersFollowPrefetch(self):
+        requestedPages = {}
+        runSearchPageRequest = self._runSearchPageRequest
+
+        def countPages(
+                protocol_request, object_name, protocol_response_class):
+            start = protocol_request.start
+            requestedPages[start] = requestedPages.get(start, 0) + 1
+            return runSearchPageRequest(
+                protocol_request, object_name, protocol_response_class)
+        self.client._run_search_page_request = countPages
+        self.client.set_region_shards(4)
+        self.client.set_prefetch_pages(3)
+        variants = self.client.search_variants(
+            ["variantSetId"], start=0, end=1000, reference_name="1")
+        try:
+            next(variants)
+            self._assertLaterShardsBounded(requestedPages, 4)
+        finally:
+            variants.close()
+
+    def testContinuousIsNotSharded(self):
+        # One run of values spanning the boundaries of every shard, which
+        # the server clips to the region searched
+        requestedRegions = []
+
+        def runSearchPageRequest(
+                protocol_request, object_name, protocol_response_class):
+            self.assertEqual(object_name, "continuous")
+            requestedRegions.append(
+                (protocol_request.start, protocol_request.end))
+            response = protocol.SearchContinuousResponse()
+            continuous = response.continuous.add()
+            continuous.start = max(100, protocol_request.start)
+            continuous.values.extend(
+                float(position) for position in range(
+                    continuous.start, min(900, protocol_request.end)))
+            return response
+        self.client._run_search_page_request = runSearchPageRequest
+        self.client.set_region_shards(4)
+        results = list(self.client.search_continuous(
+            "continuousSetId", "1", 0, 1000))
+        self.assertEqual(requestedRegions, [(0, 1000)])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].start, 100)
+        self.assertEqual(len(results[0].values), 800)
+
+    def testOpenRegionIsNotSharded(self):
+        expected = self._searchIds(100, None)
+        self.client.set_region_shards(4)
+        self.assertEqual(self._searchIds(100, None), expected)
+        self.assertEqual(self.requestedRegions, [(100, 0), (100, 0)])
+
+
+class TestDeserializeResponse(unittest.TestCase):
+    """
+    Test that responses are deserialized from both bytes and text
+    """
+    def setUp(self):
+        self.client = client.AbstractClient()
+        self.dataset = protocol.Dataset()
+        self.dataset.id = "datasetId"
+        self.dataset.name = "name\u00e9"
+
+    def _deserialize(self, data, contentType):
+        return self.client._deserialize_response(
+            data, protocol.Dataset, contentType)
+
+    def testJson(self):
+        text = protocol.toJson(self.dataset)
+        for data in [text, text.encode("utf-8"),
+                     memoryview(text.encode("utf-8"))]:
+            self.assertEqual(
+                self._deserialize(data, "application/json"), self.dataset)
+
+    def testProtobuf(self):
+        data = protocol.serialize(self.dataset, "application/protobuf")
+        for contentType in ["application/protobuf", "application/x-protobuf"]:
+            self.assertEqual(
+                self._deserialize(data, contentType), self.dataset)
+            self.assertEqual(
+                self._deserialize(memoryview(data), contentType),
+                self.dataset)
+
+    def testFederatedJson(self):
+        data = '{{"status": {{}}, "results": {}}}'.format(
+            protocol.toJson(self.dataset)).encode("utf-8")
+        self.assertEqual(
+            self._deserialize(data, "application/json"), self.dataset)
+
+    def testBytesReceived(self):
+        data = protocol.toJson(self.dataset).encode("utf-8")
+        self._deserialize(data, "application/json")
+        self._deserialize(data, "application/json")
+        self.assertEqual(
+            self.client.get_protocol_bytes_received(), 2 * len(data))
+
+    def testEmptyResponse(self):
+        with self.assertRaises(exceptions.EmptyResponseException):
+            self._deserialize(b"", "application/json")
+
+    def testInvalidJson(self):
+        with self.assertRaises(json_format.ParseError):
+            self._deserialize(b"{not json", "application/json")
+
+    def testFederatedJsonIsParsedOnce(self):
+        data = '{{"status": {{}}, "results": {}}}'.format(
+            protocol.toJson(self.dataset)).encode("utf-8")
+        with mock.patch("json.dumps") as dumps, \
+                mock.patch("json.loads", side_effect=json.loads) as loads:
+            self._deserialize(data, "application/json")
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(dumps.call_count, 0)
+
+    def testProtobufIsNotProbedAsJson(self):
+        data = protocol.serialize(self.dataset, "application/protobuf")
+        with mock.patch("json.loads") as loads:
+            self._deserialize(data, "application/protobuf")
+        self.assertEqual(loads.call_count, 0)
+
+    def testDecodeExecutor(self):
+        self.client._parallel_decode_min_bytes = 0
+        executor = futures.ProcessPoolExecutor(2)
+        self.addCleanup(executor.shutdown)
+        self.client.set_decode_executor(executor)
+        self.assertIs(self.client.get_decode_executor(), executor)
+        response = protocol.SearchReadsResponse()
+        for index in range(100):
+            alignment = response.alignments.add()
+            alignment.id = "read{}".format(index)
+            alignment.aligned_sequence = "ACGT" * 25
+        data = '{{"status": {{}}, "results": {}}}'.format(
+            protocol.toJson(response)).encode("utf-8")
+        self.assertEqual(
+            self.client._deserialize_response(
+                memoryview(data), protocol.SearchReadsResponse,
+                "application/json"),
+            response)
+        self.assertEqual(
+            self.client.get_protocol_bytes_received(), len(data))
+
+    def testSmallResponsesAreNotShipped(self):
+        executor = mock.Mock()
+        self.client.set_decode_executor(executor)
+        self._deserialize(
+            protocol.toJson(self.dataset).encode("utf-8"),
+            "application/json")
+        self.assertEqual(executor.submit.call_count, 0)
+
+
+class TestReferenceBases(unittest.TestCase):
+    """
+    Test that reference bases are streamed page by page
+    """
+    def setUp(self):
+        self.client = client.AbstractClient()
+        self.bases = "ACGT" * 250
+        self.pageSize = 30
+        self.requestedRanges = []
+        self.client._run_list_reference_bases_page_request = \
+            self._runListReferenceBasesPageRequest
+
+    def _runListReferenceBasesPageRequest(self, request):
+        start = int(request.page_token or request.start)
+        end = request.end or len(self.bases)
+        if not request.page_token:
+            self.requestedRanges.append((request.start, request.end))
+        response = protocol.ListReferenceBasesResponse()
+        response.offset = start
+        response.sequence = self.bases[start:min(start + self.pageSize, end)]
+        if start + self.pageSize < end:
+            response.next_page_token = str(start + self.pageSize)
+        return response
+
+    def testIterReferenceBases(self):
+        sequences = list(self.client.iter_reference_bases("id", 10, 500))
+        self.assertEqual(len(sequences), 17)
+        self.assertEqual("".join(sequences), self.bases[10:500])
+        self.assertEqual(self.requestedRanges, [(10, 500)])
+
+    def testListReferenceBases(self):
+        self.assertEqual(
+            self.client.list_reference_bases("id"), self.bases)
+        self.assertEqual(
+            self.client.list_reference_bases("id", 5, 7), self.bases[5:7])
+
+    def testWriteReferenceBases(self):
+        written = []
+        fileobj = mock.Mock()
+        fileobj.write.side_effect = written.append
+        self.assertEqual(
+            self.client.write_reference_bases("id", fileobj, 10, 500), 490)
+        self.assertEqual("".join(written), self.bases[10:500])
+        self.assertEqual(len(written), 17)
+
+    def testRangesFetchedConcurrently(self):
+        requestedPages = {}
+        runPageRequest = self._runListReferenceBasesPageRequest
+
+        def countPages(request):
+            requestedPages[request.start] = \
+                requestedPages.get(request.start, 0) + 1
+            return runPageRequest(request)
+        self.client._run_list_reference_bases_page_request = countPages
+        self.client.set_region_shards(4)
+        sequences = self.client.iter_reference_bases("id", 0, 1000)
+        try:
+            next(sequences)
+            laterStarts = [250, 500, 750]
+            deadline = time.time() + 5
+            while (any(requestedPages.get(start) != 2
+                       for start in laterStarts) and
+                    time.time() < deadline):
+                time.sleep(0.01)
+            time.sleep(0.2)
+            # The later ranges each fetch a page to buffer and one more
+            # that waits for room, then stop until they are reached
+            self.assertEqual(
+                [requestedPages.get(start) for start in laterStarts],
+                [2, 2, 2])
+        finally:
+            sequences.close()
+
+    def testConcurrentRanges(self):
+        for shards in [2, 4, 7]:
+            self.requestedRanges = []
+            self.client.set_region_shards(shards)
+            self.assertEqual(
+                self.client.list_reference_bases("id", 10, 1000),
+                self.bases[10:1000])
+            self.assertEqual(len(self.requestedRanges), shards)
+        self.requestedRanges = []
+        self.assertEqual(
+            self.client.list_reference_bases("id", 10), self.bases[10:])
+        self.assertEqual(self.requestedRanges, [(10, 0)])
+
+
+class TestGetMany(unittest.TestCase):
+    """
+    Test getting many objects with bounded concurrency
+    """
+    def setUp(self):
+        self.client = client.HttpClient("http://example.com")
+        self.client._run_get_request = self._runGetRequest
+        self.lock = threading.Lock()
+        self.running = 0
+        self.maxRunning = 0
+
+    def _runGetRequest(self, object_name, protocol_response_class, id_):
+        with self.lock:
+            self.running += 1
+            self.maxRunning = max(self.maxRunning, self.running)
+        try:
+            # Finish the earlier IDs last to mix up the completion order
+            time.sleep(0.001 * (50 - int(id_[-2:])))
+            if id_.endswith("7"):
+                raise exceptions.RequestNonSuccessException(id_)
+            response = protocol_response_class()
+            response.id = id_
+            return response
+        finally:
+            with self.lock:
+                self.running -= 1
+
+    def testResultsInInputOrder(self):
+        ids = ["biosample{:02d}".format(index) for index in range(50)]
+        results = self.client.get_biosamples(ids, max_concurrency=4)
+        self.assertEqual([result.id for result in results], ids)
+        self.assertLessEqual(self.maxRunning, 4)
+        self.assertGreater(self.maxRunning, 1)
+        for result in results:
+            if result.id.endswith("7"):
+                self.assertFalse(result.ok)
+                self.assertIsNone(result.value)
+                self.assertIsInstance(
+                    result.error, exceptions.RequestNonSuccessException)
+            else:
+                self.assertTrue(result.ok)
+                self.assertIsInstance(result.value, protocol.Biosample)
+                self.assertEqual(result.value.id, result.id)
+
+    def testSerialGets(self):
+        ids = ["variant{:02d}".format(index) for index in range(5)]
+        results = self.client.get_many("variants", iter(ids), 1)
+        self.assertEqual([result.value.id for result in results], ids)
+        self.assertEqual(self.maxRunning, 1)
+
+    def testUnknownObjectName(self):
+        with self.assertRaises(exceptions.ErrantRequestException):
+            self.client.get_many("objects", ["id"])
+
+
+class TestLocalClient(unittest.TestCase):
+    """
+    Test that the local client passes protocol objects straight to the
+    backend in passthrough mode
+    """
+    def setUp(self):
+        self.backend = mock.Mock()
+        self.dataset = protocol.Dataset()
+        self.dataset.id = "datasetId"
+        self.response = protocol.SearchDatasetsResponse()
+        self.response.datasets.add().CopyFrom(self.dataset)
+
+    def testPassthrough(self):
+        self.backend.runGetDataset.return_value = self.dataset
+        self.backend.runSearchDatasets.return_value = self.response
+        localClient = client.LocalClient(self.backend, passthrough=True)
+        self.assertIs(localClient.get_dataset("datasetId"), self.dataset)
+        self.backend.runGetDataset.assert_called_once_with("datasetId", None)
+        datasets = list(localClient.search_datasets())
+        self.assertEqual(datasets, [self.dataset])
+        request, mimetype = self.backend.runSearchDatasets.call_args[0]
+        self.assertIsInstance(request, protocol.SearchDatasetsRequest)
+        self.assertIsNone(mimetype)
+        self.assertEqual(localClient.get_protocol_bytes_received(), 0)
+
+    def testSerialized(self):
+        self.backend.runGetDataset.return_value = protocol.toJson(
+            self.dataset)
+        self.backend.runSearchDatasets.return_value = protocol.toJson(
+            self.response)
+        localClient = client.LocalClient(
+            self.backend, serialization="application/json")
+        self.assertEqual(localClient.get_dataset("datasetId"), self.dataset)
+        self.backend.runGetDataset.assert_called_once_with(
+            "datasetId", "application/json")
+        self.assertEqual(list(localClient.search_datasets()), [self.dataset])
+        request, mimetype = self.backend.runSearchDatasets.call_args[0]
+        self.assertEqual(
+            json.loads(request),
+            json.loads(protocol.toJson(protocol.SearchDatasetsRequest())))
+        self.assertEqual(mimetype, "application/json")
+
+
+class KeepAliveHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        dataset = protocol.Dataset()
+        dataset.id = self.path.split("/")[-1]
+        body = protocol.toJson(dataset).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class KeepAliveServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    connections = 0
+
+
+class TestHttpClientConnectionPool(unittest.TestCase):
+    """
+    Test the connection pooling options of the HTTP client
+    """
+    def setUp(self):
+        self.server = KeepAliveServer(("127.0.0.1", 0), KeepAliveHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.urlPrefix = "http://127.0.0.1:{}".format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testAdaptersAreMounted(self):
+        httpClient = client.HttpClient(
+            self.urlPrefix, pool_connections=3, pool_maxsize=7)
+        for prefix in ["http://", "https://"]:
+            adapter = httpClient._session.get_adapter(prefix + "example.com")
+            self.assertEqual(adapter._pool_connections, 3)
+            self.assertEqual(adapter._pool_maxsize, 7)
+
+    def testConnectionsAreReused(self):
+        httpClient = client.HttpClient(self.urlPrefix)
+        for index in range(3):
+            dataset = httpClient.get_dataset("dataset{}".format(index))
+            self.assertEqual(dataset.id, "dataset{}".format(index))
+        stats = httpClient.get_pool_stats()
+        self.assertEqual(stats["pools"], 1)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["idle_connections"], 1)
+        self.assertEqual(stats["idle_evictions"], 0)
+        self.assertEqual(self.server.connections, 1)
+
+    def testKeepAliveDisabled(self):
+        httpClient = client.HttpClient(self.urlPrefix, keep_alive=False)
+        self.assertEqual(httpClient._session.headers["Connection"], "close")
+        httpClient.get_dataset("dataset")
+        httpClient.get_dataset("dataset")
+        self.assertEqual(self.server.connections, 2)
+
+    def testIdleConnectionsAreEvicted(self):
+        httpClient = client.HttpClient(self.urlPrefix, idle_timeout=10)
+        with mock.patch("time.time", return_value=1000):
+            httpClient.get_dataset("dataset")
+        with mock.patch("time.time", return_value=1005):
+            httpClient.get_dataset("dataset")
+        self.assertEqual(httpClient.get_pool_stats()["idle_evictions"], 0)
+        with mock.patch("time.time", return_value=1020):
+            httpClient.get_dataset("dataset")
+        stats = httpClient.get_pool_stats()
+        self.assertEqual(stats["idle_evictions"], 1)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["requests"], 1)
+        self.assertEqual(self.server.connections, 2)
+
+    def testSlowResponsesAreNotIdle(self):
+        httpClient = client.HttpClient(self.urlPrefix, idle_timeout=10)
+        clock = [1000]
+        request = httpClient._session.request
+
+        def slowRequest(*args, **kwargs):
+            clock[0] += 30
+            return request(*args, **kwargs)
+
+        httpClient._session.request = slowRequest
+        with mock.patch("time.time", side_effect=lambda: clock[0]):
+            httpClient.get_dataset("dataset")
+            clock[0] += 5
+            httpClient.get_dataset("dataset")
+        stats = httpClient.get_pool_stats()
+        self.assertEqual(stats["idle_evictions"], 0)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["requests"], 2)
+        self.assertEqual(self.server.connections, 1)
+
+    def testTimeoutIsPassed(self):
+        httpClient = client.HttpClient(self.urlPrefix, timeout=(2, 30))
+        httpClient._session.request = mock.Mock(
+            wraps=httpClient._session.request)
+        httpClient.get_dataset("dataset")
+        self.assertEqual(
+            httpClient._session.request.call_args[1]["timeout"], (2, 30))
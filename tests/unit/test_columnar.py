@@ -0,0 +1,156 @@
+"""
+Tests for the Arrow and Parquet output of variants and genotypes
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import candig.client.client as client
+import candig.client.columnar as columnar
+import candig.client.exceptions as exceptions
+
+import candig.schemas.protocol as protocol
+
+import tests.unit.test_genotypes as test_genotypes
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def makeVariants(count, callSetIds):
+    variants = []
+    for index in range(count):
+        variant = protocol.Variant()
+        variant.id = "variant{}".format(index)
+        variant.reference_name = "1"
+        variant.start = index * 10
+        variant.end = index * 10 + 1
+        variant.reference_bases = "A"
+        variant.alternate_bases.extend(["T", "G"])
+        for column, callSetId in enumerate(callSetIds):
+            # Leave out one call of every other variant
+            if index % 2 == 1 and column == 0:
+                continue
+            call = variant.calls.add()
+            call.call_set_id = callSetId
+            call.genotype.extend([index % 3, column])
+        variants.append(variant)
+    return variants
+
+
+@unittest.skipIf(pyarrow is None, "requires pyarrow")
+class TestRecordBatches(unittest.TestCase):
+    """
+    Tests converting variants and genotype matrices to Arrow record
+    batches
+    """
+    def testVariantsToRecordBatch(self):
+        batch = columnar.variants_to_record_batch(
+            makeVariants(3, ["cs0", "cs1"]), ["cs0", "cs1"])
+        self.assertEqual(batch.num_rows, 3)
+        self.assertEqual(
+            batch.schema.names,
+            ["id", "reference_name", "start", "end", "reference_bases",
+             "alternate_bases", "cs0", "cs1"])
+        columns = batch.to_pydict()
+        self.assertEqual(columns["start"], [0, 10, 20])
+        self.assertEqual(columns["alternate_bases"], [["T", "G"]] * 3)
+        self.assertEqual(columns["cs0"], [[0, 0], None, [2, 0]])
+        self.assertEqual(columns["cs1"], [[0, 1], [1, 1], [2, 1]])
+
+    def testBatchSize(self):
+        batches = list(columnar.iter_variant_batches(
+            makeVariants(5, ["cs0"]), batch_size=2))
+        self.assertEqual([batch.num_rows for batch in batches], [2, 2, 1])
+        self.assertIn("cs0", batches[0].schema.names)
+
+    def testNoVariants(self):
+        batches = list(columnar.iter_variant_batches([], ["cs0"]))
+        self.assertEqual(len(batches), 1)
+        self.assertEqual(batches[0].num_rows, 0)
+        self.assertIn("cs0", batches[0].schema.names)
+
+    def testGenotypesToRecordBatch(self):
+        response = test_genotypes.makeGenotypesResponse(4, ["cs0", "cs1"])
+        batch = columnar.genotypes_to_record_batch(
+            response.genotypes, response.variants, response.call_set_ids)
+        columns = batch.to_pydict()
+        self.assertEqual(columns["id"], ["variant{}".format(row)
+                                         for row in range(4)])
+        for column, callSetId in enumerate(["cs0", "cs1"]):
+            self.assertEqual(
+                columns[callSetId],
+                [(2 * row + column) % 7 for row in range(4)])
+
+    def testExportGenotypesArrow(self):
+        httpClient = client.HttpClient("http://example.com")
+        httpClient._run_search_page_request = mock.Mock(
+            side_effect=test_genotypes.makeGenotypesPages())
+        batches = list(httpClient.export_genotypes_arrow("variantSetId"))
+        self.assertEqual([batch.num_rows for batch in batches], [3, 2, 1])
+
+
+@unittest.skipIf(pyarrow is None, "requires pyarrow")
+class TestParquetOutput(unittest.TestCase):
+    """
+    Tests streaming record batches to Parquet files
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "variants.parquet")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRowGroups(self):
+        batches = columnar.iter_variant_batches(
+            makeVariants(10, ["cs0", "cs1"]), batch_size=3)
+        rows = columnar.write_parquet(batches, self.path, row_group_size=5)
+        self.assertEqual(rows, 10)
+        parquetFile = pyarrow.parquet.ParquetFile(self.path)
+        self.assertEqual(parquetFile.metadata.num_rows, 10)
+        self.assertEqual(parquetFile.num_row_groups, 2)
+        table = pyarrow.parquet.read_table(self.path)
+        self.assertEqual(
+            table.column("id").to_pylist(),
+            ["variant{}".format(index) for index in range(10)])
+
+    def testExportVariantsArrow(self):
+        httpClient = client.HttpClient("http://example.com")
+        response = protocol.SearchVariantsResponse()
+        response.variants.extend(makeVariants(4, ["cs0"]))
+        httpClient._run_search_page_request = mock.Mock(
+            return_value=response)
+        columnar.write_parquet(
+            httpClient.export_variants_arrow("variantSetId"), self.path)
+        table = pyarrow.parquet.read_table(self.path)
+        self.assertEqual(table.num_rows, 4)
+        self.assertEqual(
+            table.column("cs0").to_pylist(),
+            [[0, 0], None, [2, 0], None])
+
+
+class TestColumnarWithoutPyarrow(unittest.TestCase):
+    """
+    Tests that a missing pyarrow is reported clearly
+    """
+    def testMissingPyarrow(self):
+        httpClient = client.HttpClient("http://example.com")
+        with mock.patch.dict(
+                "sys.modules", {"pyarrow": None, "pyarrow.parquet": None}):
+            with self.assertRaises(
+                    exceptions.DependencyNotInstalledException):
+                httpClient.export_variants_arrow("variantSetId")
+            with self.assertRaises(
+                    exceptions.DependencyNotInstalledException):
+                columnar.ParquetBatchWriter("variants.parquet")
@@ -0,0 +1,183 @@
+"""
+Tests for the compression of request and response bodies
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import gzip
+import io
+import unittest
+import zlib
+
+import mock
+
+import candig.client.client as client
+import candig.client.compression as compression
+
+import candig.schemas.protocol as protocol
+
+
+def gzipCompress(data):
+    buffer_ = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer_, mode="wb") as gzipFile:
+        gzipFile.write(data)
+    return buffer_.getvalue()
+
+
+def rawDeflateCompress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decodeInChunks(contentEncoding, data, chunkSize=7):
+    decoder = compression.get_decoder(contentEncoding)
+    chunks = [
+        decoder.decompress(data[index:index + chunkSize])
+        for index in range(0, len(data), chunkSize)]
+    chunks.append(decoder.flush())
+    return b"".join(chunks)
+
+
+class TestDecoders(unittest.TestCase):
+    """
+    Tests decoding bodies chunk by chunk
+    """
+    data = b"".join(
+        "variant{}\tA\tT\n".format(index).encode("utf-8")
+        for index in range(500))
+
+    def testAcceptEncoding(self):
+        encodings = compression.accept_encoding().split(", ")
+        self.assertIn("gzip", encodings)
+        self.assertIn("deflate", encodings)
+
+    def testIdentity(self):
+        for contentEncoding in [None, "", "identity"]:
+            self.assertIsNone(compression.get_decoder(contentEncoding))
+
+    def testUnknownEncoding(self):
+        self.assertIsNone(compression.get_decoder("compress"))
+        self.assertIsNone(compression.get_decoder("gzip, compress"))
+
+    def testGzip(self):
+        self.assertEqual(
+            decodeInChunks("gzip", gzipCompress(self.data)), self.data)
+
+    def testDeflate(self):
+        self.assertEqual(
+            decodeInChunks("deflate", zlib.compress(self.data)), self.data)
+
+    def testRawDeflate(self):
+        self.assertEqual(
+            decodeInChunks("Deflate", rawDeflateCompress(self.data)),
+            self.data)
+
+    def testChainedEncodings(self):
+        encoded = gzipCompress(zlib.compress(self.data))
+        self.assertEqual(
+            decodeInChunks("deflate, gzip", encoded), self.data)
+
+    @unittest.skipUnless(
+        hasattr(zlib.decompressobj(), "eof"),
+        "zlib cannot tell where a compressed stream ends")
+    def testTruncatedGzip(self):
+        with self.assertRaises(zlib.error):
+            decodeInChunks("gzip", gzipCompress(self.data)[:-20])
+
+    def testCorruptGzip(self):
+        with self.assertRaises(compression.DECODING_ERRORS):
+            decodeInChunks("gzip", b"\x1f\x8b" + b"\x00" * 100)
+
+    def testCompress(self):
+        self.assertEqual(
+            decodeInChunks("gzip", compression.compress(self.data, "gzip")),
+            self.data)
+        self.assertEqual(
+            decodeInChunks(
+                "deflate", compression.compress(self.data, "deflate")),
+            self.data)
+        with self.assertRaises(ValueError):
+            compression.compress(self.data, "compress")
+
+
+class TestHttpClientCompression(unittest.TestCase):
+    """
+    Tests that the HTTP client negotiates and decodes compressed bodies
+    """
+    def _makeResponse(self, body, contentEncoding=None, chunkSize=100):
+        response = mock.Mock()
+        response.status_code = 200
+        response.headers = {"Content-Type": "application/json"}
+        if contentEncoding is not None:
+            response.headers["Content-Encoding"] = contentEncoding
+        response.content = body
+        response.raw.stream.return_value = iter(
+            [body[index:index + chunkSize]
+             for index in range(0, len(body), chunkSize)])
+        return response
+
+    def _makeDatasetsPage(self):
+        page = protocol.SearchDatasetsResponse()
+        for index in range(100):
+            page.datasets.add().id = "dataset{}".format(index)
+        return protocol.toJson(page).encode("utf-8")
+
+    def testAcceptEncodingHeader(self):
+        httpClient = client.HttpClient("http://example.com")
+        self.assertEqual(
+            httpClient._session.headers["Accept-Encoding"],
+            compression.accept_encoding())
+
+    def testCompressedResponse(self):
+        httpClient = client.HttpClient("http://example.com")
+        body = self._makeDatasetsPage()
+        compressed = gzipCompress(body)
+        httpClient._session.request = mock.Mock(
+            return_value=self._makeResponse(compressed, "gzip"))
+        datasets = list(httpClient.search_datasets())
+        self.assertEqual(len(datasets), 100)
+        self.assertEqual(
+            httpClient.get_compressed_bytes_received(), len(compressed))
+        self.assertEqual(
+            httpClient.get_uncompressed_bytes_received(), len(body))
+        self.assertEqual(httpClient.get_protocol_bytes_received(), len(body))
+        self.assertEqual(
+            httpClient._session.request.call_args[1]["stream"], True)
+
+    def testMeasuredResponseSize(self):
+        httpClient = client.HttpClient("http://example.com")
+        body = self._makeDatasetsPage()
+        httpClient._session.request = mock.Mock(
+            return_value=self._makeResponse(gzipCompress(body), "gzip"))
+        page, numBytes = httpClient._run_measured_search_page_request(
+            protocol.SearchDatasetsRequest(), "datasets",
+            protocol.SearchDatasetsResponse)
+        self.assertEqual(len(page.datasets), 100)
+        self.assertEqual(numBytes, len(body))
+
+    def testUncompressedResponse(self):
+        httpClient = client.HttpClient("http://example.com")
+        body = self._makeDatasetsPage()
+        httpClient._session.request = mock.Mock(
+            return_value=self._makeResponse(body))
+        list(httpClient.search_datasets())
+        self.assertEqual(httpClient.get_compressed_bytes_received(), len(body))
+        self.assertEqual(
+            httpClient.get_uncompressed_bytes_received(), len(body))
+
+    def testCompressedRequest(self):
+        httpClient = client.HttpClient(
+            "http://example.com", request_encoding="gzip")
+        httpClient._session.request = mock.Mock(
+            return_value=self._makeResponse(self._makeDatasetsPage()))
+        list(httpClient.search_datasets())
+        kwargs = httpClient._session.request.call_args[1]
+        self.assertIsNone(kwargs["headers"])
+        list(httpClient.search_variants(
+            "variantSetId", call_set_ids=[
+                "callSet{}".format(index) for index in range(200)]))
+        kwargs = httpClient._session.request.call_args[1]
+        self.assertEqual(kwargs["headers"], {"Content-Encoding": "gzip"})
+        self.assertIn(
+            b"callSet199", decodeInChunks("gzip", kwargs["data"]))
@@ -0,0 +1,172 @@
+"""
+Tests for the NumPy genotype matrices
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+import mock
+
+import candig.client.client as client
+import candig.client.exceptions as exceptions
+import candig.client.genotypes as genotypes
+
+import candig.schemas.protocol as protocol
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def makeGenotypesResponse(nvariants, callSetIds, firstVariant=0):
+    response = protocol.SearchGenotypesResponse()
+    response.call_set_ids.extend(callSetIds)
+    response.genotypes.nvariants = nvariants
+    response.genotypes.nindividuals = len(callSetIds)
+    for row in range(firstVariant, firstVariant + nvariants):
+        variant = response.variants.add()
+        variant.id = "variant{}".format(row)
+        variant.reference_name = "1"
+        variant.start = row * 10
+        variant.end = row * 10 + 1
+        for column in range(len(callSetIds)):
+            response.genotypes.genotypes.append((2 * row + column) % 7)
+    return response
+
+
+def makeGenotypesPages():
+    pages = []
+    for page, nvariants in enumerate([3, 2, 1]):
+        pages.append(makeGenotypesResponse(
+            nvariants, ["cs0", "cs1"], sum([3, 2, 1][:page])))
+        if page < 2:
+            pages[-1].next_page_token = "token{}".format(page)
+    return pages
+
+
+class TestGenotypeBlocks(unittest.TestCase):
+    """
+    Tests assembling genotype matrices from multiple pages of results
+    """
+    def setUp(self):
+        self.httpClient = client.HttpClient("http://example.com")
+        self.httpClient._run_search_page_request = mock.Mock(
+            side_effect=makeGenotypesPages())
+
+    def testSearchGenotypesMergesPages(self):
+        matrix, variants, callSetIds = self.httpClient.search_genotypes(
+            "variantSetId")
+        self.assertEqual(matrix.nvariants, 6)
+        self.assertEqual(matrix.nindividuals, 2)
+        self.assertEqual(
+            list(matrix.genotypes),
+            [(2 * row + column) % 7 for row in range(6)
+             for column in range(2)])
+        self.assertEqual(
+            [variant.id for variant in variants],
+            ["variant{}".format(row) for row in range(6)])
+        self.assertEqual(list(callSetIds), ["cs0", "cs1"])
+        self.assertEqual(
+            self.httpClient._run_search_page_request.call_count, 3)
+
+    def testIterGenotypeBlocks(self):
+        self.httpClient.set_prefetch_pages(2)
+        blocks = list(self.httpClient.iter_genotype_blocks("variantSetId"))
+        self.assertEqual(
+            [matrix.nvariants for matrix, _, _ in blocks], [3, 2, 1])
+        self.assertEqual(
+            [variants[0].id for _, variants, _ in blocks],
+            ["variant0", "variant3", "variant5"])
+
+
+@unittest.skipIf(numpy is None, "requires numpy")
+class TestGenotypeArrays(unittest.TestCase):
+    """
+    Tests converting genotype matrices to NumPy arrays
+    """
+    def testToArrays(self):
+        response = makeGenotypesResponse(4, ["cs0", "cs1", "cs2"])
+        arrays = genotypes.to_arrays(
+            response.genotypes, response.variants, response.call_set_ids)
+        self.assertEqual(arrays.shape, (4, 3))
+        self.assertEqual(arrays.genotypes.dtype, numpy.int8)
+        self.assertTrue(arrays.genotypes.flags["C_CONTIGUOUS"])
+        self.assertEqual(
+            arrays.genotypes.tolist(),
+            [[(2 * row + column) % 7 for column in range(3)]
+             for row in range(4)])
+        self.assertEqual(list(arrays.call_set_ids), ["cs0", "cs1", "cs2"])
+        self.assertEqual(
+            list(arrays.variant_ids),
+            ["variant0", "variant1", "variant2", "variant3"])
+        self.assertEqual(list(arrays.reference_names), ["1"] * 4)
+        self.assertEqual(list(arrays.starts), [0, 10, 20, 30])
+        self.assertEqual(list(arrays.ends), [1, 11, 21, 31])
+        self.assertEqual(
+            (arrays.genotypes == genotypes.GenotypeArrays.NA).sum(), 2)
+
+    def testEmptyMatrix(self):
+        response = makeGenotypesResponse(0, ["cs0", "cs1"])
+        arrays = genotypes.to_arrays(
+            response.genotypes, response.variants, response.call_set_ids)
+        self.assertEqual(arrays.shape, (0, 2))
+
+    def testSearchGenotypesAsArrays(self):
+        httpClient = client.HttpClient("http://example.com")
+        httpClient._run_search_page_request = mock.Mock(
+            return_value=makeGenotypesResponse(2, ["cs0"]))
+        arrays = httpClient.search_genotypes("variantSetId", as_arrays=True)
+        self.assertEqual(arrays.genotypes.tolist(), [[0], [2]])
+
+    def testSearchGenotypesAsArraysMultiplePages(self):
+        httpClient = client.HttpClient("http://example.com")
+        httpClient._run_search_page_request = mock.Mock(
+            side_effect=makeGenotypesPages())
+        arrays = httpClient.search_genotypes("variantSetId", as_arrays=True)
+        self.assertEqual(arrays.shape, (6, 2))
+        self.assertEqual(
+            arrays.genotypes.tolist(),
+            [[(2 * row + column) % 7 for column in range(2)]
+             for row in range(6)])
+        self.assertEqual(list(arrays.call_set_ids), ["cs0", "cs1"])
+        self.assertEqual(
+            list(arrays.variant_ids),
+            ["variant{}".format(row) for row in range(6)])
+        self.assertEqual(list(arrays.starts), [0, 10, 20, 30, 40, 50])
+
+    def testConcatenateArrays(self):
+        blocks = []
+        for index, nvariants in enumerate([1, 3, 0, 5, 2]):
+            response = makeGenotypesResponse(nvariants, ["cs0", "cs1"])
+            arrays = genotypes.to_arrays(
+                response.genotypes, response.variants,
+                response.call_set_ids)
+            arrays.starts += 100 * index
+            blocks.append(arrays)
+        merged = genotypes.concatenate_arrays(iter(blocks))
+        self.assertEqual(merged.shape, (11, 2))
+        self.assertTrue(merged.genotypes.flags["C_CONTIGUOUS"])
+        for name in ["genotypes", "variant_ids", "reference_names",
+                     "starts", "ends"]:
+            self.assertEqual(
+                getattr(merged, name).tolist(),
+                numpy.concatenate(
+                    [getattr(block, name) for block in blocks]).tolist())
+        self.assertIs(genotypes.concatenate_arrays(blocks[:1]), blocks[0])
+
+
+class TestGenotypeArraysWithoutNumpy(unittest.TestCase):
+    """
+    Tests that a missing numpy is reported clearly
+    """
+    def testMissingNumpy(self):
+        response = makeGenotypesResponse(1, ["cs0"])
+        with mock.patch.dict("sys.modules", {"numpy": None}):
+            with self.assertRaises(
+                    exceptions.DependencyNotInstalledException):
+                genotypes.to_arrays(
+                    response.genotypes, response.variants,
+                    response.call_set_ids)
@@ -0,0 +1,144 @@
+"""
+Tests for the per-endpoint request metrics
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+import mock
+
+import candig.client.client as client
+import candig.client.exceptions as exceptions
+import candig.client.metrics as metrics
+
+import candig.schemas.protocol as protocol
+
+
+class TestMetricsRecorder(unittest.TestCase):
+    """
+    Tests aggregating and exporting metrics
+    """
+    def setUp(self):
+        self.recorder = metrics.MetricsRecorder(buckets=[0.1, 1.0])
+        self.recorder.record_request("variants/search", 10.0, 10.05, 10.5, 100)
+        self.recorder.record_decode("variants/search", 10.5, 10.6, 100)
+        self.recorder.record_page("variants/search", 3)
+        self.recorder.record_request("variants/search", 11.0, 12.0, 13.0, 50)
+        self.recorder.record_request(
+            "variants/{id}", 14.0, None, 15.0, 0, ValueError())
+
+    def testSnapshot(self):
+        snapshot = self.recorder.snapshot()
+        self.assertEqual(
+            list(snapshot.keys()), ["variants/search", "variants/{id}"])
+        search = snapshot["variants/search"]
+        self.assertEqual(search["requests"], 2)
+        self.assertEqual(search["errors"], 0)
+        self.assertEqual(search["pages"], 1)
+        self.assertEqual(search["results"], 3)
+        self.assertEqual(search["bytes"], 150)
+        self.assertEqual(search["time_to_first_byte"]["counts"], [1, 1, 0])
+        self.assertEqual(search["latency"]["counts"], [0, 1, 1])
+        self.assertAlmostEqual(search["latency"]["sum"], 2.5)
+        self.assertEqual(search["decode_time"]["count"], 1)
+        get = snapshot["variants/{id}"]
+        self.assertEqual(get["requests"], 1)
+        self.assertEqual(get["errors"], 1)
+        self.assertEqual(get["latency"]["count"], 0)
+        self.assertEqual(
+            json.loads(self.recorder.to_json()), json.loads(
+                json.dumps(snapshot)))
+
+    def testPrometheus(self):
+        lines = self.recorder.to_prometheus().splitlines()
+        self.assertIn("# TYPE candig_client_requests_total counter", lines)
+        self.assertIn(
+            'candig_client_requests_total{endpoint="variants/search"} 2',
+            lines)
+        self.assertIn(
+            'candig_client_request_errors_total{endpoint="variants/{id}"} 1',
+            lines)
+        self.assertIn(
+            "# TYPE candig_client_request_latency_seconds histogram", lines)
+        self.assertIn(
+            'candig_client_request_latency_seconds_bucket'
+            '{endpoint="variants/search",le="1.0"} 1', lines)
+        self.assertIn(
+            'candig_client_request_latency_seconds_bucket'
+            '{endpoint="variants/search",le="+Inf"} 2', lines)
+        self.assertIn(
+            'candig_client_request_latency_seconds_count'
+            '{endpoint="variants/search"} 2', lines)
+
+    def testLabelEscaping(self):
+        recorder = metrics.MetricsRecorder()
+        recorder.record_page('a"b\\c', 1)
+        self.assertIn(
+            'candig_client_pages_total{endpoint="a\\"b\\\\c"} 1',
+            recorder.to_prometheus().splitlines())
+
+
+class TestHttpClientMetrics(unittest.TestCase):
+    """
+    Tests that the HTTP client reports its requests to the metrics hook
+    """
+    def setUp(self):
+        self.httpClient = client.HttpClient("http://example.com")
+        self.recorder = metrics.MetricsRecorder()
+        self.httpClient.set_metrics(self.recorder)
+
+    def _makeResponse(self, message, statusCode=200):
+        response = mock.Mock()
+        response.status_code = statusCode
+        response.headers = {"Content-Type": "application/json"}
+        response.content = protocol.toJson(message).encode("utf-8")
+        return response
+
+    def testSearchPages(self):
+        pages = []
+        for index in range(2):
+            page = protocol.SearchVariantsResponse()
+            for _ in range(index + 2):
+                page.variants.add()
+            if index == 0:
+                page.next_page_token = "1"
+            pages.append(self._makeResponse(page))
+        self.httpClient._session.request = mock.Mock(side_effect=pages)
+        variants = list(self.httpClient.search_variants("variantSetId"))
+        self.assertEqual(len(variants), 5)
+        snapshot = self.recorder.snapshot()["variants/search"]
+        self.assertEqual(snapshot["requests"], 2)
+        self.assertEqual(snapshot["pages"], 2)
+        self.assertEqual(snapshot["results"], 5)
+        self.assertEqual(
+            snapshot["bytes"], sum(len(page.content) for page in pages))
+        self.assertEqual(snapshot["latency"]["count"], 2)
+        self.assertEqual(snapshot["decode_time"]["count"], 2)
+
+    def testGetRequests(self):
+        dataset = protocol.Dataset()
+        dataset.id = "datasetId"
+        self.httpClient._session.request = mock.Mock(side_effect=[
+            self._makeResponse(dataset),
+            self._makeResponse(dataset, statusCode=404)])
+        self.httpClient.get_dataset("datasetId")
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            self.httpClient.get_dataset("datasetId")
+        self.assertEqual(self.recorder.get_endpoints(), ["datasets/{id}"])
+        snapshot = self.recorder.snapshot()["datasets/{id}"]
+        self.assertEqual(snapshot["requests"], 2)
+        self.assertEqual(snapshot["errors"], 1)
+        self.assertEqual(snapshot["time_to_first_byte"]["count"], 1)
+
+    def testReferenceBases(self):
+        response = protocol.ListReferenceBasesResponse()
+        response.sequence = "ACGT"
+        self.httpClient._session.request = mock.Mock(
+            return_value=self._makeResponse(response))
+        self.httpClient.list_reference_bases("referenceId", 0, 4)
+        snapshot = self.recorder.snapshot()["listreferencebases"]
+        self.assertEqual(snapshot["pages"], 1)
+        self.assertEqual(snapshot["results"], 4)
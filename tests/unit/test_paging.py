@@ -0,0 +1,196 @@
+"""
+Tests for the paging helpers
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import time
+import unittest
+
+import candig.client.paging as paging
+
+import candig.schemas.protocol as protocol
+
+
+class TestBackgroundIterator(unittest.TestCase):
+    """
+    Tests the iterator that consumes another iterable in the background
+    """
+    def testYieldsAllItemsInOrder(self):
+        items = list(range(100))
+        iterator = paging.BackgroundIterator(iter(items), 3)
+        self.assertEqual(list(iterator), items)
+        with self.assertRaises(StopIteration):
+            next(iterator)
+
+    def testEmptyIterable(self):
+        self.assertEqual(list(paging.BackgroundIterator([], 2)), [])
+
+    def testExceptionIsRaisedAfterItems(self):
+        def generator():
+            yield 1
+            yield 2
+            raise ValueError("boom")
+        iterator = paging.BackgroundIterator(generator(), 1)
+        self.assertEqual(next(iterator), 1)
+        self.assertEqual(next(iterator), 2)
+        with self.assertRaises(ValueError):
+            next(iterator)
+
+    def testBufferIsBounded(self):
+        produced = []
+
+        def generator():
+            for item in range(10):
+                produced.append(item)
+                yield item
+        iterator = paging.BackgroundIterator(generator(), 2)
+        self.assertEqual(next(iterator), 0)
+        time.sleep(0.5)
+        # One item taken, two buffered and one blocked waiting for space
+        self.assertLessEqual(len(produced), 4)
+        iterator.close()
+
+    def testCloseStopsProducer(self):
+        def generator():
+            for item in range(1000):
+                yield item
+        iterator = paging.BackgroundIterator(generator(), 1)
+        next(iterator)
+        iterator.close()
+        iterator._thread.join(5)
+        self.assertFalse(iterator._thread.is_alive())
+        self.assertEqual(list(iterator), [])
+
+
+class TestRegionSharding(unittest.TestCase):
+    """
+    Tests splitting a region into shards and merging their results
+    """
+    def testSplitRegion(self):
+        self.assertEqual(
+            paging.split_region(0, 10, 3), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(paging.split_region(5, 7, 4), [(5, 6), (6, 7)])
+        self.assertEqual(paging.split_region(5, 105, 1), [(5, 105)])
+
+    def testSplitRegionCoversRegion(self):
+        for shards in range(1, 20):
+            regions = paging.split_region(17, 1017, shards)
+            self.assertEqual(len(regions), shards)
+            self.assertEqual(regions[0][0], 17)
+            self.assertEqual(regions[-1][1], 1017)
+            for (_, end), (start, _) in zip(regions, regions[1:]):
+                self.assertEqual(end, start)
+
+    def testMergeShardsSkipsBoundaryDuplicates(self):
+        shards = [(0, [-5, 2, 8]), (10, [8, 12, 18]), (20, [18, 25])]
+        self.assertEqual(
+            list(paging.merge_shards(shards, lambda start: start)),
+            [-5, 2, 8, 12, 18, 25])
+
+
+def makeDatasetPages(npages, pageLength):
+    pages = []
+    for page in range(npages):
+        response = protocol.SearchDatasetsResponse()
+        for index in range(pageLength):
+            response.datasets.add().id = "{}-{}".format(page, index)
+        pages.append(("token{}".format(page - 1) if page else "", response))
+    return pages
+
+
+class TestSearchIterator(unittest.TestCase):
+    """
+    Tests saving and restoring the position of a search
+    """
+    def setUp(self):
+        request = protocol.SearchDatasetsRequest()
+        request.page_size = 2
+        self.cursor = paging.SearchCursor(
+            "datasets", request, protocol.SearchDatasetsResponse)
+
+    def testCursorJsonRoundTrip(self):
+        self.cursor.protocol_request.page_token = "token"
+        self.cursor.offset = 3
+        cursor = paging.SearchCursor.from_json(self.cursor.to_json())
+        self.assertEqual(cursor.object_name, "datasets")
+        self.assertEqual(cursor.protocol_request, self.cursor.protocol_request)
+        self.assertIs(
+            cursor.protocol_response_class, protocol.SearchDatasetsResponse)
+        self.assertEqual(cursor.offset, 3)
+        self.assertFalse(cursor.done)
+
+    def testCursorTracksPosition(self):
+        iterator = paging.SearchIterator(
+            iter(makeDatasetPages(3, 2)), self.cursor)
+        self.assertEqual(iterator.get_cursor().offset, 0)
+        for _ in range(3):
+            next(iterator)
+        cursor = iterator.get_cursor()
+        self.assertEqual(cursor.protocol_request.page_token, "token0")
+        self.assertEqual(cursor.protocol_request.page_size, 2)
+        self.assertEqual(cursor.offset, 1)
+        self.assertEqual(
+            [dataset.id for dataset in iterator], ["1-1", "2-0", "2-1"])
+        self.assertTrue(iterator.get_cursor().done)
+
+    def testOffsetSkipsConsumedResults(self):
+        self.cursor.offset = 1
+        iterator = paging.SearchIterator(
+            iter(makeDatasetPages(2, 2)), self.cursor)
+        self.assertEqual(
+            [dataset.id for dataset in iterator], ["0-1", "1-0", "1-1"])
+
+    def testDoneCursor(self):
+        self.cursor.done = True
+        iterator = paging.SearchIterator(iter(()), self.cursor)
+        self.assertEqual(list(iterator), [])
+
+
+class TestPageSizeController(unittest.TestCase):
+    """
+    Tests adapting the page size of each endpoint to the cost of its pages
+    """
+    def testCheapPagesGrow(self):
+        controller = paging.PageSizeController(
+            initial_page_size=100, max_page_size=1000, target_latency=1)
+        pageSizes = []
+        for _ in range(5):
+            pageSize = controller.get_page_size("datasets")
+            pageSizes.append(pageSize)
+            controller.record_page(
+                "datasets", pageSize, pageSize, 0.001 * pageSize, 0, True)
+        self.assertEqual(pageSizes, [100, 200, 400, 800, 1000])
+        self.assertEqual(controller.get_page_size("reads"), 100)
+
+    def testExpensivePagesShrink(self):
+        controller = paging.PageSizeController(
+            initial_page_size=100, min_page_size=10, target_latency=1)
+        controller.record_page("reads", 100, 100, 4, 0, True)
+        self.assertEqual(controller.get_page_size("reads"), 50)
+        controller.record_page("reads", 50, 50, 1.25, 0, True)
+        self.assertEqual(controller.get_page_size("reads"), 40)
+        for _ in range(5):
+            pageSize = controller.get_page_size("reads")
+            controller.record_page("reads", pageSize, pageSize, 100, 0, True)
+        self.assertEqual(controller.get_page_size("reads"), 10)
+
+    def testTargetBytes(self):
+        controller = paging.PageSizeController(
+            initial_page_size=100, target_latency=None, target_bytes=1000)
+        controller.record_page("reads", 100, 100, 10, 2000, True)
+        self.assertEqual(controller.get_page_size("reads"), 50)
+
+    def testServerMaximum(self):
+        controller = paging.PageSizeController(
+            initial_page_size=100, target_latency=1)
+        controller.record_page("variants", 100, 60, 0.01, 0, True)
+        self.assertEqual(controller.get_page_size("variants"), 60)
+
+    def testFinalPageIsIgnored(self):
+        controller = paging.PageSizeController(
+            initial_page_size=100, target_latency=1)
+        controller.record_page("variants", 100, 3, 10, 0, False)
+        controller.record_page("variants", 100, 0, 10, 0, True)
+        self.assertEqual(controller.get_page_size("variants"), 100)
@@ -0,0 +1,223 @@
+"""
+Tests for retrying failed requests
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import email.utils
+import gzip
+import io
+import json
+import unittest
+
+import mock
+import requests
+
+import candig.client.client as client
+import candig.client.exceptions as exceptions
+import candig.client.retry as retry
+
+import candig.schemas.protocol as protocol
+
+
+class TestRetryPolicy(unittest.TestCase):
+    """
+    Tests the delays given by retry policies
+    """
+    def testExponentialBackoff(self):
+        policy = retry.RetryPolicy(
+            backoff_factor=0.5, max_backoff=3, jitter=False)
+        self.assertEqual(
+            [policy.get_backoff(number) for number in range(5)],
+            [0.5, 1, 2, 3, 3])
+
+    def testJitter(self):
+        policy = retry.RetryPolicy(backoff_factor=1, max_backoff=100)
+        for number in range(5):
+            for _ in range(20):
+                backoff = policy.get_backoff(number)
+                self.assertGreaterEqual(backoff, 0)
+                self.assertLessEqual(backoff, 2 ** number)
+
+    def testRetryAfter(self):
+        policy = retry.RetryPolicy(jitter=False, max_retry_after=60)
+        response = mock.Mock()
+        response.headers = {"Retry-After": "7"}
+        self.assertEqual(policy.get_delay(0, response), 7)
+        response.headers = {"Retry-After": "600"}
+        self.assertEqual(policy.get_delay(0, response), 60)
+        response.headers = {}
+        self.assertEqual(policy.get_delay(0, response), 0.5)
+        self.assertEqual(policy.get_delay(1, None), 1)
+
+    def testParseRetryAfter(self):
+        self.assertEqual(retry.parse_retry_after("3"), 3)
+        self.assertEqual(retry.parse_retry_after("-3"), 0)
+        self.assertIsNone(retry.parse_retry_after(None))
+        self.assertIsNone(retry.parse_retry_after("soon"))
+        with mock.patch("time.time", return_value=1000000):
+            date = email.utils.formatdate(1000030, usegmt=True)
+            self.assertEqual(retry.parse_retry_after(date), 30)
+
+    def testRetryBudget(self):
+        budget = retry.RetryBudget(ratio=0.5, min_retries=1)
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+        for _ in range(4):
+            budget.record_request()
+        self.assertTrue(budget.try_spend())
+        self.assertTrue(budget.try_spend())
+        self.assertFalse(budget.try_spend())
+
+
+class TestHttpClientRetries(unittest.TestCase):
+    """
+    Tests that the HTTP client retries requests according to its policies
+    """
+    def setUp(self):
+        self.httpClient = client.HttpClient(
+            "http://example.com",
+            retry_policies=retry.default_policies(max_retries=2))
+        self.responses = []
+        self.requests = []
+        self.httpClient._session.request = self._request
+        patcher = mock.patch("time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _request(self, method, url, params=None, data=None, **kwargs):
+        self.requests.append((method, url, data))
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def _makeResponse(self, statusCode, protocolObject=None, headers=None):
+        response = mock.Mock()
+        response.status_code = statusCode
+        response.headers = {"Content-Type": "application/json"}
+        response.headers.update(headers or {})
+        if protocolObject is not None:
+            response.content = protocol.toJson(protocolObject).encode(
+                "utf-8")
+        return response
+
+    def _makeDataset(self):
+        dataset = protocol.Dataset()
+        dataset.id = "datasetId"
+        return dataset
+
+    def testGetIsRetried(self):
+        self.responses = [
+            self._makeResponse(503),
+            requests.exceptions.ConnectionError(),
+            self._makeResponse(200, self._makeDataset())]
+        dataset = self.httpClient.get_dataset("datasetId")
+        self.assertEqual(dataset.id, "datasetId")
+        self.assertEqual(len(self.requests), 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    def testRetryAfterIsHonoured(self):
+        self.responses = [
+            self._makeResponse(429, headers={"Retry-After": "4"}),
+            self._makeResponse(200, self._makeDataset())]
+        self.httpClient.get_dataset("datasetId")
+        self.sleep.assert_called_once_with(4)
+
+    def testRetriesAreLimited(self):
+        self.responses = [self._makeResponse(502) for _ in range(3)]
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            self.httpClient.get_dataset("datasetId")
+        self.assertEqual(len(self.requests), 3)
+
+    def testConnectionErrorIsRaisedWhenRetriesRunOut(self):
+        self.responses = [
+            requests.exceptions.ConnectionError() for _ in range(3)]
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            self.httpClient.get_dataset("datasetId")
+
+    def testClientErrorsAreNotRetried(self):
+        self.responses = [self._makeResponse(404)]
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            self.httpClient.get_dataset("datasetId")
+        self.assertEqual(len(self.requests), 1)
+
+    def testPostIsNotRetried(self):
+        self.responses = [self._makeResponse(503)]
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            self.httpClient.announce("http://peer.example.com")
+        self.assertEqual(len(self.requests), 1)
+
+    def testSearchPageIsRetriedFromItsToken(self):
+        pages = []
+        for index in range(3):
+            page = protocol.SearchDatasetsResponse()
+            page.datasets.add().id = "dataset{}".format(index)
+            if index < 2:
+                page.next_page_token = "token{}".format(index)
+            pages.append(page)
+        self.responses = [
+            self._makeResponse(200, pages[0]),
+            self._makeResponse(502),
+            self._makeResponse(200, pages[1]),
+            self._makeResponse(200, pages[2])]
+        datasets = list(self.httpClient.search_datasets())
+        self.assertEqual(
+            [dataset.id for dataset in datasets],
+            ["dataset0", "dataset1", "dataset2"])
+        self.assertEqual(
+            [json.loads(data).get("pageToken", "")
+             for _, _, data in self.requests],
+            ["", "token0", "token0", "token1"])
+
+    def testResetWhileReadingIsRetried(self):
+        response = self._makeResponse(200)
+        type(response).content = mock.PropertyMock(
+            side_effect=requests.exceptions.ChunkedEncodingError())
+        self.responses = [
+            response, self._makeResponse(200, self._makeDataset())]
+        dataset = self.httpClient.get_dataset("datasetId")
+        self.assertEqual(dataset.id, "datasetId")
+        self.assertEqual(len(self.requests), 2)
+        response.close.assert_called_once_with()
+
+    def testCorruptBodyIsRetried(self):
+        body = io.BytesIO()
+        with gzip.GzipFile(fileobj=body, mode="wb") as gzipFile:
+            gzipFile.write(protocol.toJson(self._makeDataset()).encode(
+                "utf-8"))
+        corrupt = body.getvalue()[:10] + b"\x00" * 20
+        responses = []
+        for data in [corrupt, body.getvalue()]:
+            response = self._makeResponse(
+                200, headers={"Content-Encoding": "gzip"})
+            response.raw.stream.return_value = iter([data])
+            responses.append(response)
+        self.responses = responses
+        dataset = self.httpClient.get_dataset("datasetId")
+        self.assertEqual(dataset.id, "datasetId")
+        self.assertEqual(len(self.requests), 2)
+
+    def testReadErrorIsRaisedWhenRetriesRunOut(self):
+        self.responses = []
+        for _ in range(3):
+            response = self._makeResponse(200)
+            type(response).content = mock.PropertyMock(
+                side_effect=requests.exceptions.ChunkedEncodingError())
+            self.responses.append(response)
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            self.httpClient.get_dataset("datasetId")
+        self.assertEqual(len(self.requests), 3)
+
+    def testRetryBudgetIsShared(self):
+        self.httpClient._retry_budget = retry.RetryBudget(
+            ratio=0, min_retries=1)
+        self.responses = [
+            self._makeResponse(503),
+            self._makeResponse(200, self._makeDataset()),
+            self._makeResponse(503)]
+        self.httpClient.get_dataset("datasetId")
+        with self.assertRaises(exceptions.RequestNonSuccessException):
+            self.httpClient.get_dataset("datasetId")
+        self.assertEqual(len(self.requests), 3)
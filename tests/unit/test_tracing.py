@@ -0,0 +1,117 @@
+"""
+Tests for the Chrome trace timeline and the CLI profiling options
+"""
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import candig.client.cli as cli
+import candig.client.tracing as tracing
+
+import benchmarks.server as server
+import benchmarks.synthetic as synthetic
+
+import tests.unit.test_cli as test_cli
+
+
+class TestTracer(unittest.TestCase):
+    """
+    Tests the events recorded by the tracer
+    """
+    def testEvents(self):
+        tracer = tracing.Tracer()
+        start = tracer._start_time
+        tracer.record_request(
+            "reads/search", start + 1, start + 1.5, start + 2, 100)
+        tracer.record_decode("reads/search", start + 2, start + 2.25, 100)
+        tracer.record_page("reads/search", 10)
+        tracer.record_write(start + 3, start + 3.5, 20)
+        trace = json.loads(tracer.to_json())
+        events = trace["traceEvents"]
+        self.assertEqual(
+            [event["ph"] for event in events], ["M", "X", "X", "i", "X"])
+        self.assertEqual(
+            [event.get("cat") for event in events],
+            [None, "http", "decode", "page", "output"])
+        request = events[1]
+        self.assertEqual(request["name"], "reads/search")
+        self.assertAlmostEqual(request["ts"], 1e6)
+        self.assertAlmostEqual(request["dur"], 1e6)
+        self.assertAlmostEqual(request["args"]["time_to_first_byte"], 0.5)
+        self.assertEqual(events[2]["args"], {"bytes": 100})
+        self.assertEqual(events[3]["args"], {"results": 10})
+        self.assertEqual(events[4]["args"], {"characters": 20})
+        self.assertEqual(
+            set(event["tid"] for event in events), set([events[0]["tid"]]))
+
+    def testOutputWriter(self):
+        tracer = tracing.Tracer()
+        writer = cli.OutputWriter(test_cli.FakeStream(), bufferSize=10)
+        writer.setTracer(tracer)
+        writer.writeLines(["abcdef", "ghi"])
+        writer.flush()
+        events = [
+            event for event in tracer.get_events() if event["ph"] == "X"]
+        self.assertEqual(
+            [event["args"]["characters"] for event in events], [11])
+
+
+class TestProfileOptions(unittest.TestCase):
+    """
+    Tests the --profile and --trace options of the CLI
+    """
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.tracePath = os.path.join(self.tempdir, "trace.json")
+        self.profilePath = os.path.join(self.tempdir, "out.prof")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testTraceAndProfile(self):
+        backend = synthetic.SyntheticBackend(num_records=25, page_size=10)
+        stream = test_cli.FakeStream()
+        with server.FakeServer(backend) as fakeServer:
+            with mock.patch('sys.stdout', stream):
+                cli.client_main([
+                    "--trace", self.tracePath, "--profile", self.profilePath,
+                    "features-search", fakeServer.get_url(),
+                    "--featureSetId", "featureSet"])
+        self.assertEqual(len(stream.getvalue().splitlines()), 25)
+        with open(self.tracePath) as traceFile:
+            events = json.load(traceFile)["traceEvents"]
+        categories = [event.get("cat") for event in events]
+        self.assertEqual(categories.count("http"), 3)
+        self.assertEqual(categories.count("decode"), 3)
+        self.assertEqual(categories.count("page"), 3)
+        self.assertGreaterEqual(categories.count("output"), 1)
+        self.assertTrue(all(
+            event["name"] == "features/search" for event in events
+            if event.get("cat") == "http"))
+        stats = pstats.Stats(self.profilePath)
+        self.assertTrue(any(
+            function[2] == "run" for function in stats.stats))
+
+    def testTraceWrittenOnFailure(self):
+        stream = test_cli.FakeStream()
+        with server.FakeServer(synthetic.SyntheticBackend()) as fakeServer:
+            with mock.patch('sys.stdout', stream):
+                with self.assertRaises(Exception):
+                    cli.client_main([
+                        "--max-retries", "0", "--trace", self.tracePath,
+                        "variantsets-search", fakeServer.get_url()])
+        with open(self.tracePath) as traceFile:
+            events = json.load(traceFile)["traceEvents"]
+        requests = [
+            event for event in events if event.get("cat") == "http"]
+        self.assertEqual(len(requests), 1)
+        self.assertIn("error", requests[0]["args"])